@@ -0,0 +1,88 @@
+import atexit
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityTracker:
+    """Write-behind buffer for per-user activity timestamps.
+
+    Login and last-seen times are kept in memory (latest value per user) and
+    handed to flush(changes) in one batch every `interval` seconds, so hot
+    paths never open a write transaction for them. Pending changes are also
+    flushed when the buffer reaches max_pending users and at interpreter exit.
+    """
+
+    def __init__(self, flush, interval=5.0, max_pending=10000):
+        self._flush = flush
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.flushes = 0
+        self.rows_flushed = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='activity-tracker', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+        return self
+
+    def _record(self, user_id, fields):
+        with self._lock:
+            entry = self._pending.setdefault(user_id, {})
+            for field, when in fields.items():
+                if entry.get(field) is None or when > entry[field]:
+                    entry[field] = when
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self._wake.set()
+
+    def record_login(self, user_id, when=None):
+        when = when or datetime.utcnow()
+        self._record(user_id, {'last_login': when, 'last_seen': when})
+
+    def record_seen(self, user_id, when=None):
+        self._record(user_id, {'last_seen': when or datetime.utcnow()})
+
+    def pending(self, user_id):
+        """Buffered timestamps not yet written for a user"""
+        with self._lock:
+            return dict(self._pending.get(user_id, {}))
+
+    def flush(self):
+        """Write everything buffered so far; returns the number of users updated"""
+        with self._lock:
+            changes, self._pending = self._pending, {}
+        if not changes:
+            return 0
+        try:
+            self._flush(changes)
+        except Exception as e:
+            logger.error(f"Activity flush failed, retrying later: {str(e)}")
+            # Put the batch back without overwriting anything newer
+            for user_id, fields in changes.items():
+                self._record(user_id, fields)
+            return 0
+        self.flushes += 1
+        self.rows_flushed += len(changes)
+        return len(changes)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def stop(self):
+        if self._thread is not None and not self._stopped.is_set():
+            self._stopped.set()
+            self._wake.set()
+            self._thread.join(timeout=self.interval + 5)
+        self.flush()
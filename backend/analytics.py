@@ -0,0 +1,388 @@
+import atexit
+import logging
+import math
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import and_, event, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Finest first: (name, seconds)
+RESOLUTIONS = (('minute', 60), ('hour', 3600), ('day', 86400))
+COUNTERS = ('scans', 'critical_scans', 'feedback', 'corrections', 'logins')
+# Derived from two counters summed over each point
+RATES = {'critical_rate': ('critical_scans', 'scans'), 'correction_rate': ('corrections', 'feedback')}
+ACTIVE_USERS = 'active_users'
+METRICS = COUNTERS + tuple(RATES) + (ACTIVE_USERS,)
+# Distinct users are tracked per hour and day only; a row per user per minute buys nothing
+MEMBER_RESOLUTIONS = ('hour', 'day')
+# Unique keys of the bucket and member tables, targeted by the upserts
+BUCKET_KEY = ('metric', 'resolution', 'bucket_start')
+MEMBER_KEY = ('resolution', 'bucket_start', 'user_id')
+# A bucket row outside every real metric and resolution, claimed by the one process that backfills
+BACKFILL_MARKER = {'metric': 'backfill', 'resolution': 'claim', 'bucket_start': datetime(1970, 1, 1)}
+
+
+def parse_time(value):
+    """ISO timestamp as naive UTC; offsets (and a trailing Z) are converted"""
+    at = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return at.astimezone(timezone.utc).replace(tzinfo=None) if at.tzinfo else at
+
+
+def _within(transaction, ancestor):
+    while transaction is not None:
+        if transaction is ancestor:
+            return True
+        transaction = transaction.parent
+    return False
+
+
+def _conflict_insert(session, table):
+    """An INSERT supporting ON CONFLICT on this session's database, or None if it has none"""
+    dialect = session.connection().dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(table)
+    if dialect == 'sqlite':
+        return sqlite.insert(table)
+    return None
+
+
+def bucket_start(at, seconds):
+    return datetime.utcfromtimestamp(math.floor((at - datetime(1970, 1, 1)).total_seconds() / seconds) * seconds)
+
+
+class Analytics:
+    """Platform-wide counters rolled up into minute, hour and day buckets.
+
+    Events are counted in memory and written every flush_interval seconds,
+    each one added to its minute, hour and day bucket at once. Buckets are
+    kept as long as their resolution's retention, so recent ranges are
+    served per minute and older ones from the coarser buckets that remain.
+    Active users are counted exactly per hour and day from a membership
+    table rather than summed.
+    """
+
+    def __init__(self, app, db, bucket_model, member_model, run_write, flush_interval=10.0,
+                 retention=None, sweep_interval=600.0):
+        self.app = app
+        self.db = db
+        self.bucket_model = bucket_model
+        self.member_model = member_model
+        self.run_write = run_write
+        self.flush_interval = flush_interval
+        # Seconds each resolution is kept; None keeps it forever
+        self.retention = retention or {'minute': 2 * 86400, 'hour': 90 * 86400, 'day': None}
+        self.sweep_interval = sweep_interval
+        self._counts = Counter()
+        self._members = set()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._next_sweep = 0.0
+        self._history = None
+        self.flushes = 0
+        # Everything from here on is counted live, so a backfill replays only older events
+        self.started_at = datetime.utcnow()
+
+    def record(self, metric, count=1, at=None):
+        at = at or datetime.utcnow()
+        with self._lock:
+            self._counts[(metric, bucket_start(at, 60))] += count
+
+    def record_active(self, user_id, at=None):
+        at = at or datetime.utcnow()
+        hour = bucket_start(at, 3600)
+        with self._lock:
+            self._members.add(('hour', hour, user_id))
+            self._members.add(('day', bucket_start(at, 86400), user_id))
+
+    def watch(self, scan_model, feedback_model, is_critical):
+        """Count scans and feedback the ORM inserts, once their transaction commits.
+
+        Inserts are collected at flush together with the transaction (or
+        savepoint) they were flushed in, and dropped if it rolls back, so
+        failed writes are never counted.
+        """
+        def after_flush(session, flush_context):
+            metrics = []
+            for obj in session.new:
+                if isinstance(obj, scan_model):
+                    metrics.append('scans')
+                    if is_critical(obj.analysis_details):
+                        metrics.append('critical_scans')
+                elif isinstance(obj, feedback_model):
+                    metrics.append('feedback')
+                    if obj.feedback_type == 'correction':
+                        metrics.append('corrections')
+            if metrics:
+                transaction = session.get_nested_transaction() or session.get_transaction()
+                session.info.setdefault('analytics_pending', []).append((transaction, metrics))
+
+        def after_soft_rollback(session, previous_transaction):
+            pending = session.info.get('analytics_pending')
+            if pending:
+                session.info['analytics_pending'] = [
+                    (transaction, metrics) for transaction, metrics in pending
+                    if not _within(transaction, previous_transaction)
+                ]
+
+        def after_commit(session):
+            for _, metrics in session.info.pop('analytics_pending', ()):
+                for metric in metrics:
+                    self.record(metric)
+
+        def after_transaction_end(session, transaction):
+            if transaction.parent is None:
+                # Ended without a commit (e.g. closed); nothing left is counted
+                session.info.pop('analytics_pending', None)
+
+        event.listen(Session, 'after_flush', after_flush)
+        event.listen(Session, 'after_soft_rollback', after_soft_rollback)
+        event.listen(Session, 'after_commit', after_commit)
+        event.listen(Session, 'after_transaction_end', after_transaction_end)
+        return self
+
+    def start(self, history=None):
+        """history() yields (metric, at) for events from before analytics existed;
+        they are loaded once, in the background, by whichever process claims it first"""
+        self._history = history
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='analytics', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self.flush()
+
+    def _run(self):
+        if self._history is not None:
+            try:
+                self.backfill(self._history)
+            except Exception as e:
+                logger.error(f"Analytics backfill failed: {str(e)}")
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+            if datetime.utcnow().timestamp() >= self._next_sweep:
+                self._next_sweep = datetime.utcnow().timestamp() + self.sweep_interval
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.error(f"Analytics retention sweep failed: {str(e)}")
+
+    def flush(self):
+        counts, members = self.take()
+        if not counts and not members:
+            return
+
+        try:
+            with self.app.app_context():
+                self.run_write(lambda session: self.write(session, counts, members))
+            self.flushes += 1
+        except Exception as e:
+            logger.error(f"Analytics flush failed, retrying later: {str(e)}")
+            self.restore(counts, members)
+
+    def take(self):
+        """Remove and return the (counts, members) counted since the last flush"""
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            members, self._members = self._members, set()
+        return counts, members
+
+    def restore(self, counts, members):
+        """Put back what take() returned after a failed write, for the next flush"""
+        with self._lock:
+            self._counts.update(counts)
+            self._members |= members
+
+    def write(self, session, counts, members):
+        """Add what take() returned to the buckets in the caller's transaction"""
+        rows = Counter()
+        for (metric, minute), count in counts.items():
+            for name, seconds in RESOLUTIONS:
+                rows[(metric, name, bucket_start(minute, seconds))] += count
+        self._add_counts(session, rows)
+        self._add_members(session, members)
+
+    def backfill(self, history):
+        """Replay past events once across all processes.
+
+        The first process to insert the backfill marker row does the replay,
+        in the same transaction. Only events older than this process's start
+        and, per resolution, older than the earliest bucket already written
+        are added, so nothing another process counted live is counted twice.
+        """
+        table = self.bucket_model.__table__
+        with self.app.app_context():
+            # Cheap early exit; the marker insert below is what decides
+            if self.db.session.query(self.bucket_model.id).filter_by(**BACKFILL_MARKER).first() is not None:
+                return 0
+        now = datetime.utcnow()
+        rows = Counter()
+        events = 0
+        for metric, at in history():
+            if at >= self.started_at:
+                continue
+            events += 1
+            for name, seconds in RESOLUTIONS:
+                retention = self.retention.get(name)
+                if retention is None or at >= now - timedelta(seconds=retention):
+                    rows[(metric, name, bucket_start(at, seconds))] += 1
+
+        def work(session):
+            if not self._claim_backfill(session, events):
+                return None
+            earliest = dict(session.execute(
+                select(table.c.resolution, func.min(table.c.bucket_start))
+                .where(table.c.resolution.in_([name for name, _ in RESOLUTIONS]))
+                .group_by(table.c.resolution)
+            ).all())
+            replay = Counter({key: count for key, count in rows.items()
+                              if earliest.get(key[1]) is None or key[2] < earliest[key[1]]})
+            self._add_counts(session, replay)
+            return replay
+
+        with self.app.app_context():
+            replayed = self.run_write(work)
+        if replayed is None:
+            return 0
+        logger.info(f"Analytics backfilled {events} past events into {len(replayed)} buckets")
+        return events
+
+    def _claim_backfill(self, session, events):
+        table = self.bucket_model.__table__
+        statement = _conflict_insert(session, table)
+        if statement is not None:
+            return session.execute(statement.values(value=events, **BACKFILL_MARKER)
+                                   .on_conflict_do_nothing(index_elements=BUCKET_KEY)).rowcount == 1
+        try:
+            with session.begin_nested():
+                session.execute(insert(table).values(value=events, **BACKFILL_MARKER))
+            return True
+        except IntegrityError:
+            return False
+
+    def _add_counts(self, session, rows):
+        if not rows:
+            return
+        table = self.bucket_model.__table__
+        statement = _conflict_insert(session, table)
+        if statement is not None:
+            # Atomic add-or-create, so workers flushing the same new bucket can't both insert it
+            session.execute(
+                statement.on_conflict_do_update(index_elements=BUCKET_KEY,
+                                                set_={'value': table.c.value + statement.excluded.value}),
+                [{'metric': metric, 'resolution': resolution, 'bucket_start': start, 'value': count}
+                 for (metric, resolution, start), count in rows.items()]
+            )
+            return
+        for (metric, resolution, start), count in rows.items():
+            match = and_(table.c.metric == metric, table.c.resolution == resolution, table.c.bucket_start == start)
+            if not session.execute(update(table).where(match).values(value=table.c.value + count)).rowcount:
+                session.execute(insert(table).values(metric=metric, resolution=resolution, bucket_start=start, value=count))
+
+    def _add_members(self, session, members):
+        if not members:
+            return
+        table = self.member_model.__table__
+        new = [{'resolution': resolution, 'bucket_start': start, 'user_id': user_id}
+               for resolution, start, user_id in members]
+        statement = _conflict_insert(session, table)
+        if statement is not None:
+            session.execute(statement.on_conflict_do_nothing(index_elements=MEMBER_KEY), new)
+            return
+        starts = {start for _, start, _ in members}
+        existing = set(session.execute(
+            table.select().with_only_columns(table.c.resolution, table.c.bucket_start, table.c.user_id)
+            .where(table.c.bucket_start.in_(starts))
+        ).all())
+        new = [row for row in new if (row['resolution'], row['bucket_start'], row['user_id']) not in existing]
+        if new:
+            session.execute(insert(table), new)
+
+    def sweep(self):
+        """Drop buckets older than their resolution's retention"""
+        now = datetime.utcnow()
+        deleted = 0
+        for name, _ in RESOLUTIONS:
+            if self.retention.get(name) is None:
+                continue
+            cutoff = now - timedelta(seconds=self.retention[name])
+            for model in (self.bucket_model, self.member_model):
+                if name == 'minute' and model is self.member_model:
+                    continue
+
+                def work(session, model=model, name=name, cutoff=cutoff):
+                    return session.query(model).filter(model.resolution == name, model.bucket_start < cutoff) \
+                        .delete(synchronize_session=False)
+
+                with self.app.app_context():
+                    deleted += self.run_write(work)
+        if deleted:
+            logger.info(f"Analytics retention sweep removed {deleted} buckets")
+        return deleted
+
+    def resolution_for(self, start, step, floor=None):
+        """Coarsest resolution no wider than step that is still retained at start"""
+        now = datetime.utcnow()
+        names = [name for name, _ in RESOLUTIONS]
+        candidates = [(name, seconds) for name, seconds in RESOLUTIONS
+                      if floor is None or names.index(name) >= names.index(floor)]
+        retained = [(name, seconds) for name, seconds in candidates
+                    if self.retention.get(name) is None or start >= now - timedelta(seconds=self.retention[name])]
+        if not retained:
+            return candidates[-1]
+        fitting = [(name, seconds) for name, seconds in retained if seconds <= step]
+        return fitting[-1] if fitting else retained[0]
+
+    def series(self, metrics, start, end, points):
+        """Exactly `points` values per metric covering [start, end), each point spanning an equal step"""
+        step = (end - start).total_seconds() / points
+        if step <= 0:
+            raise ValueError('to must be after from')
+
+        def index(at):
+            return min(int((at - start).total_seconds() // step), points - 1)
+
+        counters = set(m for m in metrics if m in COUNTERS)
+        for metric in metrics:
+            counters.update(RATES.get(metric, ()))
+        sums = {metric: [0] * points for metric in counters}
+        resolutions = {}
+
+        if counters:
+            name, seconds = self.resolution_for(start, step)
+            model = self.bucket_model
+            # Buckets are assigned by their start, so include one that began before `start`
+            first = bucket_start(start, seconds)
+            for row in model.query.filter(model.resolution == name, model.metric.in_(counters),
+                                          model.bucket_start >= first, model.bucket_start < end):
+                sums[row.metric][index(max(row.bucket_start, start))] += row.value
+            resolutions.update({metric: name for metric in metrics if metric != ACTIVE_USERS})
+
+        result = {}
+        for metric in metrics:
+            if metric in COUNTERS:
+                result[metric] = sums[metric]
+            elif metric in RATES:
+                numerator, denominator = RATES[metric]
+                result[metric] = [round(n / d, 4) if d else None for n, d in zip(sums[numerator], sums[denominator])]
+
+        if ACTIVE_USERS in metrics:
+            name, seconds = self.resolution_for(start, step, floor=MEMBER_RESOLUTIONS[0])
+            model = self.member_model
+            users = [set() for _ in range(points)]
+            for row in model.query.filter(model.resolution == name, model.bucket_start >= bucket_start(start, seconds),
+                                          model.bucket_start < end):
+                users[index(max(row.bucket_start, start))].add(row.user_id)
+            result[ACTIVE_USERS] = [len(u) for u in users]
+            resolutions[ACTIVE_USERS] = name
+
+        timestamps = [(start + timedelta(seconds=step * i)).isoformat() for i in range(points)]
+        return timestamps, step, result, resolutions
@@ -0,0 +1,924 @@
+#!/usr/bin/env python3
+"""
+Asyncio-native ECG Scanner Backend (ASGI)
+Serves the same API surface as app_production.py on an event loop so that
+slow I/O (SMTP, database round-trips, large exports) does not pin a worker.
+
+Run with:
+    uvicorn app_async:app --host 0.0.0.0 --port 5001
+"""
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+from sqlalchemy import Boolean, Column, Date, DateTime, Float, ForeignKey, Index, Integer, String, Text, func, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base
+from email.mime.text import MIMEText
+from datetime import datetime, timedelta
+import aiosmtplib
+import asyncio
+import jwt
+import os
+import uuid
+import secrets
+import logging
+from functools import wraps
+from contextlib import asynccontextmanager
+import json
+from dotenv import load_dotenv
+from production_config import engine_options
+from password_hashing import HashingUnavailable, PasswordHasher
+from schema_upgrade import upgrade_schema
+from change_feed import ChangeFeed
+from scan_stats import ScanRollups, is_critical
+from analytics import Analytics
+from rate_limiter import RateLimiter
+
+# Load environment variables
+load_dotenv()
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s %(levelname)s %(name)s %(message)s',
+    handlers=[
+        logging.FileHandler('ecg_app.log'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Configuration (same environment variables as app_production.py)
+SECRET_KEY = os.environ.get('SECRET_KEY', secrets.token_urlsafe(32))
+JWT_EXPIRATION_DELTA = timedelta(days=int(os.environ.get('JWT_EXPIRATION_DELTA', 30)))
+
+MAIL_SERVER = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
+MAIL_PORT = int(os.environ.get('MAIL_PORT', 587))
+MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', 'true').lower() == 'true'
+MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
+MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER', 'noreply@ecgscanner.com')
+
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 200))
+ANALYTICS_FLUSH_INTERVAL = float(os.environ.get('ANALYTICS_FLUSH_INTERVAL', 10))
+# Wrong codes (via verify-reset or finalize-reset) after which an active reset code is revoked
+RESET_CODE_MAX_ATTEMPTS = int(os.environ.get('RESET_CODE_MAX_ATTEMPTS', 5))
+
+password_hasher = PasswordHasher(
+    method=os.environ.get('PASSWORD_HASH_METHOD', 'scrypt'),
+    workers=int(os.environ.get('PASSWORD_HASH_WORKERS', 0)) or None,
+    max_pending=int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 0)) or None,
+    timeout=float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+)
+
+# Auth throttling with the same rules and RATE_LIMIT_STORE as app_production.py, so both servers
+# pointed at one store share the limits
+rate_limiter = RateLimiter.from_config({
+    'RATE_LIMIT_ENABLED': os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true',
+    'RATE_LIMIT_STORE': os.environ.get('RATE_LIMIT_STORE'),
+    'RATE_LIMIT_TRUST_PROXY': os.environ.get('RATE_LIMIT_TRUST_PROXY', 'false').lower() == 'true',
+})
+rate_limiter.add_rule('login', per_ip=os.environ.get('RATE_LIMIT_LOGIN_IP', '20/60'),
+                      per_account=os.environ.get('RATE_LIMIT_LOGIN_ACCOUNT', '10/300'))
+rate_limiter.add_rule('request-reset', per_ip=os.environ.get('RATE_LIMIT_RESET_IP', '5/300'),
+                      per_account=os.environ.get('RATE_LIMIT_RESET_ACCOUNT', '3/900'))
+rate_limiter.add_rule('verify-reset', per_ip=os.environ.get('RATE_LIMIT_VERIFY_IP', '20/300'),
+                      per_account=os.environ.get('RATE_LIMIT_VERIFY_ACCOUNT', '10/900'))
+
+CORS_ORIGINS = [
+    "http://localhost:5173",
+    "http://127.0.0.1:5173",
+    "http://localhost:3000",
+    "http://127.0.0.1:3000",
+    "http://0.0.0.0:5173",
+    "http://0.0.0.0:3000",
+]
+
+
+def async_database_url(url):
+    """Translate a sync DATABASE_URL into its asyncio driver equivalent.
+
+    Relative SQLite paths resolve into instance/ the same way Flask-SQLAlchemy
+    does, so both servers can share one database file.
+    """
+    if url.startswith('postgres://'):
+        url = url.replace('postgres://', 'postgresql://', 1)
+    if url.startswith('postgresql://'):
+        return url.replace('postgresql://', 'postgresql+asyncpg://', 1)
+    if url.startswith('sqlite:///'):
+        path = url[len('sqlite:///'):]
+        if path and path != ':memory:' and not os.path.isabs(path):
+            instance_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
+            os.makedirs(instance_path, exist_ok=True)
+            path = os.path.join(instance_path, path)
+        return f'sqlite+aiosqlite:///{path}'
+    return url
+
+
+DATABASE_URL = async_database_url(os.environ.get('DATABASE_URL', 'sqlite:///ecg_app.db'))
+
+engine = create_async_engine(DATABASE_URL, **engine_options(DATABASE_URL, driver='asyncpg'))
+Session = async_sessionmaker(engine, expire_on_commit=False)
+Base = declarative_base()
+
+# Models (same tables as app_production.py)
+class User(Base):
+    __tablename__ = 'user'
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    email = Column(String(120), unique=True, nullable=False, index=True)
+    password_hash = Column(String(255), nullable=False)
+    name = Column(String(100), nullable=False)
+    role = Column(String(20), default='user')
+    created_at = Column(DateTime, default=datetime.utcnow)
+    is_active = Column(Boolean, default=True)
+    last_login = Column(DateTime)
+    last_seen = Column(DateTime)
+    deleted_at = Column(DateTime, index=True)
+    sync_version = Column(Integer, default=0)
+    sync_reset_version = Column(Integer, default=0)
+    scan_stats_ready = Column(Boolean, default=True)
+
+class Scan(Base):
+    __tablename__ = 'scan'
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(String(36), ForeignKey('user.id'), nullable=False, index=True)
+    patient_name = Column(String(100), nullable=False)
+    patient_age = Column(Integer)
+    patient_gender = Column(String(10))
+    file_name = Column(String(255))
+    file_url = Column(String(500))
+    prediction = Column(String(100))
+    confidence = Column(Float)
+    analysis_details = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    version = Column(Integer)
+
+    __table_args__ = (
+        Index('ix_scan_user_version', 'user_id', 'version'),
+    )
+
+class ScanTombstone(Base):
+    __tablename__ = 'scan_tombstone'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(String(36), nullable=False)
+    record_id = Column(String(36), nullable=False)
+    version = Column(Integer)
+    deleted_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('ix_scan_tombstone_user_version', 'user_id', 'version'),
+    )
+
+class ScanDailyStat(Base):
+    __tablename__ = 'scan_daily_stat'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(String(36), nullable=False)
+    day = Column(Date, nullable=False)
+    diagnosis = Column(String(100), nullable=False)
+    is_critical = Column(Boolean, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('ix_scan_daily_stat_key', 'user_id', 'day', 'diagnosis', 'is_critical', unique=True),
+    )
+
+class PasswordReset(Base):
+    __tablename__ = 'password_reset'
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(String(36), ForeignKey('user.id'), nullable=False, index=True)
+    email = Column(String(120), nullable=False, index=True)
+    reset_code = Column(String(6), nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    used = Column(Boolean, default=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # Wrong codes entered for this email while the code was active; it is revoked at RESET_CODE_MAX_ATTEMPTS
+    failed_attempts = Column(Integer, default=0)
+
+    __table_args__ = (
+        # verify/finalize match email, code and used exactly and range-scan expires_at;
+        # the email prefix also serves request-reset's active-code check
+        Index('ix_password_reset_lookup', 'email', 'reset_code', 'used', 'expires_at'),
+        Index('ix_password_reset_expires_at', 'expires_at'),
+    )
+
+class AIModelFeedback(Base):
+    __tablename__ = 'ai_model_feedback'
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    scan_id = Column(String(36), ForeignKey('scan.id'), nullable=False)
+    original_prediction = Column(String(100), nullable=False)
+    corrected_prediction = Column(String(100), nullable=False)
+    confidence_change = Column(Float)
+    feedback_type = Column(String(20), nullable=False)  # 'correction', 'confirmation'
+    user_id = Column(String(36), ForeignKey('user.id'), nullable=False)
+    notes = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class AnalyticsBucket(Base):
+    __tablename__ = 'analytics_bucket'
+    id = Column(Integer, primary_key=True)
+    metric = Column(String(40), nullable=False)
+    resolution = Column(String(10), nullable=False)
+    bucket_start = Column(DateTime, nullable=False)
+    value = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('ix_analytics_bucket_key', 'metric', 'resolution', 'bucket_start', unique=True),
+        Index('ix_analytics_bucket_resolution_start', 'resolution', 'bucket_start'),
+    )
+
+class AnalyticsActiveUser(Base):
+    __tablename__ = 'analytics_active_user'
+    id = Column(Integer, primary_key=True)
+    resolution = Column(String(10), nullable=False)
+    bucket_start = Column(DateTime, nullable=False)
+    user_id = Column(String(36), nullable=False)
+
+    __table_args__ = (
+        Index('ix_analytics_active_user_key', 'resolution', 'bucket_start', 'user_id', unique=True),
+    )
+
+# Scan writes go through the same session hooks as app_production.py: the change feed versions
+# them for device sync and the rollups keep /api/scans/stats current. Both listen on every
+# Session, including the one inside AsyncSession. Only the flush hook of the feed is used here,
+# so it needs no Flask db or run_write.
+scan_feed = ChangeFeed(None, User, Scan, ScanTombstone, None).install()
+scan_rollups = ScanRollups(User, Scan, ScanDailyStat).install()
+# Counted in memory like app_production's workers, and written by flush_analytics()
+analytics = Analytics(None, None, AnalyticsBucket, AnalyticsActiveUser, None).watch(Scan, AIModelFeedback, is_critical)
+
+# JWT Token decorator
+def token_required(f):
+    @wraps(f)
+    async def decorated(request):
+        token = request.headers.get('Authorization')
+
+        if not token:
+            return JSONResponse({'success': False, 'message': 'Token is missing!'}, 401)
+
+        try:
+            token = token.split(' ')[1]  # Remove 'Bearer ' prefix
+            data = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+            async with Session() as session:
+                current_user = await session.get(User, data['user_id'])
+            if not current_user or current_user.deleted_at is not None:
+                return JSONResponse({'success': False, 'message': 'User not found!'}, 401)
+            analytics.record_active(current_user.id)
+        except jwt.ExpiredSignatureError:
+            return JSONResponse({'success': False, 'message': 'Token has expired!'}, 401)
+        except Exception as e:
+            logger.error(f"Token validation error: {str(e)}")
+            return JSONResponse({'success': False, 'message': 'Token is invalid!'}, 401)
+
+        return await f(request, current_user)
+
+    return decorated
+
+def client_ip(request):
+    if rate_limiter.trust_proxy and request.headers.get('X-Forwarded-For'):
+        return request.headers['X-Forwarded-For'].split(',')[0].strip()
+    return request.client.host if request.client else 'unknown'
+
+def rate_limited(name, account_field='email'):
+    """Reject over-limit requests with 429 before the endpoint runs, like RateLimiter.limit"""
+    def decorator(f):
+        @wraps(f)
+        async def decorated(request):
+            data = await read_json(request)
+            account = data.get(account_field) if isinstance(data, dict) else None
+            ip = client_ip(request)
+            # The SQLite store can wait on its file lock, so it is kept off the event loop
+            retry_after = await asyncio.to_thread(
+                rate_limiter.check, name, account if isinstance(account, str) else None, ip
+            )
+            if retry_after is not None:
+                rate_limiter.rejected += 1
+                logger.warning(f"Rate limit '{name}' exceeded from {ip}")
+                return JSONResponse({'success': False, 'message': 'Too many attempts. Please try again later.'},
+                                    429, headers={'Retry-After': str(retry_after)})
+            return await f(request)
+
+        return decorated
+
+    return decorator
+
+# Helper functions
+async def read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return {}
+
+def user_to_dict(user):
+    return {
+        'id': user.id,
+        'email': user.email,
+        'name': user.name,
+        'role': user.role
+    }
+
+def scan_to_dict(scan):
+    return {
+        'id': scan.id,
+        'patient_name': scan.patient_name,
+        'patient_age': scan.patient_age,
+        'patient_gender': scan.patient_gender,
+        'file_name': scan.file_name,
+        'file_url': scan.file_url,
+        'prediction': scan.prediction,
+        'confidence': scan.confidence,
+        'analysis_details': json.loads(scan.analysis_details) if scan.analysis_details else None,
+        'created_at': scan.created_at.isoformat(),
+        'updated_at': scan.updated_at.isoformat()
+    }
+
+def issue_token(user):
+    return jwt.encode({
+        'user_id': user.id,
+        'exp': datetime.utcnow() + JWT_EXPIRATION_DELTA
+    }, SECRET_KEY, algorithm='HS256')
+
+def mask_email(email):
+    """Mask email for security display"""
+    if '@' not in email:
+        return email
+    username, domain = email.split('@')
+    masked_username = username[:2] + '*' * (len(username) - 3) + username[-1] if len(username) > 3 else '*' * len(username)
+    return f"{masked_username}@{domain}"
+
+def generate_reset_code():
+    """Generate secure 6-digit reset code"""
+    return str(secrets.randbelow(900000) + 100000)
+
+async def _await_hashing(future):
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), password_hasher.timeout)
+    except asyncio.TimeoutError:
+        raise HashingUnavailable('Password hashing timed out')
+
+async def hash_password(password):
+    """Hash on the bounded hashing pool; the work factor is deliberately CPU-expensive"""
+    return await _await_hashing(password_hasher.submit_hash(password))
+
+async def verify_password(password_hash, password):
+    return await _await_hashing(password_hasher.submit_verify(password_hash, password))
+
+async def hashing_unavailable(request, exc):
+    logger.error(f"Password hashing unavailable: {str(exc)}")
+    return JSONResponse({'success': False, 'message': 'Server is busy, please try again shortly'}, 503,
+                        headers={'Retry-After': '1'})
+
+async def send_reset_email(email, reset_code, user_name):
+    """Send password reset email without blocking the event loop"""
+    try:
+        body = f"""
+        <html>
+        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
+            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
+                <h2 style="color: #2c3e50;">Password Reset Request</h2>
+                <p>Hello {user_name},</p>
+                <p>We received a request to reset your password for your ECG Scanner account.</p>
+                <div style="background-color: #f8f9fa; padding: 20px; border-radius: 5px; margin: 20px 0;">
+                    <h3 style="margin-top: 0;">Your Reset Code:</h3>
+                    <div style="font-size: 24px; font-weight: bold; color: #007bff; letter-spacing: 2px;">
+                        {reset_code}
+                    </div>
+                </div>
+                <p>This code will expire in 15 minutes for security reasons.</p>
+                <p>If you didn't request this reset, please ignore this email.</p>
+                <hr style="border: none; border-top: 1px solid #eee; margin: 20px 0;">
+                <p style="font-size: 12px; color: #666;">
+                    This is an automated message from ECG Scanner App. Please do not reply to this email.
+                </p>
+            </div>
+        </body>
+        </html>
+        """
+
+        msg = MIMEText(body, 'html')
+        msg['Subject'] = "Password Reset - ECG Scanner App"
+        msg['From'] = MAIL_DEFAULT_SENDER
+        msg['To'] = email
+
+        await aiosmtplib.send(
+            msg,
+            hostname=MAIL_SERVER,
+            port=MAIL_PORT,
+            start_tls=MAIL_USE_TLS,
+            username=MAIL_USERNAME,
+            password=MAIL_PASSWORD,
+            timeout=30
+        )
+        logger.info(f"Password reset email sent to {email}")
+        return True
+
+    except Exception as e:
+        logger.error(f"Failed to send reset email: {str(e)}")
+        return False
+
+def active_reset_query(email, code=None):
+    query = select(PasswordReset).where(
+        PasswordReset.email == email.lower(),
+        PasswordReset.used == False,  # noqa: E712
+        PasswordReset.expires_at > datetime.utcnow()
+    )
+    if code is not None:
+        query = query.where(PasswordReset.reset_code == code)
+    return query.limit(1)
+
+async def record_failed_reset(email):
+    """Count a wrong code against the email's active reset codes, revoking them after too many"""
+    active = (
+        PasswordReset.email == email.lower(),
+        PasswordReset.used == False,  # noqa: E712
+        PasswordReset.expires_at > datetime.utcnow()
+    )
+    try:
+        async with Session() as session:
+            await session.execute(
+                update(PasswordReset).where(*active)
+                .values(failed_attempts=func.coalesce(PasswordReset.failed_attempts, 0) + 1)
+            )
+            revoked = await session.execute(
+                update(PasswordReset)
+                .where(*active, PasswordReset.failed_attempts >= RESET_CODE_MAX_ATTEMPTS)
+                .values(used=True)
+            )
+            await session.commit()
+        if revoked.rowcount:
+            logger.warning(f"Reset code for {email} revoked after too many wrong attempts")
+    except Exception as e:
+        logger.error(f"Recording failed reset attempt error: {str(e)}")
+
+# Authentication endpoints
+async def signup(request):
+    data = await read_json(request)
+
+    name = data.get('name')
+    email = data.get('email')
+    password = data.get('password')
+
+    if not all([name, email, password]):
+        return JSONResponse({'success': False, 'message': 'Missing required fields'}, 400)
+
+    # Validate email format
+    if '@' not in email or '.' not in email.split('@')[1]:
+        return JSONResponse({'success': False, 'message': 'Invalid email format'}, 400)
+
+    async with Session() as session:
+        # Check if user already exists
+        existing = await session.scalar(select(User.id).where(User.email == email.lower()))
+        if existing:
+            return JSONResponse({'success': False, 'message': 'User already exists'}, 400)
+
+        new_user = User(
+            email=email.lower(),
+            name=name,
+            password_hash=await hash_password(password),
+            role='user'
+        )
+
+        try:
+            session.add(new_user)
+            await session.commit()
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"Signup error: {str(e)}")
+            return JSONResponse({'success': False, 'message': 'Failed to create user'}, 500)
+
+    logger.info(f"New user registered: {email}")
+    return JSONResponse({
+        'success': True,
+        'user': user_to_dict(new_user),
+        'token': issue_token(new_user)
+    }, 201)
+
+@rate_limited('login')
+async def login(request):
+    data = await read_json(request)
+
+    email = data.get('email')
+    password = data.get('password')
+
+    if not all([email, password]):
+        return JSONResponse({'success': False, 'message': 'Missing email or password'}, 400)
+
+    async with Session() as session:
+        user = await session.scalar(select(User).where(User.email == email.lower(), User.deleted_at.is_(None)))
+
+        if not user or not await verify_password(user.password_hash, password):
+            return JSONResponse({'success': False, 'message': 'Invalid email or password'}, 401)
+
+        # Update last login, upgrading the stored hash if the work factor changed
+        user.last_login = datetime.utcnow()
+        if password_hasher.needs_rehash(user.password_hash):
+            try:
+                user.password_hash = await hash_password(password)
+            except HashingUnavailable:
+                pass  # Upgrade on a later login
+        await session.commit()
+    analytics.record('logins')
+    analytics.record_active(user.id)
+
+    logger.info(f"User logged in: {email}")
+    return JSONResponse({
+        'success': True,
+        'user': user_to_dict(user),
+        'token': issue_token(user)
+    }, 200)
+
+# Password Reset Endpoints
+@rate_limited('request-reset')
+async def request_password_reset(request):
+    """Request password reset - sends email with reset code"""
+    data = await read_json(request)
+    email = data.get('email')
+
+    if not email:
+        return JSONResponse({'success': False, 'message': 'Email is required'}, 400)
+
+    async with Session() as session:
+        user = await session.scalar(select(User).where(User.email == email.lower(), User.deleted_at.is_(None)))
+        if not user:
+            # Don't reveal if user exists or not
+            return JSONResponse({'success': True, 'message': 'If the email exists, a reset code has been sent'}, 200)
+
+        if await session.scalar(active_reset_query(email)):
+            return JSONResponse({
+                'success': True,
+                'message': 'Reset code already sent',
+                'data': {
+                    'maskedEmail': mask_email(email),
+                    'userName': user.name
+                }
+            }, 200)
+
+        reset_code = generate_reset_code()
+        password_reset = PasswordReset(
+            user_id=user.id,
+            email=email.lower(),
+            reset_code=reset_code,
+            expires_at=datetime.utcnow() + timedelta(minutes=15)
+        )
+
+        try:
+            session.add(password_reset)
+            await session.commit()
+
+            # Send email
+            if await send_reset_email(email, reset_code, user.name):
+                return JSONResponse({
+                    'success': True,
+                    'message': 'Reset code sent successfully',
+                    'data': {
+                        'maskedEmail': mask_email(email),
+                        'userName': user.name
+                    }
+                }, 200)
+
+            await session.delete(password_reset)
+            await session.commit()
+            return JSONResponse({'success': False, 'message': 'Failed to send reset email'}, 500)
+
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"Password reset request error: {str(e)}")
+            return JSONResponse({'success': False, 'message': 'Failed to process reset request'}, 500)
+
+@rate_limited('verify-reset')
+async def verify_reset_code(request):
+    """Verify password reset code"""
+    data = await read_json(request)
+    email = data.get('email')
+    code = data.get('code')
+
+    if not all([email, code]):
+        return JSONResponse({'success': False, 'message': 'Email and code are required'}, 400)
+
+    async with Session() as session:
+        reset_entry = await session.scalar(active_reset_query(email, code))
+
+    if not reset_entry:
+        await record_failed_reset(email)
+        return JSONResponse({'success': False, 'message': 'Invalid or expired reset code'}, 400)
+
+    return JSONResponse({'success': True, 'message': 'Reset code verified successfully'}, 200)
+
+# Shares verify-reset's counters: both endpoints accept the code, so guesses are limited across the two
+@rate_limited('verify-reset')
+async def finalize_password_reset(request):
+    """Complete password reset with new password"""
+    data = await read_json(request)
+    email = data.get('email')
+    new_password = data.get('newPassword')
+    code = data.get('code')
+
+    if not all([email, new_password, code]):
+        return JSONResponse({'success': False, 'message': 'All fields are required'}, 400)
+
+    # Validate password strength
+    if len(new_password) < 6:
+        return JSONResponse({'success': False, 'message': 'Password must be at least 6 characters'}, 400)
+
+    async with Session() as session:
+        reset_entry = await session.scalar(active_reset_query(email, code))
+        if not reset_entry:
+            await record_failed_reset(email)
+            return JSONResponse({'success': False, 'message': 'Invalid or expired reset code'}, 400)
+
+        user = await session.scalar(select(User).where(User.email == email.lower(), User.deleted_at.is_(None)))
+        if not user:
+            return JSONResponse({'success': False, 'message': 'User not found'}, 404)
+
+        new_password_hash = await hash_password(new_password)
+
+        try:
+            user.password_hash = new_password_hash
+            reset_entry.used = True
+
+            # Clean up old reset codes for this user
+            await session.execute(
+                update(PasswordReset)
+                .where(PasswordReset.email == email.lower(), PasswordReset.used == False)  # noqa: E712
+                .values(used=True)
+            )
+            await session.commit()
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"Password reset finalization error: {str(e)}")
+            return JSONResponse({'success': False, 'message': 'Failed to reset password'}, 500)
+
+    logger.info(f"Password reset completed for {email}")
+    return JSONResponse({'success': True, 'message': 'Password reset successfully'}, 200)
+
+# Scan endpoints
+@token_required
+async def get_user_scans(request, current_user):
+    try:
+        async with Session() as session:
+            scans = await session.scalars(
+                select(Scan).where(Scan.user_id == current_user.id).order_by(Scan.created_at.desc())
+            )
+            scan_list = [scan_to_dict(scan) for scan in scans]
+
+        return JSONResponse({'success': True, 'scans': scan_list}, 200)
+    except Exception as e:
+        logger.error(f"Get scans error: {str(e)}")
+        return JSONResponse({'success': False, 'message': str(e)}, 500)
+
+@token_required
+async def create_scan(request, current_user):
+    data = await read_json(request)
+
+    async with Session() as session:
+        try:
+            new_scan = Scan(
+                user_id=current_user.id,
+                patient_name=data.get('patient_name'),
+                patient_age=data.get('patient_age'),
+                patient_gender=data.get('patient_gender'),
+                file_name=data.get('file_name'),
+                file_url=data.get('file_url'),
+                prediction=data.get('prediction'),
+                confidence=data.get('confidence'),
+                analysis_details=json.dumps(data.get('analysis_details', {}))
+            )
+
+            session.add(new_scan)
+            await session.commit()
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"Create scan error: {str(e)}")
+            return JSONResponse({'success': False, 'message': str(e)}, 500)
+
+    logger.info(f"New scan created by user {current_user.email}")
+    return JSONResponse({'success': True, 'scan': scan_to_dict(new_scan)}, 201)
+
+@token_required
+async def delete_scan(request, current_user):
+    scan_id = request.path_params['scan_id']
+
+    async with Session() as session:
+        try:
+            scan = await session.scalar(
+                select(Scan).where(Scan.id == scan_id, Scan.user_id == current_user.id)
+            )
+            if not scan:
+                return JSONResponse({'success': False, 'message': 'Scan not found'}, 404)
+
+            await session.delete(scan)
+            await session.commit()
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"Delete scan error: {str(e)}")
+            return JSONResponse({'success': False, 'message': str(e)}, 500)
+
+    logger.info(f"Scan deleted by user {current_user.email}")
+    return JSONResponse({'success': True, 'message': 'Scan deleted successfully'}, 200)
+
+@token_required
+async def submit_ai_feedback(request, current_user):
+    """Submit feedback for AI model learning"""
+    scan_id = request.path_params['scan_id']
+    data = await read_json(request)
+
+    corrected_prediction = data.get('corrected_prediction')
+    notes = data.get('notes', '')
+    feedback_type = data.get('feedback_type', 'correction')
+
+    if not corrected_prediction:
+        return JSONResponse({'success': False, 'message': 'Corrected prediction is required'}, 400)
+
+    async with Session() as session:
+        try:
+            scan = await session.get(Scan, scan_id)
+            if not scan:
+                return JSONResponse({'success': False, 'message': 'Scan not found'}, 404)
+
+            # Calculate confidence change
+            original_confidence = scan.confidence or 0.0
+            new_confidence = data.get('new_confidence', original_confidence)
+
+            feedback = AIModelFeedback(
+                scan_id=scan_id,
+                original_prediction=scan.prediction,
+                corrected_prediction=corrected_prediction,
+                confidence_change=new_confidence - original_confidence,
+                feedback_type=feedback_type,
+                user_id=current_user.id,
+                notes=notes
+            )
+
+            # Update scan with corrected data
+            scan.prediction = corrected_prediction
+            scan.confidence = new_confidence
+            if 'analysis_details' in data:
+                scan.analysis_details = json.dumps(data['analysis_details'])
+
+            session.add(feedback)
+            await session.commit()
+
+            logger.info(f"AI feedback submitted by {current_user.email} for scan {scan_id}")
+
+            # Calculate learning metrics
+            total_feedback = await session.scalar(select(func.count(AIModelFeedback.id)))
+            correction_rate = await session.scalar(
+                select(func.count(AIModelFeedback.id)).where(AIModelFeedback.feedback_type == 'correction')
+            )
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"AI feedback submission error: {str(e)}")
+            return JSONResponse({'success': False, 'message': str(e)}, 500)
+
+    return JSONResponse({
+        'success': True,
+        'message': 'Feedback submitted successfully',
+        'data': {
+            'total_feedback': total_feedback,
+            'correction_rate': correction_rate,
+            'scan_updated': True
+        }
+    }, 200)
+
+# Streaming exports
+@token_required
+async def get_backup_data(request, current_user):
+    """Stream a full backup (Admin only) without materialising it in memory"""
+    if current_user.role != 'admin':
+        return JSONResponse({'success': False, 'message': 'Admin access required'}, 403)
+
+    async def generate():
+        async with Session() as session:
+            yield '{"success": true, "backup": {"users": ['
+            users = await session.stream_scalars(
+                select(User)
+                .where(User.email != current_user.email, User.deleted_at.is_(None))
+                .order_by(User.email)
+                .execution_options(yield_per=EXPORT_BATCH_SIZE)
+            )
+            first = True
+            async for user in users:
+                yield ('' if first else ',') + json.dumps({
+                    'email': user.email,
+                    'name': user.name,
+                    'role': user.role,
+                    'created_at': user.created_at.isoformat()
+                })
+                first = False
+
+            yield '], "histories": {'
+            rows = await session.stream(
+                select(User.email, Scan)
+                .join(Scan, Scan.user_id == User.id)
+                .where(User.email != current_user.email, User.deleted_at.is_(None))
+                .order_by(User.email, Scan.created_at)
+                .execution_options(yield_per=EXPORT_BATCH_SIZE)
+            )
+            current_email = None
+            async for email, scan in rows:
+                if email != current_email:
+                    prefix = '' if current_email is None else '],'
+                    yield f'{prefix}{json.dumps(email)}: ['
+                    current_email = email
+                    first = True
+                yield ('' if first else ',') + json.dumps(scan_to_dict(scan))
+                first = False
+            if current_email is not None:
+                yield ']'
+            yield '}}}'
+
+    logger.info(f"Backup export streamed to admin {current_user.email}")
+    return StreamingResponse(generate(), media_type='application/json')
+
+# Health check endpoint
+async def health_check(request):
+    return JSONResponse({
+        'status': 'healthy',
+        'timestamp': datetime.utcnow().isoformat(),
+        'version': '1.0.0'
+    }, 200)
+
+async def init_database():
+    """Create tables and the default admin user, as app_production.py does"""
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(upgrade_schema, Base.metadata)
+
+        async with Session() as session:
+            if not await session.scalar(select(User.id).limit(1)):
+                admin_email = os.environ.get('ADMIN_EMAIL', 'admin@ecgscanner.com')
+                admin_password = os.environ.get('ADMIN_PASSWORD', 'admin123')
+
+                session.add(User(
+                    email=admin_email,
+                    name='Administrator',
+                    password_hash=await hash_password(admin_password),
+                    role='admin'
+                ))
+                await session.commit()
+                logger.info(f"Default admin user created: {admin_email}")
+    except Exception as e:
+        logger.error(f"Database initialization error: {str(e)}")
+
+async def write_analytics():
+    counts, members = analytics.take()
+    if not counts and not members:
+        return
+    try:
+        async with Session() as session:
+            await session.run_sync(analytics.write, counts, members)
+            await session.commit()
+    except Exception as e:
+        logger.error(f"Analytics flush failed, retrying later: {str(e)}")
+        analytics.restore(counts, members)
+
+async def flush_analytics():
+    """Write the analytics counted in this process every ANALYTICS_FLUSH_INTERVAL seconds"""
+    while True:
+        await asyncio.sleep(ANALYTICS_FLUSH_INTERVAL)
+        await write_analytics()
+
+@asynccontextmanager
+async def lifespan(app):
+    await init_database()
+    flusher = asyncio.create_task(flush_analytics())
+    yield
+    flusher.cancel()
+    await write_analytics()
+    await engine.dispose()
+
+routes = [
+    Route('/api/signup', signup, methods=['POST']),
+    Route('/api/login', login, methods=['POST']),
+    Route('/api/request-reset', request_password_reset, methods=['POST']),
+    Route('/api/verify-reset', verify_reset_code, methods=['POST']),
+    Route('/api/finalize-reset', finalize_password_reset, methods=['POST']),
+    Route('/api/scans', get_user_scans, methods=['GET']),
+    Route('/api/scans', create_scan, methods=['POST']),
+    Route('/api/scans/{scan_id}', delete_scan, methods=['DELETE']),
+    Route('/api/scans/{scan_id}/feedback', submit_ai_feedback, methods=['POST']),
+    Route('/api/admin/backup', get_backup_data, methods=['GET']),
+    Route('/api/health', health_check, methods=['GET']),
+]
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=CORS_ORIGINS, allow_credentials=True,
+                   allow_methods=['*'], allow_headers=['*'])
+    ],
+    exception_handlers={HashingUnavailable: hashing_unavailable},
+    lifespan=lifespan
+)
+
+if __name__ == '__main__':
+    import uvicorn
+
+    port = int(os.environ.get('PORT', 5001))
+    host = os.environ.get('HOST', '0.0.0.0')
+
+    logger.info(f"Starting async ECG Scanner Backend on {host}:{port}")
+    uvicorn.run(app, host=host, port=port, log_level='info')
@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -8,10 +8,16 @@ import os
 import uuid
 from functools import wraps
 import json
+import mimetypes
 import random
+import re
+from werkzeug.utils import safe_join
+from ttl_store import ttl_store_from_url
 
 # Serve frontend from dist folder
-app = Flask(__name__, static_folder='../dist', static_url_path='')
+# No built-in static route: it would shadow serve_frontend's SPA fallback and caching below
+app = Flask(__name__, static_folder=None)
+FRONTEND_DIST = os.path.join(app.root_path, '..', 'dist')
 
 CORS(app, origins="*", supports_credentials=True)
 
@@ -345,28 +351,61 @@ def after_request(response):
     # Flask-CORS handles headers
     return response
 
-# Serve React/Vite frontend for all non-API routes
+# Serve React/Vite frontend for all non-API routes.
+# Vite's content-hashed bundles (assets/<name>-<hash>.<ext>) never change, so browsers may
+# cache them for good; index.html names the current bundles and is revalidated by ETag on
+# every load. Precompressed .br/.gz files next to an asset are sent when the client accepts them.
+HASHED_ASSET = re.compile(r'^assets/.+-[A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$')
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+
+def send_static(path):
+    file_path = safe_join(FRONTEND_DIST, path)
+    is_index = path == 'index.html'
+    immutable = bool(HASHED_ASSET.match(path))
+    
+    encoding = None
+    for coding, suffix in PRECOMPRESSED:
+        variant = file_path + suffix
+        # A variant older than its source is left over from a previous build
+        if request.accept_encodings[coding] > 0 and os.path.isfile(variant) \
+                and os.path.getmtime(variant) >= os.path.getmtime(file_path):
+            encoding, file_path = coding, variant
+            break
+    
+    # send_file hands the open file to the server's wsgi.file_wrapper (sendfile under gunicorn)
+    response = send_file(file_path, mimetype=mimetypes.guess_type(path)[0], etag=is_index,
+                         max_age=None if is_index else 31536000 if immutable else 3600)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    if is_index:
+        response.cache_control.no_cache = True
+    else:
+        response.cache_control.public = True
+        response.cache_control.immutable = immutable
+    return response
+
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve_frontend(path):
     # Serve static files from dist folder
-    file_path = os.path.join(app.static_folder, path)
-    if path != "" and os.path.exists(file_path):
-        # Set cache headers to avoid stale 304 issues
-        response = send_from_directory(app.static_folder, path)
-        response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-        response.headers["Pragma"] = "no-cache"
-        response.headers["Expires"] = "0"
-        return response
+    file_path = safe_join(FRONTEND_DIST, path) if path else None
+    if file_path and os.path.isfile(file_path):
+        return send_static(path)
+    if path.startswith('assets/'):
+        # A bundle from an older build; the HTML fallback would only fail to parse as JS/CSS
+        return jsonify({'success': False, 'message': 'Not found'}), 404
     # Serve index.html for SPA routing
-    response = send_from_directory(app.static_folder, 'index.html')
-    response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-    response.headers["Pragma"] = "no-cache"
-    response.headers["Expires"] = "0"
-    return response
+    return send_static('index.html')
 
-# In-memory store for reset codes (for demo purposes)
-reset_codes = {}
+# Reset codes expire after RESET_CODE_TTL seconds. The default store is a SQLite
+# file in instance/ so every worker process sees the same codes; set
+# RESET_CODE_STORE=memory for a single-process setup.
+RESET_CODE_TTL = int(os.environ.get('RESET_CODE_TTL', 900))
+reset_codes = ttl_store_from_url(
+    os.environ.get('RESET_CODE_STORE', 'sqlite:///' + os.path.join(app.instance_path, 'reset_codes.db')),
+    max_size=int(os.environ.get('RESET_CODE_MAX_ENTRIES', 10000))
+).start()
 
 def generate_reset_code():
     return str(random.randint(100000, 999999))
@@ -379,7 +418,7 @@ def request_password_reset():
     if not user:
         return jsonify({'success': False, 'message': 'User not found'}), 404
     code = generate_reset_code()
-    reset_codes[email.lower()] = code
+    reset_codes.set(email.lower(), code, RESET_CODE_TTL)
     # In production, send code via email. Here, return it in response.
     masked_email = email[:2] + '***' + email[email.find('@'):]
     return jsonify({
@@ -412,10 +451,10 @@ def finalize_password_reset():
     user = User.query.filter_by(email=email.lower()).first()
     if not user:
         return jsonify({'success': False, 'message': 'User not found'}), 404
-    if expected_code and code == expected_code:
+    # pop() consumes the code atomically, so it cannot be used twice across workers
+    if expected_code and code == expected_code and reset_codes.pop(email.lower()) == code:
         user.password_hash = generate_password_hash(new_password)
         db.session.commit()
-        reset_codes.pop(email.lower(), None)
         return jsonify({'success': True, 'message': 'Password reset successful.'}), 200
     return jsonify({'success': False, 'message': 'Invalid code.'}), 400
 
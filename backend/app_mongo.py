@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+ECG Scanner Backend on MongoDB
+Serves auth, scans, AI feedback and user administration through the
+StorageRepository interface, backed by MongoRepository
+"""
+
+from flask import Flask, request, jsonify
+from flask_cors import CORS
+from datetime import datetime
+import jwt
+import os
+import logging
+from functools import wraps
+from dotenv import load_dotenv
+from mongo_config import MongoConfig
+from mongo_repository import MongoRepository
+from password_hashing import PasswordHasher
+
+# Load environment variables
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s %(message)s')
+logger = logging.getLogger(__name__)
+
+app = Flask(__name__)
+app.config.from_object(MongoConfig)
+CORS(app, origins=[
+    'http://localhost:5173',
+    'http://127.0.0.1:5173',
+    'http://localhost:3000',
+    'http://127.0.0.1:3000',
+    'http://192.168.1.18:3000',
+    'http://192.168.1.18:5173'
+], supports_credentials=True)
+
+password_hasher = PasswordHasher.from_config(app.config)
+# Handlers only use the StorageRepository methods, so another backend can be swapped in here
+repository = MongoRepository.from_config(MongoConfig)
+
+# JWT Token decorator
+def token_required(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = request.headers.get('Authorization')
+
+        if not token:
+            return jsonify({'success': False, 'message': 'Token is missing!'}), 401
+
+        try:
+            token = token.split(' ')[1]  # Remove 'Bearer ' prefix
+            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+            current_user = repository.get_user(data['user_id'])
+            if not current_user or not current_user.get('is_active', True):
+                return jsonify({'success': False, 'message': 'User not found!'}), 401
+        except jwt.ExpiredSignatureError:
+            return jsonify({'success': False, 'message': 'Token has expired!'}), 401
+        except Exception as e:
+            logger.error(f"Token validation error: {str(e)}")
+            return jsonify({'success': False, 'message': 'Token is invalid!'}), 401
+
+        return f(current_user, *args, **kwargs)
+
+    return decorated
+
+# Helper functions
+def isoformat(value):
+    return value.isoformat() if value else None
+
+def user_to_dict(user):
+    return {'id': user['id'], 'email': user['email'], 'name': user['name'], 'role': user['role']}
+
+def scan_to_dict(scan):
+    return {
+        'id': scan['id'],
+        'patient_name': scan.get('patient_name'),
+        'patient_age': scan.get('patient_age'),
+        'patient_gender': scan.get('patient_gender'),
+        'file_name': scan.get('file_name'),
+        'file_url': scan.get('file_url'),
+        'prediction': scan.get('prediction'),
+        'confidence': scan.get('confidence'),
+        'analysis_details': scan.get('analysis_details') or None,
+        'created_at': isoformat(scan.get('created_at')),
+        'updated_at': isoformat(scan.get('updated_at'))
+    }
+
+def issue_token(user):
+    return jwt.encode({
+        'user_id': user['id'],
+        'exp': datetime.utcnow() + app.config['JWT_EXPIRATION_DELTA']
+    }, app.config['SECRET_KEY'], algorithm='HS256')
+
+# Authentication endpoints
+@app.route('/api/signup', methods=['POST'])
+def signup():
+    data = request.get_json()
+
+    name = data.get('name')
+    email = data.get('email')
+    password = data.get('password')
+
+    if not all([name, email, password]):
+        return jsonify({'success': False, 'message': 'Missing required fields'}), 400
+
+    # Validate email format
+    if '@' not in email or '.' not in email.split('@')[1]:
+        return jsonify({'success': False, 'message': 'Invalid email format'}), 400
+
+    # Check if user already exists
+    if repository.get_user_by_email(email):
+        return jsonify({'success': False, 'message': 'User already exists'}), 400
+
+    try:
+        new_user = repository.create_user(email, name, password_hasher.hash(password))
+
+        logger.info(f"New user registered: {email}")
+        return jsonify({'success': True, 'user': user_to_dict(new_user), 'token': issue_token(new_user)}), 201
+    except Exception as e:
+        logger.error(f"Signup error: {str(e)}")
+        return jsonify({'success': False, 'message': 'Failed to create user'}), 500
+
+@app.route('/api/login', methods=['POST'])
+def login():
+    data = request.get_json()
+
+    email = data.get('email')
+    password = data.get('password')
+
+    if not all([email, password]):
+        return jsonify({'success': False, 'message': 'Missing email or password'}), 400
+
+    user = repository.get_user_by_email(email)
+
+    if not user or not user.get('is_active', True) or not password_hasher.verify(user['password_hash'], password):
+        return jsonify({'success': False, 'message': 'Invalid email or password'}), 401
+
+    user_updates = {'last_login': datetime.utcnow()}
+    if password_hasher.needs_rehash(user['password_hash']):
+        user_updates['password_hash'] = password_hasher.hash(password)
+    repository.update_user(user['id'], **user_updates)
+
+    logger.info(f"User logged in: {email}")
+    return jsonify({'success': True, 'user': user_to_dict(user), 'token': issue_token(user)}), 200
+
+# Scan endpoints
+@app.route('/api/scans', methods=['GET'])
+@token_required
+def get_user_scans(current_user):
+    try:
+        scans = repository.list_scans(current_user['id'])
+        return jsonify({'success': True, 'scans': [scan_to_dict(scan) for scan in scans]}), 200
+    except Exception as e:
+        logger.error(f"Get scans error: {str(e)}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/scans', methods=['POST'])
+@token_required
+def create_scan(current_user):
+    data = request.get_json()
+
+    try:
+        new_scan = repository.create_scan(
+            current_user['id'],
+            patient_name=data.get('patient_name'),
+            patient_age=data.get('patient_age'),
+            patient_gender=data.get('patient_gender'),
+            file_name=data.get('file_name'),
+            file_url=data.get('file_url'),
+            prediction=data.get('prediction'),
+            confidence=data.get('confidence'),
+            analysis_details=data.get('analysis_details', {})
+        )
+
+        logger.info(f"New scan created by user {current_user['email']}")
+        return jsonify({'success': True, 'scan': scan_to_dict(new_scan)}), 201
+    except Exception as e:
+        logger.error(f"Create scan error: {str(e)}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/scans/<scan_id>', methods=['DELETE'])
+@token_required
+def delete_scan(current_user, scan_id):
+    try:
+        if not repository.delete_scan(scan_id, user_id=current_user['id']):
+            return jsonify({'success': False, 'message': 'Scan not found'}), 404
+
+        logger.info(f"Scan deleted by user {current_user['email']}")
+        return jsonify({'success': True, 'message': 'Scan deleted successfully'}), 200
+    except Exception as e:
+        logger.error(f"Delete scan error: {str(e)}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/scans/<scan_id>/feedback', methods=['POST'])
+@token_required
+def submit_ai_feedback(current_user, scan_id):
+    """Submit feedback for AI model learning"""
+    data = request.get_json()
+
+    corrected_prediction = data.get('corrected_prediction')
+
+    if not corrected_prediction:
+        return jsonify({'success': False, 'message': 'Corrected prediction is required'}), 400
+
+    try:
+        # Records the feedback and applies the correction to the scan in one write
+        feedback = repository.add_feedback(
+            scan_id,
+            current_user['id'],
+            corrected_prediction,
+            feedback_type=data.get('feedback_type', 'correction'),
+            notes=data.get('notes', ''),
+            new_confidence=data.get('new_confidence'),
+            analysis_details=data.get('analysis_details')
+        )
+        if feedback is None:
+            return jsonify({'success': False, 'message': 'Scan not found'}), 404
+
+        logger.info(f"AI feedback submitted by {current_user['email']} for scan {scan_id}")
+
+        summary = repository.feedback_summary(recent_limit=0)
+        return jsonify({
+            'success': True,
+            'message': 'Feedback submitted successfully',
+            'data': {
+                'total_feedback': summary['total_feedback'],
+                'correction_rate': summary['corrections'],
+                'scan_updated': True
+            }
+        }), 200
+    except Exception as e:
+        logger.error(f"AI feedback submission error: {str(e)}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+# Admin endpoints
+@app.route('/api/admin/users', methods=['GET'])
+@token_required
+def get_all_users(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'success': False, 'message': 'Admin access required'}), 403
+
+    try:
+        users = [{
+            **user_to_dict(user),
+            'created_at': isoformat(user.get('created_at')),
+            'last_login': isoformat(user.get('last_login')),
+            'scan_count': user['scan_count']
+        } for user in repository.list_users(exclude_email=current_user['email'])]
+
+        return jsonify({'success': True, 'users': users}), 200
+    except Exception as e:
+        logger.error(f"Get users error: {str(e)}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/admin/users/<user_id>', methods=['DELETE'])
+@token_required
+def delete_user(current_user, user_id):
+    if current_user['role'] != 'admin':
+        return jsonify({'success': False, 'message': 'Admin access required'}), 403
+
+    try:
+        user = repository.get_user(user_id)
+        if not user:
+            return jsonify({'success': False, 'message': 'User not found'}), 404
+
+        repository.delete_user(user_id)
+
+        logger.info(f"User deleted by admin {current_user['email']}: {user['email']}")
+        return jsonify({'success': True, 'message': 'User deleted successfully'}), 200
+    except Exception as e:
+        logger.error(f"Delete user error: {str(e)}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/admin/ai-feedback', methods=['GET'])
+@token_required
+def get_ai_feedback(current_user):
+    """Get AI model feedback data for analysis (Admin only)"""
+    if current_user['role'] != 'admin':
+        return jsonify({'success': False, 'message': 'Admin access required'}), 403
+
+    try:
+        summary = repository.feedback_summary()
+
+        # Calculate accuracy improvements
+        accuracy_data = {}
+        if summary['total_feedback'] > 0:
+            correction_rate = (summary['corrections'] / summary['total_feedback']) * 100
+            accuracy_data['correction_rate'] = round(correction_rate, 2)
+            accuracy_data['improvement_potential'] = round(100 - correction_rate, 2)
+
+        return jsonify({'success': True, 'data': {
+            'total_feedback': summary['total_feedback'],
+            'corrections': summary['corrections'],
+            'confirmations': summary['confirmations'],
+            'accuracy_data': accuracy_data,
+            'recent_feedback': [
+                {**fb, 'created_at': isoformat(fb['created_at'])} for fb in summary['recent_feedback']
+            ]
+        }}), 200
+    except Exception as e:
+        logger.error(f"Get AI feedback error: {str(e)}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/admin/ai-model-stats', methods=['GET'])
+@token_required
+def get_ai_model_stats(current_user):
+    """Get AI model performance statistics (Admin only)"""
+    if current_user['role'] != 'admin':
+        return jsonify({'success': False, 'message': 'Admin access required'}), 403
+
+    try:
+        total_scans = repository.count_scans()
+        feedback_scans = repository.feedback_summary(recent_limit=0)['scans_with_feedback']
+
+        return jsonify({'success': True, 'data': {
+            'total_scans': total_scans,
+            'scans_with_feedback': feedback_scans,
+            'feedback_rate': round((feedback_scans / max(total_scans, 1)) * 100, 2),
+            'correction_patterns': repository.correction_patterns()
+        }}), 200
+    except Exception as e:
+        logger.error(f"Get AI model stats error: {str(e)}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+# Health check endpoint
+@app.route('/api/health', methods=['GET'])
+def health_check():
+    return jsonify({'status': 'healthy', 'timestamp': datetime.utcnow().isoformat(), 'version': '1.0.0'}), 200
+
+# Create default admin user if no users exist
+if not repository.list_users():
+    admin_email = os.environ.get('ADMIN_EMAIL', 'admin@ecgscanner.com')
+    repository.create_user(
+        admin_email, 'Administrator', password_hasher.hash(os.environ.get('ADMIN_PASSWORD', 'admin123')), role='admin'
+    )
+    logger.info(f"Default admin user created: {admin_email}")
+
+if __name__ == '__main__':
+    port = int(os.environ.get('PORT', 5001))
+    host = os.environ.get('HOST', '0.0.0.0')
+
+    logger.info(f"Starting ECG Scanner Backend (MongoDB) on {host}:{port}")
+    app.run(host=host, port=port, debug=False)
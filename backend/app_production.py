@@ -4,11 +4,10 @@ Production-ready ECG Scanner Backend Application
 Optimized for real-world deployment with email functionality
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g, send_file, stream_with_context
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from flask_mail import Mail, Message
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
 import jwt
 import os
@@ -18,6 +17,28 @@ import logging
 from functools import wraps
 import json
 from dotenv import load_dotenv
+from production_config import engine_options
+from pool_metrics import PoolMetrics
+from shared_sqlite import SQLiteWriteQueue, apply_sqlite_pragmas
+from read_replica import ReplicaRouter, RoutingSession, primary_reads
+from metrics import MetricsRegistry, RequestMetrics
+from slow_query_log import SlowQueryLog
+from password_hashing import HashingUnavailable, PasswordHasher
+from activity_tracker import ActivityTracker
+from schema_upgrade import upgrade_schema
+from rate_limiter import RateLimiter
+from expiry_sweeper import ExpirySweeper
+from purge_jobs import PurgeRunner
+from change_feed import ChangeFeed
+from scan_stats import GRANULARITIES, ScanRollups, is_critical, parse_range
+from analytics import METRICS, Analytics, parse_time
+from result_cache import ResultCache
+import scan_sync
+from ttl_store import ttl_store_from_url
+from idempotency import IdempotencyKeys
+from report_rendering import FORMATS, PdfUnavailable, ReportRenderer, report_payload
+from scan_archive import STORED_EXTENSIONS, ZipStream, decode_data_url, file_chunks
+from sqlalchemy.exc import IntegrityError
 
 # Load environment variables
 load_dotenv()
@@ -54,8 +75,75 @@ CORS(app,
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', secrets.token_urlsafe(32))
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///ecg_app.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+
+# Shared SQLite mode: several workstations on one database file
+SHARED_SQLITE_MODE = os.environ.get('DATABASE_MODE') == 'shared-sqlite'
+if SHARED_SQLITE_MODE:
+    from shared_config import SharedConfig
+    # Absolute path so the file lands in the folder SharedConfig created, not instance/
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.abspath(SharedConfig.db_path)}"
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = SharedConfig.SQLALCHEMY_ENGINE_OPTIONS
 app.config['JWT_EXPIRATION_DELTA'] = timedelta(days=int(os.environ.get('JWT_EXPIRATION_DELTA', 30)))
 
+# Read replica: GET handlers and exports read from it within the staleness tolerance
+if os.environ.get('REPLICA_DATABASE_URL'):
+    replica_url = os.environ['REPLICA_DATABASE_URL']
+    app.config['SQLALCHEMY_BINDS'] = {'replica': {'url': replica_url, **engine_options(replica_url)}}
+app.config['REPLICA_MAX_STALENESS'] = float(os.environ.get('REPLICA_MAX_STALENESS', 5))
+app.config['READ_YOUR_WRITES_WINDOW'] = float(os.environ.get('READ_YOUR_WRITES_WINDOW', 10))
+# Who wrote within the window; the default SQLite file is shared by the workers on this host
+app.config['READ_YOUR_WRITES_STORE'] = os.environ.get(
+    'READ_YOUR_WRITES_STORE', 'sqlite:///' + os.path.join(app.instance_path, 'recent_writes.db'))
+
+# Password hashing work factor and pool limits; changing the method upgrades hashes on next login
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 0)) or None
+app.config['PASSWORD_HASH_MAX_PENDING'] = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 0)) or None
+app.config['PASSWORD_HASH_TIMEOUT'] = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+app.config['ACTIVITY_FLUSH_INTERVAL'] = float(os.environ.get('ACTIVITY_FLUSH_INTERVAL', 5))
+
+# Auth throttling ('count/seconds'); RATE_LIMIT_STORE points at a SQLite file shared by all workers
+app.config['RATE_LIMIT_ENABLED'] = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+app.config['RATE_LIMIT_STORE'] = os.environ.get('RATE_LIMIT_STORE')
+app.config['RATE_LIMIT_TRUST_PROXY'] = os.environ.get('RATE_LIMIT_TRUST_PROXY', 'false').lower() == 'true'
+
+# Used and expired password reset codes are deleted in batches on this schedule
+app.config['RESET_SWEEP_INTERVAL'] = float(os.environ.get('RESET_SWEEP_INTERVAL', 300))
+app.config['RESET_SWEEP_BATCH_SIZE'] = int(os.environ.get('RESET_SWEEP_BATCH_SIZE', 500))
+
+# Admin purges run as background jobs deleting this many rows per transaction
+app.config['PURGE_BATCH_SIZE'] = int(os.environ.get('PURGE_BATCH_SIZE', 500))
+
+# Admin analytics: buckets are written every ANALYTICS_FLUSH_INTERVAL seconds; minute buckets
+# are kept ANALYTICS_MINUTE_RETENTION_HOURS, hour buckets ANALYTICS_HOUR_RETENTION_DAYS, day buckets forever
+app.config['ANALYTICS_FLUSH_INTERVAL'] = float(os.environ.get('ANALYTICS_FLUSH_INTERVAL', 10))
+app.config['ANALYTICS_MINUTE_RETENTION_HOURS'] = float(os.environ.get('ANALYTICS_MINUTE_RETENTION_HOURS', 48))
+app.config['ANALYTICS_HOUR_RETENTION_DAYS'] = float(os.environ.get('ANALYTICS_HOUR_RETENTION_DAYS', 90))
+
+# Admin dashboard results are cached per worker for RESULT_CACHE_TTL seconds, or until a write
+# in this worker invalidates them
+app.config['RESULT_CACHE_TTL'] = float(os.environ.get('RESULT_CACHE_TTL', 30))
+app.config['RESULT_CACHE_MAX_ENTRIES'] = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 256))
+
+# Most history items accepted per /api/scans/sync request
+app.config['SYNC_UPLOAD_MAX_ITEMS'] = int(os.environ.get('SYNC_UPLOAD_MAX_ITEMS', 200))
+
+# Responses to requests sent with an Idempotency-Key are kept this many seconds for retries.
+# The default store is a SQLite file shared by the workers on this host.
+app.config['IDEMPOTENCY_TTL'] = int(os.environ.get('IDEMPOTENCY_TTL', 86400))
+app.config['IDEMPOTENCY_STORE'] = os.environ.get('IDEMPOTENCY_STORE', 'sqlite:///' + os.path.join(app.instance_path, 'idempotency.db'))
+app.config['IDEMPOTENCY_MAX_ENTRIES'] = int(os.environ.get('IDEMPOTENCY_MAX_ENTRIES', 100000))
+
+# Rendered scan reports are cached on disk and re-rendered only when a scan changes
+app.config['REPORT_CACHE_DIR'] = os.environ.get('REPORT_CACHE_DIR', os.path.join(app.instance_path, 'report_cache'))
+app.config['REPORT_WORKERS'] = int(os.environ.get('REPORT_WORKERS', 2))
+app.config['REPORT_CACHE_MAX_MB'] = float(os.environ.get('REPORT_CACHE_MAX_MB', 512))
+app.config['REPORT_HISTORY_MAX_SCANS'] = int(os.environ.get('REPORT_HISTORY_MAX_SCANS', 500))
+
+# Wrong codes (via verify-reset or finalize-reset) after which an active reset code is revoked
+app.config['RESET_CODE_MAX_ATTEMPTS'] = int(os.environ.get('RESET_CODE_MAX_ATTEMPTS', 5))
+
 # Production Email Configuration
 app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
 app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', 587))
@@ -65,8 +153,42 @@ app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
 app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_DEFAULT_SENDER', 'noreply@ecgscanner.com')
 
 # Initialize extensions
-db = SQLAlchemy(app)
+# Forks its process pool now, so it must come before anything that starts a thread
+report_renderer = ReportRenderer.from_config(app.config)
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
 mail = Mail(app)
+replica_router = ReplicaRouter(app, db)
+pool_metrics = PoolMetrics()
+metrics_registry = MetricsRegistry()
+request_metrics = RequestMetrics(metrics_registry)
+request_metrics.init_app(app)
+slow_query_log = SlowQueryLog(
+    threshold_ms=float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 200)),
+    log_path=os.environ.get('SLOW_QUERY_LOG', 'slow_queries.log'),
+    explain=os.environ.get('SLOW_QUERY_EXPLAIN', 'true').lower() == 'true',
+    registry=metrics_registry
+)
+write_queue = None
+password_hasher = PasswordHasher.from_config(app.config)
+rate_limiter = RateLimiter.from_config(app.config)
+rate_limiter.add_rule('login', per_ip=os.environ.get('RATE_LIMIT_LOGIN_IP', '20/60'),
+                      per_account=os.environ.get('RATE_LIMIT_LOGIN_ACCOUNT', '10/300'))
+rate_limiter.add_rule('request-reset', per_ip=os.environ.get('RATE_LIMIT_RESET_IP', '5/300'),
+                      per_account=os.environ.get('RATE_LIMIT_RESET_ACCOUNT', '3/900'))
+rate_limiter.add_rule('verify-reset', per_ip=os.environ.get('RATE_LIMIT_VERIFY_IP', '20/300'),
+                      per_account=os.environ.get('RATE_LIMIT_VERIFY_ACCOUNT', '10/900'))
+idempotency_keys = IdempotencyKeys(
+    ttl_store_from_url(app.config['IDEMPOTENCY_STORE'], max_size=app.config['IDEMPOTENCY_MAX_ENTRIES']),
+    ttl=app.config['IDEMPOTENCY_TTL']
+)
+metrics_registry.callback('idempotent_replays_total', 'Retried requests answered from the idempotency store.',
+                          lambda: idempotency_keys.replayed, 'counter')
+metrics_registry.callback('reports_rendered_total', 'Scan reports rendered in the report pool.',
+                          lambda: report_renderer.rendered, 'counter')
+metrics_registry.callback('report_cache_hits_total', 'Scan reports served from the disk cache.',
+                          lambda: report_renderer.cache_hits, 'counter')
+metrics_registry.callback('auth_rate_limited_total', 'Auth requests rejected by the rate limiter.',
+                          lambda: rate_limiter.rejected, 'counter')
 
 # Models
 class User(db.Model):
@@ -78,6 +200,14 @@ class User(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
     last_login = db.Column(db.DateTime)
+    last_seen = db.Column(db.DateTime)
+    # Set on deletion; the account stops authenticating at once and is purged in the background
+    deleted_at = db.Column(db.DateTime, index=True)
+    # Last scan-history version handed out, and the version of the last full resync
+    sync_version = db.Column(db.Integer, default=0)
+    sync_reset_version = db.Column(db.Integer, default=0)
+    # Set once scan_daily_stat holds this user's full history (older rows are rebuilt on first read)
+    scan_stats_ready = db.Column(db.Boolean, default=True)
 
 class Scan(db.Model):
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
@@ -92,6 +222,43 @@ class Scan(db.Model):
     analysis_details = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Owner's sync_version when the row last changed (see change_feed.ChangeFeed)
+    version = db.Column(db.Integer)
+    # Set for scans uploaded from a device's local history (see /api/scans/sync)
+    client_id = db.Column(db.String(64))
+    content_hash = db.Column(db.String(64))
+    image_data = db.Column(db.Text)
+    
+    __table_args__ = (
+        db.Index('ix_scan_user_version', 'user_id', 'version'),
+        db.Index('ix_scan_user_client', 'user_id', 'client_id', unique=True),
+        db.Index('ix_scan_user_content_hash', 'user_id', 'content_hash'),
+    )
+
+class ScanTombstone(db.Model):
+    """A deleted scan, kept so other devices learn of the delete"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(36), nullable=False)
+    record_id = db.Column(db.String(36), nullable=False)
+    version = db.Column(db.Integer)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_scan_tombstone_user_version', 'user_id', 'version'),
+    )
+
+class ScanDailyStat(db.Model):
+    """Per-user scan counts for one day, diagnosis and criticality (see scan_stats.ScanRollups)"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(36), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    diagnosis = db.Column(db.String(100), nullable=False)
+    is_critical = db.Column(db.Boolean, nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.Index('ix_scan_daily_stat_key', 'user_id', 'day', 'diagnosis', 'is_critical', unique=True),
+    )
 
 class PasswordReset(db.Model):
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
@@ -101,6 +268,58 @@ class PasswordReset(db.Model):
     expires_at = db.Column(db.DateTime, nullable=False)
     used = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Wrong codes entered for this email while the code was active; it is revoked at RESET_CODE_MAX_ATTEMPTS
+    failed_attempts = db.Column(db.Integer, default=0)
+    
+    __table_args__ = (
+        # verify/finalize match email, code and used exactly and range-scan expires_at;
+        # the email prefix also serves request-reset's active-code check
+        db.Index('ix_password_reset_lookup', 'email', 'reset_code', 'used', 'expires_at'),
+        db.Index('ix_password_reset_expires_at', 'expires_at'),
+    )
+
+class PurgeJob(db.Model):
+    """A resumable background bulk delete (see purge_jobs.PurgeRunner)"""
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    kind = db.Column(db.String(30), nullable=False)
+    target_id = db.Column(db.String(36))
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True)
+    phase = db.Column(db.String(30))
+    deleted_count = db.Column(db.Integer, default=0)
+    total_count = db.Column(db.Integer)
+    # Rows referencing a batch that were deleted along with it (not part of total_count)
+    dependent_count = db.Column(db.Integer, default=0)
+    error = db.Column(db.Text)
+    created_by = db.Column(db.String(36))
+    claimed_by = db.Column(db.String(100))
+    claimed_until = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+class AnalyticsBucket(db.Model):
+    """Platform-wide count of one metric over one minute, hour or day (see analytics.Analytics)"""
+    id = db.Column(db.Integer, primary_key=True)
+    metric = db.Column(db.String(40), nullable=False)
+    resolution = db.Column(db.String(10), nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    value = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.Index('ix_analytics_bucket_key', 'metric', 'resolution', 'bucket_start', unique=True),
+        db.Index('ix_analytics_bucket_resolution_start', 'resolution', 'bucket_start'),
+    )
+
+class AnalyticsActiveUser(db.Model):
+    """A user seen during one hour or day, for distinct active-user counts"""
+    id = db.Column(db.Integer, primary_key=True)
+    resolution = db.Column(db.String(10), nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    user_id = db.Column(db.String(36), nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_analytics_active_user_key', 'resolution', 'bucket_start', 'user_id', unique=True),
+    )
 
 # JWT Token decorator
 def token_required(f):
@@ -114,9 +333,14 @@ def token_required(f):
         try:
             token = token.split(' ')[1]  # Remove 'Bearer ' prefix
             data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            current_user = User.query.filter_by(id=data['user_id']).first()
+            g.current_user_id = data['user_id']
+            # Read from the primary so a deleted account is revoked immediately
+            with primary_reads():
+                current_user = User.query.filter_by(id=data['user_id'], deleted_at=None).first()
             if not current_user:
                 return jsonify({'success': False, 'message': 'User not found!'}), 401
+            activity_tracker.record_seen(current_user.id)
+            analytics.record_active(current_user.id)
         except jwt.ExpiredSignatureError:
             return jsonify({'success': False, 'message': 'Token has expired!'}), 401
         except Exception as e:
@@ -128,6 +352,91 @@ def token_required(f):
     return decorated
 
 # Helper functions
+def run_write(work):
+    """Run a unit of work that writes, committing it.
+    
+    In shared-SQLite mode the work is handed to the single writer thread and
+    group-committed with other queued writes; otherwise it runs on db.session.
+    """
+    if write_queue is not None:
+        return write_queue.run(work)
+    try:
+        result = work(db.session)
+        db.session.commit()
+        return result
+    except Exception:
+        db.session.rollback()
+        raise
+
+@app.errorhandler(HashingUnavailable)
+def hashing_unavailable(e):
+    logger.error(f"Password hashing unavailable: {str(e)}")
+    response = jsonify({'success': False, 'message': 'Server is busy, please try again shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+def flush_activity(changes):
+    """Write buffered last_login/last_seen timestamps as batched UPDATEs.
+    
+    Core executemany rather than ORM bulk update, so rows for users deleted
+    in the meantime are skipped instead of failing the whole batch.
+    """
+    user_table = User.__table__
+    logins = [{'user_id': user_id, 'login': fields['last_login'], 'seen': fields['last_seen']}
+              for user_id, fields in changes.items() if 'last_login' in fields]
+    seen = [{'user_id': user_id, 'seen': fields['last_seen']}
+            for user_id, fields in changes.items() if 'last_login' not in fields]
+    
+    def work(session):
+        if logins:
+            session.execute(db.update(user_table).where(user_table.c.id == db.bindparam('user_id'))
+                            .values(last_login=db.bindparam('login'), last_seen=db.bindparam('seen')), logins)
+        if seen:
+            session.execute(db.update(user_table).where(user_table.c.id == db.bindparam('user_id'))
+                            .values(last_seen=db.bindparam('seen')), seen)
+    
+    with app.app_context():
+        run_write(work)
+
+scan_feed = ChangeFeed(db, User, Scan, ScanTombstone, run_write).install()
+# Installed after the feed, whose version bump locks the owner row first
+scan_rollups = ScanRollups(User, Scan, ScanDailyStat).install()
+
+activity_tracker = ActivityTracker(flush_activity, interval=app.config['ACTIVITY_FLUSH_INTERVAL'])
+
+reset_sweeper = ExpirySweeper(
+    app, db, PasswordReset,
+    lambda: db.or_(PasswordReset.used == True, PasswordReset.expires_at < datetime.utcnow()),  # noqa: E712
+    run_write,
+    interval=app.config['RESET_SWEEP_INTERVAL'],
+    batch_size=app.config['RESET_SWEEP_BATCH_SIZE']
+)
+
+def password_reset_rows():
+    with app.app_context():
+        return db.session.query(db.func.count(PasswordReset.id)).scalar()
+
+metrics_registry.callback('password_reset_rows', 'Rows in the password_reset table.', password_reset_rows)
+metrics_registry.callback('password_reset_swept_total', 'Used or expired reset rows deleted by the sweeper.',
+                          lambda: reset_sweeper.deleted_total, 'counter')
+
+def scan_to_dict(scan):
+    return {
+        'id': scan.id,
+        'patient_name': scan.patient_name,
+        'patient_age': scan.patient_age,
+        'patient_gender': scan.patient_gender,
+        'file_name': scan.file_name,
+        'file_url': scan.file_url,
+        'prediction': scan.prediction,
+        'confidence': scan.confidence,
+        'analysis_details': json.loads(scan.analysis_details) if scan.analysis_details else None,
+        'created_at': scan.created_at.isoformat(),
+        'updated_at': scan.updated_at.isoformat(),
+        'version': scan.version,
+        'client_id': scan.client_id
+    }
+
 def mask_email(email):
     """Mask email for security display"""
     if '@' not in email:
@@ -203,7 +512,7 @@ def signup():
         return jsonify({'success': False, 'message': 'User already exists'}), 400
     
     # Create new user
-    hashed_password = generate_password_hash(password)
+    hashed_password = password_hasher.hash(password)
     new_user = User(
         email=email.lower(),
         name=name,
@@ -212,8 +521,8 @@ def signup():
     )
     
     try:
-        db.session.add(new_user)
-        db.session.commit()
+        run_write(lambda session: session.add(new_user))
+        g.current_user_id = new_user.id
         
         # Generate JWT token
         token = jwt.encode({
@@ -233,11 +542,11 @@ def signup():
             'token': token
         }), 201
     except Exception as e:
-        db.session.rollback()
         logger.error(f"Signup error: {str(e)}")
         return jsonify({'success': False, 'message': 'Failed to create user'}), 500
 
 @app.route('/api/login', methods=['POST'])
+@rate_limiter.limit('login')
 def login():
     data = request.get_json()
     
@@ -247,14 +556,22 @@ def login():
     if not all([email, password]):
         return jsonify({'success': False, 'message': 'Missing email or password'}), 400
     
-    user = User.query.filter_by(email=email.lower()).first()
+    user = User.query.filter_by(email=email.lower(), deleted_at=None).first()
     
-    if not user or not check_password_hash(user.password_hash, password):
+    if not user or not password_hasher.verify(user.password_hash, password):
         return jsonify({'success': False, 'message': 'Invalid email or password'}), 401
     
-    # Update last login
-    user.last_login = datetime.utcnow()
-    db.session.commit()
+    # Last login is written behind; only a stored hash with outdated parameters is updated now
+    activity_tracker.record_login(user.id)
+    analytics.record('logins')
+    analytics.record_active(user.id)
+    if password_hasher.needs_rehash(user.password_hash):
+        try:
+            new_password_hash = password_hasher.hash(password)
+            g.current_user_id = user.id
+            run_write(lambda session: session.query(User).filter_by(id=user.id).update({'password_hash': new_password_hash}))
+        except HashingUnavailable:
+            pass  # Upgrade on a later login
     
     # Generate JWT token
     token = jwt.encode({
@@ -276,6 +593,7 @@ def login():
 
 # Password Reset Endpoints
 @app.route('/api/request-reset', methods=['POST'])
+@rate_limiter.limit('request-reset')
 def request_password_reset():
     """Request password reset - sends email with reset code"""
     data = request.get_json()
@@ -285,7 +603,7 @@ def request_password_reset():
         return jsonify({'success': False, 'message': 'Email is required'}), 400
     
     # Find user
-    user = User.query.filter_by(email=email.lower()).first()
+    user = User.query.filter_by(email=email.lower(), deleted_at=None).first()
     if not user:
         # Don't reveal if user exists or not
         return jsonify({'success': True, 'message': 'If the email exists, a reset code has been sent'}), 200
@@ -320,8 +638,7 @@ def request_password_reset():
     )
     
     try:
-        db.session.add(password_reset)
-        db.session.commit()
+        run_write(lambda session: session.add(password_reset))
         
         # Send email
         if send_reset_email(email, reset_code, user.name):
@@ -334,16 +651,35 @@ def request_password_reset():
                 }
             }), 200
         else:
-            db.session.delete(password_reset)
-            db.session.commit()
+            run_write(lambda session: session.query(PasswordReset).filter_by(id=password_reset.id).delete())
             return jsonify({'success': False, 'message': 'Failed to send reset email'}), 500
             
     except Exception as e:
-        db.session.rollback()
         logger.error(f"Password reset request error: {str(e)}")
         return jsonify({'success': False, 'message': 'Failed to process reset request'}), 500
 
+def record_failed_reset(email):
+    """Count a wrong code against the email's active reset codes, revoking them after too many"""
+    def work(session):
+        active = session.query(PasswordReset).filter(
+            PasswordReset.email == email.lower(),
+            PasswordReset.used == False,  # noqa: E712
+            PasswordReset.expires_at > datetime.utcnow()
+        )
+        active.update({'failed_attempts': db.func.coalesce(PasswordReset.failed_attempts, 0) + 1},
+                      synchronize_session=False)
+        revoked = active.filter(PasswordReset.failed_attempts >= app.config['RESET_CODE_MAX_ATTEMPTS']) \
+            .update({'used': True}, synchronize_session=False)
+        if revoked:
+            logger.warning(f"Reset code for {email} revoked after too many wrong attempts")
+    
+    try:
+        run_write(work)
+    except Exception as e:
+        logger.error(f"Recording failed reset attempt error: {str(e)}")
+
 @app.route('/api/verify-reset', methods=['POST'])
+@rate_limiter.limit('verify-reset')
 def verify_reset_code():
     """Verify password reset code"""
     data = request.get_json()
@@ -361,11 +697,14 @@ def verify_reset_code():
     ).filter(PasswordReset.expires_at > datetime.utcnow()).first()
     
     if not reset_entry:
+        record_failed_reset(email)
         return jsonify({'success': False, 'message': 'Invalid or expired reset code'}), 400
     
     return jsonify({'success': True, 'message': 'Reset code verified successfully'}), 200
 
 @app.route('/api/finalize-reset', methods=['POST'])
+# Shares verify-reset's counters: both endpoints accept the code, so guesses are limited across the two
+@rate_limiter.limit('verify-reset')
 def finalize_password_reset():
     """Complete password reset with new password"""
     data = request.get_json()
@@ -388,33 +727,33 @@ def finalize_password_reset():
     ).filter(PasswordReset.expires_at > datetime.utcnow()).first()
     
     if not reset_entry:
+        record_failed_reset(email)
         return jsonify({'success': False, 'message': 'Invalid or expired reset code'}), 400
     
     # Find user
-    user = User.query.filter_by(email=email.lower()).first()
+    user = User.query.filter_by(email=email.lower(), deleted_at=None).first()
     if not user:
         return jsonify({'success': False, 'message': 'User not found'}), 404
     
+    new_password_hash = password_hasher.hash(new_password)
+    
     try:
-        # Update password
-        user.password_hash = generate_password_hash(new_password)
-        
-        # Mark reset code as used
-        reset_entry.used = True
-        
-        # Clean up old reset codes for this user
-        PasswordReset.query.filter_by(
-            email=email.lower(),
-            used=False
-        ).update({'used': True})
+        def work(session):
+            # Update password
+            session.query(User).filter_by(id=user.id).update({'password_hash': new_password_hash})
+            
+            # Mark this and any other outstanding reset codes for this user as used
+            session.query(PasswordReset).filter_by(
+                email=email.lower(),
+                used=False
+            ).update({'used': True})
         
-        db.session.commit()
+        run_write(work)
         
         logger.info(f"Password reset completed for {email}")
         return jsonify({'success': True, 'message': 'Password reset successfully'}), 200
         
     except Exception as e:
-        db.session.rollback()
         logger.error(f"Password reset finalization error: {str(e)}")
         return jsonify({'success': False, 'message': 'Failed to reset password'}), 500
 
@@ -425,29 +764,176 @@ def get_user_scans(current_user):
     try:
         scans = Scan.query.filter_by(user_id=current_user.id).order_by(Scan.created_at.desc()).all()
         
-        scan_list = []
-        for scan in scans:
-            scan_list.append({
-                'id': scan.id,
-                'patient_name': scan.patient_name,
-                'patient_age': scan.patient_age,
-                'patient_gender': scan.patient_gender,
-                'file_name': scan.file_name,
-                'file_url': scan.file_url,
-                'prediction': scan.prediction,
-                'confidence': scan.confidence,
-                'analysis_details': json.loads(scan.analysis_details) if scan.analysis_details else None,
-                'created_at': scan.created_at.isoformat(),
-                'updated_at': scan.updated_at.isoformat()
-            })
+        scan_list = [scan_to_dict(scan) for scan in scans]
         
         return jsonify({'success': True, 'scans': scan_list}), 200
     except Exception as e:
         logger.error(f"Get scans error: {str(e)}")
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/api/scans/changes', methods=['GET'])
+@token_required
+def get_scan_changes(current_user):
+    """Scans changed and deleted since the device's last sync.
+    
+    Pass the returned version as `since` next time, and keep paging while
+    has_more is set, also passing `resume` back whenever one is returned.
+    When reset is set the device's copy is out of date (e.g. its history was
+    cleared): replace it with the scans returned on this and later pages.
+    """
+    since = request.args.get('since', 0, type=int)
+    limit = min(max(request.args.get('limit', 500, type=int), 1), 1000)
+    
+    try:
+        # The cursor must never run ahead of what this read saw
+        with primary_reads():
+            scans, deleted, version, has_more, reset, resume = scan_feed.changes(
+                current_user, since, limit, resume=request.args.get('resume')
+            )
+        
+        return jsonify({
+            'success': True,
+            'scans': [scan_to_dict(scan) for scan in scans],
+            'deleted': deleted,
+            'version': version,
+            'has_more': has_more,
+            'reset': reset,
+            'resume': resume
+        }), 200
+    except Exception as e:
+        logger.error(f"Get scan changes error: {str(e)}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/scans/stats', methods=['GET'])
+@token_required
+def get_scan_stats(current_user):
+    """Scan counts by period, diagnosis and criticality from the daily rollups.
+    
+    `from`/`to` are ISO dates (default: the last 30 days) and `granularity`
+    is day, week, month or total.
+    """
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        return jsonify({'success': False, 'message': f"granularity must be one of {', '.join(GRANULARITIES)}"}), 400
+    try:
+        start, end = parse_range(request.args.get('from'), request.args.get('to'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Invalid date range: {str(e)}'}), 400
+    
+    try:
+        if current_user.scan_stats_ready:
+            totals, series = scan_rollups.stats(current_user.id, start, end, granularity)
+        else:
+            # The recount must see every scan, and the read after it the rows it wrote,
+            # so neither may go to a lagging replica
+            with primary_reads():
+                run_write(lambda session: scan_rollups.rebuild(session, current_user.id))
+                totals, series = scan_rollups.stats(current_user.id, start, end, granularity)
+        return jsonify({
+            'success': True,
+            'from': start.isoformat(),
+            'to': end.isoformat(),
+            'granularity': granularity,
+            'totals': totals,
+            'series': series
+        }), 200
+    except Exception as e:
+        logger.error(f"Get scan stats error: {str(e)}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/scans/sync', methods=['POST'])
+@token_required
+def sync_upload_scans(current_user):
+    """Upload a batch of locally stored history items (ScanHistoryItem).
+    
+    Items are keyed by their scanId. Re-sending an item, or the same scan
+    under another id, creates nothing; an edit is applied only when its
+    `version` matches the server's. Returns acks mapping each scanId to
+    [status, scan id, version].
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get('scans')
+    if not isinstance(items, list):
+        return jsonify({'success': False, 'message': 'scans must be a list'}), 400
+    if len(items) > app.config['SYNC_UPLOAD_MAX_ITEMS']:
+        return jsonify({'success': False, 'message': f"At most {app.config['SYNC_UPLOAD_MAX_ITEMS']} scans per request"}), 413
+    
+    try:
+        try:
+            acks = _sync_upload(current_user, items)
+        except IntegrityError:
+            # Another upload of the same items committed first; the retry sees them as duplicates
+            acks = _sync_upload(current_user, items)
+        
+        logger.info(f"Sync upload by {current_user.email}: {len(items)} items")
+        return jsonify({'success': True, 'acks': acks}), 200
+    except Exception as e:
+        logger.error(f"Sync upload error: {str(e)}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+def _sync_upload(current_user, items):
+    acks = {}
+    prepared = []
+    for item in items:
+        client_id = item.get('scanId') if isinstance(item, dict) else None
+        if not isinstance(client_id, str) or not client_id or len(client_id) > 64:
+            continue
+        try:
+            fields = scan_sync.scan_fields(item)
+        except (TypeError, ValueError):
+            acks[client_id] = [scan_sync.INVALID, None, None]
+            continue
+        base_version = item.get('version') if isinstance(item.get('version'), int) else None
+        prepared.append((client_id, base_version, scan_sync.content_hash(item), fields))
+    
+    # Existing scans matching any client id (or server id) or content hash, in two queries
+    client_ids = list({client_id for client_id, _, _, _ in prepared})
+    digests = list({digest for _, _, digest, _ in prepared})
+    by_client, by_hash = {}, {}
+    with primary_reads():
+        for scan in Scan.query.filter(Scan.user_id == current_user.id,
+                                      db.or_(Scan.client_id.in_(client_ids), Scan.id.in_(client_ids))):
+            by_client[scan.client_id or scan.id] = scan
+        for scan in Scan.query.filter(Scan.user_id == current_user.id, Scan.content_hash.in_(digests)):
+            by_hash.setdefault(scan.content_hash, scan)
+    
+    new_scans, updates = [], {}
+    for client_id, base_version, digest, fields in prepared:
+        status, scan = scan_sync.resolve(base_version, digest, by_client.get(client_id), by_hash.get(digest))
+        if status == scan_sync.CREATED:
+            scan = Scan(id=str(uuid.uuid4()), user_id=current_user.id, client_id=client_id,
+                        content_hash=digest, **fields)
+            new_scans.append(scan)
+            # Later copies in the same batch are duplicates of this one
+            by_client[client_id] = by_hash[digest] = scan
+        elif status == scan_sync.UPDATED:
+            fields.pop('created_at')
+            updates[scan.id] = dict(fields, content_hash=digest)
+            by_hash[digest] = scan
+        # Plain values: the commit below expires the ORM objects
+        acks[client_id] = [status, scan.id if scan else None, scan.version if scan else None]
+    
+    def work(session):
+        session.add_all(new_scans)
+        for scan_id, fields in updates.items():
+            target = session.get(Scan, scan_id)
+            for field, value in fields.items():
+                setattr(target, field, value)
+    
+    if new_scans or updates:
+        run_write(work)
+        # Versions are assigned at flush; read the new ones back in one query
+        written = [scan.id for scan in new_scans] + list(updates)
+        with primary_reads():
+            versions = dict(db.session.query(Scan.id, Scan.version).filter(Scan.id.in_(written)))
+        for ack in acks.values():
+            if ack[1] in versions:
+                ack[2] = versions[ack[1]]
+    return acks
+
 @app.route('/api/scans', methods=['POST'])
 @token_required
+@idempotency_keys.idempotent
 def create_scan(current_user):
     data = request.get_json()
     
@@ -464,28 +950,11 @@ def create_scan(current_user):
             analysis_details=json.dumps(data.get('analysis_details', {}))
         )
         
-        db.session.add(new_scan)
-        db.session.commit()
+        run_write(lambda session: session.add(new_scan))
         
         logger.info(f"New scan created by user {current_user.email}")
-        return jsonify({
-            'success': True,
-            'scan': {
-                'id': new_scan.id,
-                'patient_name': new_scan.patient_name,
-                'patient_age': new_scan.patient_age,
-                'patient_gender': new_scan.patient_gender,
-                'file_name': new_scan.file_name,
-                'file_url': new_scan.file_url,
-                'prediction': new_scan.prediction,
-                'confidence': new_scan.confidence,
-                'analysis_details': json.loads(new_scan.analysis_details) if new_scan.analysis_details else None,
-                'created_at': new_scan.created_at.isoformat(),
-                'updated_at': new_scan.updated_at.isoformat()
-            }
-        }), 201
+        return jsonify({'success': True, 'scan': scan_to_dict(new_scan)}), 201
     except Exception as e:
-        db.session.rollback()
         logger.error(f"Create scan error: {str(e)}")
         return jsonify({'success': False, 'message': str(e)}), 500
 
@@ -498,16 +967,130 @@ def delete_scan(current_user, scan_id):
         if not scan:
             return jsonify({'success': False, 'message': 'Scan not found'}), 404
         
-        db.session.delete(scan)
-        db.session.commit()
+        run_write(lambda session: session.delete(session.get(Scan, scan.id)))
         
         logger.info(f"Scan deleted by user {current_user.email}")
         return jsonify({'success': True, 'message': 'Scan deleted successfully'}), 200
     except Exception as e:
-        db.session.rollback()
         logger.error(f"Delete scan error: {str(e)}")
         return jsonify({'success': False, 'message': str(e)}), 500
 
+def send_report(render, download_name):
+    """Render (or fetch from the cache) a report in the requested format and send it"""
+    fmt = request.args.get('format', 'html')
+    if fmt not in FORMATS:
+        return jsonify({'success': False, 'message': f"format must be one of: {', '.join(FORMATS)}"}), 400
+    try:
+        path = render(fmt)
+    except PdfUnavailable:
+        return jsonify({'success': False, 'message': 'PDF reports are not available on this server'}), 501
+    return send_file(path, mimetype=FORMATS[fmt], as_attachment=request.args.get('download') == 'true',
+                     download_name=f'{download_name}.{fmt}', max_age=0)
+
+@app.route('/api/scans/<scan_id>/report', methods=['GET'])
+@token_required
+def get_scan_report(current_user, scan_id):
+    """The report for one scan as `format` html (default) or pdf; add download=true for an attachment"""
+    try:
+        scan = Scan.query.filter_by(id=scan_id, user_id=current_user.id).first()
+        
+        if not scan:
+            return jsonify({'success': False, 'message': 'Scan not found'}), 404
+        
+        payload = report_payload(scan)
+        return send_report(lambda fmt: report_renderer.single(payload, fmt), f'ECG_Report_{scan.id}')
+    except Exception as e:
+        logger.error(f"Scan report error: {str(e)}")
+        return jsonify({'success': False, 'message': 'Failed to render report'}), 500
+
+@app.route('/api/scans/report', methods=['GET'])
+@token_required
+def get_history_report(current_user):
+    """One report covering the scans in `ids` (comma-separated), or the whole history, newest first"""
+    ids = [scan_id for scan_id in request.args.get('ids', '').split(',') if scan_id]
+    limit = app.config['REPORT_HISTORY_MAX_SCANS']
+    
+    try:
+        query = Scan.query.filter_by(user_id=current_user.id)
+        if ids:
+            query = query.filter(Scan.id.in_(ids))
+        scans = query.order_by(Scan.created_at.desc()).limit(limit + 1).all()
+        
+        if not scans:
+            return jsonify({'success': False, 'message': 'No scans to report'}), 404
+        if len(scans) > limit:
+            return jsonify({'success': False, 'message': f'At most {limit} scans per report'}), 413
+        
+        payloads = [report_payload(scan) for scan in scans]
+        return send_report(lambda fmt: report_renderer.history(current_user.name, payloads, fmt),
+                           f'ECG_History_{datetime.utcnow().date().isoformat()}')
+    except Exception as e:
+        logger.error(f"History report error: {str(e)}")
+        return jsonify({'success': False, 'message': 'Failed to render report'}), 500
+
+def image_text_chunks(scan_id, size=1024 * 1024):
+    """A scan's image_data read from the database a slice at a time"""
+    offset = 1
+    while True:
+        chunk = db.session.query(db.func.substr(Scan.image_data, offset, size)).filter(Scan.id == scan_id).scalar()
+        if chunk:
+            yield chunk
+        if not chunk or len(chunk) < size:
+            return
+        offset += size
+
+def archive_entries(zip_stream, scan, has_image_data):
+    folder = f"scans/{scan.created_at.strftime('%Y-%m-%d_%H%M%S')}_{scan.id}/"
+    yield from zip_stream.entry(folder + 'scan.json', [json.dumps(scan_to_dict(scan), indent=2).encode('utf-8')],
+                                scan.created_at)
+    
+    image = decode_data_url(image_text_chunks(scan.id) if has_image_data else [scan.file_url or ''])
+    image_name = ''
+    if image is not None:
+        extension, chunks = image
+        image_name = f'image.{extension}'
+        yield from zip_stream.entry(folder + image_name, chunks, scan.created_at,
+                                    compress=extension not in STORED_EXTENSIONS)
+    
+    report = report_renderer.single(report_payload(scan, image_link=image_name), 'html')
+    yield from zip_stream.entry(folder + 'report.html', file_chunks(report), scan.created_at)
+
+@app.route('/api/scans/archive', methods=['GET'])
+@token_required
+def get_scan_archive(current_user):
+    """The whole scan history as a ZIP, streamed as it is built.
+    
+    Each scan gets a folder with its JSON, its image and its HTML report
+    (which shows the image next to it). Scans are loaded one at a time and
+    images read from the database in slices, so server memory stays flat
+    however large the history is.
+    """
+    user_id = current_user.id
+    scan_ids = [row.id for row in db.session.query(Scan.id).filter_by(user_id=user_id)
+                .order_by(Scan.created_at, Scan.id)]
+    
+    def generate():
+        zip_stream = ZipStream()
+        for scan_id in scan_ids:
+            row = db.session.query(Scan, Scan.image_data.isnot(None)) \
+                .options(db.defer(Scan.image_data)).filter(Scan.id == scan_id, Scan.user_id == user_id).first()
+            if row is None:
+                continue  # Deleted while the archive was streaming
+            scan, has_image_data = row
+            try:
+                yield from archive_entries(zip_stream, scan, has_image_data)
+            except Exception as e:
+                # Headers are already sent; a truncated archive fails its checksum on the client
+                logger.error(f"Scan archive for user {user_id} failed at scan {scan_id}: {str(e)}")
+                raise
+            db.session.expunge(scan)
+        yield from zip_stream.close()
+    
+    response = Response(stream_with_context(generate()), mimetype='application/zip')
+    response.headers['Content-Disposition'] = \
+        f'attachment; filename=ECG_History_{datetime.utcnow().date().isoformat()}.zip'
+    return response
+
 # Admin endpoints
 @app.route('/api/admin/users', methods=['GET'])
 @token_required
@@ -516,26 +1099,43 @@ def get_all_users(current_user):
         return jsonify({'success': False, 'message': 'Admin access required'}), 403
     
     try:
-        users = User.query.filter(User.email != current_user.email).all()
-        
         user_list = []
-        for user in users:
-            user_scans = Scan.query.filter_by(user_id=user.id).count()
-            user_list.append({
-                'id': user.id,
-                'email': user.email,
-                'name': user.name,
-                'role': user.role,
-                'created_at': user.created_at.isoformat(),
-                'last_login': user.last_login.isoformat() if user.last_login else None,
-                'scan_count': user_scans
-            })
+        for user in result_cache.get_or_compute('admin:users', _list_users, tags=('users', 'scans')):
+            if user['email'] == current_user.email:
+                continue
+            # Include activity still buffered in the write-behind tracker
+            activity = activity_tracker.pending(user['id'])
+            if activity:
+                user = dict(user)
+                if activity.get('last_login'):
+                    user['last_login'] = activity['last_login'].isoformat()
+                if activity.get('last_seen'):
+                    user['last_seen'] = activity['last_seen'].isoformat()
+            user_list.append(user)
         
         return jsonify({'success': True, 'users': user_list}), 200
     except Exception as e:
         logger.error(f"Get users error: {str(e)}")
         return jsonify({'success': False, 'message': str(e)}), 500
 
+def _list_users():
+    users = User.query.filter(User.deleted_at == None).all()  # noqa: E711
+    
+    user_list = []
+    for user in users:
+        user_scans = Scan.query.filter_by(user_id=user.id).count()
+        user_list.append({
+            'id': user.id,
+            'email': user.email,
+            'name': user.name,
+            'role': user.role,
+            'created_at': user.created_at.isoformat(),
+            'last_login': user.last_login.isoformat() if user.last_login else None,
+            'last_seen': user.last_seen.isoformat() if user.last_seen else None,
+            'scan_count': user_scans
+        })
+    return user_list
+
 @app.route('/api/admin/users/<user_id>', methods=['DELETE'])
 @token_required
 def delete_user(current_user, user_id):
@@ -543,21 +1143,24 @@ def delete_user(current_user, user_id):
         return jsonify({'success': False, 'message': 'Admin access required'}), 403
     
     try:
-        user = User.query.filter_by(id=user_id).first()
+        user = User.query.filter_by(id=user_id, deleted_at=None).first()
         
         if not user:
             return jsonify({'success': False, 'message': 'User not found'}), 404
         
-        # Delete all user's scans
-        Scan.query.filter_by(user_id=user_id).delete()
+        # Mark deleted now (revoking access); scans, feedback, resets and the row itself are purged in the background
+        run_write(lambda session: session.query(User).filter_by(id=user_id).update(
+            {'deleted_at': datetime.utcnow(), 'is_active': False}))
         
-        db.session.delete(user)
-        db.session.commit()
+        job = purge_runner.submit('user', current_user.id, target_id=user_id)
         
-        logger.info(f"User deleted by admin {current_user.email}: {user.email}")
-        return jsonify({'success': True, 'message': 'User deleted successfully'}), 200
+        logger.info(f"User deleted by admin {current_user.email}: {user.email}. Purge job {job.id}")
+        return jsonify({
+            'success': True,
+            'message': 'User deleted successfully',
+            'job': PurgeRunner.to_dict(job)
+        }), 202
     except Exception as e:
-        db.session.rollback()
         logger.error(f"Delete user error: {str(e)}")
         return jsonify({'success': False, 'message': str(e)}), 500
 
@@ -570,21 +1173,19 @@ def clear_all_history(current_user):
         return jsonify({'success': False, 'message': 'Admin access required'}), 403
     
     try:
-        # Count total scans
         total_scans = Scan.query.count()
         
-        # Delete all scans
-        Scan.query.delete()
-        db.session.commit()
+        # Deleted in batches by the purge runner; poll /api/admin/jobs/<id> for progress
+        job = purge_runner.submit('all_history', current_user.id)
         
-        logger.info(f"All scan history cleared by admin {current_user.email}. Deleted {total_scans} scans.")
+        logger.info(f"All scan history purge started by admin {current_user.email}. Job {job.id}, {total_scans} scans.")
         return jsonify({
             'success': True, 
-            'message': f'All scan history cleared successfully. Deleted {total_scans} scans.'
-        }), 200
+            'message': f'Clearing {total_scans} scans in the background.',
+            'job': PurgeRunner.to_dict(job)
+        }), 202
         
     except Exception as e:
-        db.session.rollback()
         logger.error(f"Clear all history error: {str(e)}")
         return jsonify({'success': False, 'message': str(e)}), 500
 
@@ -604,25 +1205,59 @@ def clear_user_history(current_user, user_id):
         # Count user's scans
         user_scans = Scan.query.filter_by(user_id=user_id).count()
         
-        # Delete user's scans
-        Scan.query.filter_by(user_id=user_id).delete()
-        db.session.commit()
+        job = purge_runner.submit('user_history', current_user.id, target_id=user_id)
         
-        logger.info(f"User history cleared by admin {current_user.email}. User: {user.email}, Deleted: {user_scans} scans.")
+        logger.info(f"User history purge started by admin {current_user.email}. User: {user.email}, Job {job.id}, {user_scans} scans.")
         return jsonify({
             'success': True, 
-            'message': f'User history cleared successfully. Deleted {user_scans} scans.'
-        }), 200
+            'message': f'Clearing {user_scans} scans in the background.',
+            'job': PurgeRunner.to_dict(job)
+        }), 202
         
     except Exception as e:
-        db.session.rollback()
         logger.error(f"Clear user history error: {str(e)}")
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/api/admin/backup', methods=['GET'])
+@token_required
+def get_backup_data(current_user):
+    """Export all users and their scan histories (Admin only)"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Admin access required'}), 403
+    
+    try:
+        users = User.query.filter(User.email != current_user.email, User.deleted_at == None).order_by(User.email).all()  # noqa: E711
+        
+        backup_data = {
+            'users': [],
+            'histories': {}
+        }
+        emails_by_id = {}
+        
+        for user in users:
+            backup_data['users'].append({
+                'email': user.email,
+                'name': user.name,
+                'role': user.role,
+                'created_at': user.created_at.isoformat()
+            })
+            backup_data['histories'][user.email] = []
+            emails_by_id[user.id] = user.email
+        
+        # One pass over all scans instead of a query per user
+        for scan in Scan.query.order_by(Scan.user_id, Scan.created_at).yield_per(500):
+            if scan.user_id in emails_by_id:
+                backup_data['histories'][emails_by_id[scan.user_id]].append(scan_to_dict(scan))
+        
+        return jsonify({'success': True, 'backup': backup_data}), 200
+    except Exception as e:
+        logger.error(f"Backup export error: {str(e)}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 # AI Model Learning from Corrections
 class AIModelFeedback(db.Model):
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    scan_id = db.Column(db.String(36), db.ForeignKey('scan.id'), nullable=False)
+    scan_id = db.Column(db.String(36), db.ForeignKey('scan.id'), nullable=False, index=True)
     original_prediction = db.Column(db.String(100), nullable=False)
     corrected_prediction = db.Column(db.String(100), nullable=False)
     confidence_change = db.Column(db.Float)
@@ -631,8 +1266,151 @@ class AIModelFeedback(db.Model):
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+# Background purges: feedback goes before the scans it references. Only rows
+# created before the job was requested are deleted.
+def _history_scans(job):
+    query = db.session.query(Scan.id).filter(Scan.created_at <= job.created_at)
+    return query.filter(Scan.user_id == job.target_id) if job.target_id else query
+
+purge_runner = PurgeRunner(app, db, PurgeJob, run_write, batch_size=app.config['PURGE_BATCH_SIZE'])
+def _history_purged(session, user_id=None):
+    # Purged scans leave no tombstones, so synced devices are sent a full listing instead,
+    # and the rollups are recounted from the scans that remain
+    scan_feed.mark_reset(session, user_id)
+    scan_rollups.rebuild(session, user_id)
+
+# Feedback can be added to a scan after the feedback phase has run; it goes with its scan
+SCAN_DEPENDENTS = [(AIModelFeedback, AIModelFeedback.scan_id)]
+purge_runner.register('all_history', [
+    ('feedback', AIModelFeedback, lambda job: AIModelFeedback.scan_id.in_(_history_scans(job))),
+    ('scans', Scan, lambda job: Scan.created_at <= job.created_at, SCAN_DEPENDENTS),
+], on_complete=lambda session, job: _history_purged(session))
+purge_runner.register('user_history', [
+    ('feedback', AIModelFeedback, lambda job: AIModelFeedback.scan_id.in_(_history_scans(job))),
+    ('scans', Scan, lambda job: db.and_(Scan.user_id == job.target_id, Scan.created_at <= job.created_at),
+     SCAN_DEPENDENTS),
+], on_complete=lambda session, job: _history_purged(session, job.target_id))
+# Cascade for a soft-deleted user; the user row goes last, once nothing references it
+purge_runner.register('user', [
+    ('feedback', AIModelFeedback, lambda job: db.or_(
+        AIModelFeedback.user_id == job.target_id,
+        AIModelFeedback.scan_id.in_(db.session.query(Scan.id).filter(Scan.user_id == job.target_id)))),
+    ('scans', Scan, lambda job: Scan.user_id == job.target_id, SCAN_DEPENDENTS),
+    ('resets', PasswordReset, lambda job: PasswordReset.user_id == job.target_id),
+    ('tombstones', ScanTombstone, lambda job: ScanTombstone.user_id == job.target_id),
+    ('stats', ScanDailyStat, lambda job: ScanDailyStat.user_id == job.target_id),
+    ('analytics', AnalyticsActiveUser, lambda job: AnalyticsActiveUser.user_id == job.target_id),
+    ('user', User, lambda job: db.and_(User.id == job.target_id, User.deleted_at != None)),  # noqa: E711
+])
+
+analytics = Analytics(app, db, AnalyticsBucket, AnalyticsActiveUser, run_write,
+                      flush_interval=app.config['ANALYTICS_FLUSH_INTERVAL'],
+                      retention={'minute': app.config['ANALYTICS_MINUTE_RETENTION_HOURS'] * 3600,
+                                 'hour': app.config['ANALYTICS_HOUR_RETENTION_DAYS'] * 86400,
+                                 'day': None}).watch(Scan, AIModelFeedback, is_critical)
+
+result_cache = ResultCache(max_entries=app.config['RESULT_CACHE_MAX_ENTRIES'],
+                           default_ttl=app.config['RESULT_CACHE_TTL']).watch({
+    User: 'users', Scan: 'scans', AIModelFeedback: 'feedback'
+})
+metrics_registry.callback('result_cache_hits_total', 'Admin results served from the cache.',
+                          lambda: result_cache.hits, 'counter')
+metrics_registry.callback('result_cache_misses_total', 'Admin results computed on a cache miss.',
+                          lambda: result_cache.misses, 'counter')
+metrics_registry.callback('result_cache_collapsed_total', 'Cache misses that waited for a concurrent computation.',
+                          lambda: result_cache.collapsed, 'counter')
+
+def analytics_history():
+    """Scans, feedback and logins recorded before analytics existed"""
+    with app.app_context():
+        for created_at, details in db.session.query(Scan.created_at, Scan.analysis_details).yield_per(1000):
+            if created_at is not None:
+                yield 'scans', created_at
+                if is_critical(details):
+                    yield 'critical_scans', created_at
+        for created_at, feedback_type in db.session.query(AIModelFeedback.created_at, AIModelFeedback.feedback_type).yield_per(1000):
+            if created_at is not None:
+                yield 'feedback', created_at
+                if feedback_type == 'correction':
+                    yield 'corrections', created_at
+        for (last_login,) in db.session.query(User.last_login).filter(User.last_login != None):  # noqa: E711
+            yield 'logins', last_login
+
+@app.route('/api/admin/analytics', methods=['GET'])
+@token_required
+def get_admin_analytics(current_user):
+    """Platform trends as fixed-size series (Admin only).
+    
+    `metrics` is a comma-separated subset of METRICS, `from`/`to` ISO
+    datetimes (default: the last 24 hours) and `points` the series length.
+    """
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Admin access required'}), 403
+    
+    metrics = [m for m in request.args.get('metrics', 'scans,critical_rate,correction_rate,active_users').split(',') if m]
+    unknown = [m for m in metrics if m not in METRICS]
+    if unknown or not metrics:
+        return jsonify({'success': False, 'message': f"Unknown metrics {', '.join(unknown)}; choose from {', '.join(METRICS)}"}), 400
+    points = min(max(request.args.get('points', 60, type=int), 1), 1000)
+    try:
+        end = parse_time(request.args['to']) if request.args.get('to') else datetime.utcnow()
+        start = parse_time(request.args['from']) if request.args.get('from') else end - timedelta(hours=24)
+        if start >= end:
+            raise ValueError('from must be before to')
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Invalid time range: {str(e)}'}), 400
+    
+    try:
+        timestamps, step, series, resolutions = analytics.series(metrics, start, end, points)
+        return jsonify({
+            'success': True,
+            'from': start.isoformat(),
+            'to': end.isoformat(),
+            'step_seconds': step,
+            'resolutions': resolutions,
+            'timestamps': timestamps,
+            'series': series
+        }), 200
+    except Exception as e:
+        logger.error(f"Get analytics error: {str(e)}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/admin/jobs', methods=['GET'])
+@token_required
+def list_purge_jobs(current_user):
+    """Recent background purge jobs (Admin only)"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Admin access required'}), 403
+    
+    jobs = PurgeJob.query.order_by(PurgeJob.created_at.desc()).limit(50).all()
+    return jsonify({'success': True, 'jobs': [PurgeRunner.to_dict(job) for job in jobs]}), 200
+
+@app.route('/api/admin/jobs/<job_id>', methods=['GET'])
+@token_required
+def get_purge_job(current_user, job_id):
+    """Progress of a background purge job (Admin only)"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Admin access required'}), 403
+    
+    job = PurgeJob.query.filter_by(id=job_id).first()
+    if not job:
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+    return jsonify({'success': True, 'job': PurgeRunner.to_dict(job)}), 200
+
+@app.route('/api/admin/jobs/<job_id>/resume', methods=['POST'])
+@token_required
+def resume_purge_job(current_user, job_id):
+    """Restart a failed purge job from the phase it stopped in (Admin only)"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Admin access required'}), 403
+    
+    if not purge_runner.resume(job_id):
+        return jsonify({'success': False, 'message': 'Only failed jobs can be resumed'}), 409
+    return jsonify({'success': True, 'message': 'Job resumed'}), 202
+
 @app.route('/api/scans/<scan_id>/feedback', methods=['POST'])
 @token_required
+@idempotency_keys.idempotent
 def submit_ai_feedback(current_user, scan_id):
     """Submit feedback for AI model learning"""
     data = request.get_json()
@@ -667,13 +1445,17 @@ def submit_ai_feedback(current_user, scan_id):
         )
         
         # Update scan with corrected data
-        scan.prediction = corrected_prediction
-        scan.confidence = new_confidence
+        scan_updates = {'prediction': corrected_prediction, 'confidence': new_confidence}
         if 'analysis_details' in data:
-            scan.analysis_details = json.dumps(data['analysis_details'])
+            scan_updates['analysis_details'] = json.dumps(data['analysis_details'])
         
-        db.session.add(feedback)
-        db.session.commit()
+        def work(session):
+            target = session.get(Scan, scan_id)
+            for field, value in scan_updates.items():
+                setattr(target, field, value)
+            session.add(feedback)
+        
+        run_write(work)
         
         logger.info(f"AI feedback submitted by {current_user.email} for scan {scan_id}")
         
@@ -692,7 +1474,6 @@ def submit_ai_feedback(current_user, scan_id):
         }), 200
         
     except Exception as e:
-        db.session.rollback()
         logger.error(f"AI feedback submission error: {str(e)}")
         return jsonify({'success': False, 'message': str(e)}), 500
 
@@ -704,52 +1485,52 @@ def get_ai_feedback(current_user):
         return jsonify({'success': False, 'message': 'Admin access required'}), 403
     
     try:
-        # Get feedback statistics
-        total_feedback = AIModelFeedback.query.count()
-        corrections = AIModelFeedback.query.filter_by(feedback_type='correction').count()
-        confirmations = AIModelFeedback.query.filter_by(feedback_type='confirmation').count()
-        
-        # Get recent feedback
-        recent_feedback = AIModelFeedback.query.order_by(
-            AIModelFeedback.created_at.desc()
-        ).limit(50).all()
-        
-        feedback_list = []
-        for fb in recent_feedback:
-            feedback_list.append({
-                'id': fb.id,
-                'scan_id': fb.scan_id,
-                'original_prediction': fb.original_prediction,
-                'corrected_prediction': fb.corrected_prediction,
-                'confidence_change': fb.confidence_change,
-                'feedback_type': fb.feedback_type,
-                'user_id': fb.user_id,
-                'notes': fb.notes,
-                'created_at': fb.created_at.isoformat()
-            })
-        
-        # Calculate accuracy improvements
-        accuracy_data = {}
-        if total_feedback > 0:
-            correction_rate = (corrections / total_feedback) * 100
-            accuracy_data['correction_rate'] = round(correction_rate, 2)
-            accuracy_data['improvement_potential'] = round(100 - correction_rate, 2)
-        
-        return jsonify({
-            'success': True,
-            'data': {
-                'total_feedback': total_feedback,
-                'corrections': corrections,
-                'confirmations': confirmations,
-                'accuracy_data': accuracy_data,
-                'recent_feedback': feedback_list
-            }
-        }), 200
-        
+        data = result_cache.get_or_compute('admin:ai-feedback', _ai_feedback_summary, tags=('feedback',))
+        return jsonify({'success': True, 'data': data}), 200
     except Exception as e:
         logger.error(f"Get AI feedback error: {str(e)}")
         return jsonify({'success': False, 'message': str(e)}), 500
 
+def _ai_feedback_summary():
+    # Get feedback statistics
+    total_feedback = AIModelFeedback.query.count()
+    corrections = AIModelFeedback.query.filter_by(feedback_type='correction').count()
+    confirmations = AIModelFeedback.query.filter_by(feedback_type='confirmation').count()
+    
+    # Get recent feedback
+    recent_feedback = AIModelFeedback.query.order_by(
+        AIModelFeedback.created_at.desc()
+    ).limit(50).all()
+    
+    feedback_list = []
+    for fb in recent_feedback:
+        feedback_list.append({
+            'id': fb.id,
+            'scan_id': fb.scan_id,
+            'original_prediction': fb.original_prediction,
+            'corrected_prediction': fb.corrected_prediction,
+            'confidence_change': fb.confidence_change,
+            'feedback_type': fb.feedback_type,
+            'user_id': fb.user_id,
+            'notes': fb.notes,
+            'created_at': fb.created_at.isoformat()
+        })
+    
+    # Calculate accuracy improvements
+    accuracy_data = {}
+    if total_feedback > 0:
+        correction_rate = (corrections / total_feedback) * 100
+        accuracy_data['correction_rate'] = round(correction_rate, 2)
+        accuracy_data['improvement_potential'] = round(100 - correction_rate, 2)
+    
+    return {
+        'total_feedback': total_feedback,
+        'corrections': corrections,
+        'confirmations': confirmations,
+        'accuracy_data': accuracy_data,
+        'recent_feedback': feedback_list
+    }
+
 @app.route('/api/admin/ai-model-stats', methods=['GET'])
 @token_required
 def get_ai_model_stats(current_user):
@@ -758,46 +1539,79 @@ def get_ai_model_stats(current_user):
         return jsonify({'success': False, 'message': 'Admin access required'}), 403
     
     try:
-        # Get prediction accuracy stats
-        total_scans = Scan.query.count()
-        feedback_scans = AIModelFeedback.query.distinct(AIModelFeedback.scan_id).count()
-        
-        # Get most common corrections
-        corrections = db.session.query(
-            AIModelFeedback.original_prediction,
-            AIModelFeedback.corrected_prediction,
-            db.func.count(AIModelFeedback.id).label('count')
-        ).filter_by(
-            feedback_type='correction'
-        ).group_by(
-            AIModelFeedback.original_prediction,
-            AIModelFeedback.corrected_prediction
-        ).order_by(
-            db.desc('count')
-        ).limit(10).all()
-        
-        correction_patterns = []
-        for corr in corrections:
-            correction_patterns.append({
-                'original': corr.original_prediction,
-                'corrected': corr.corrected_prediction,
-                'count': corr.count
-            })
-        
-        return jsonify({
-            'success': True,
-            'data': {
-                'total_scans': total_scans,
-                'scans_with_feedback': feedback_scans,
-                'feedback_rate': round((feedback_scans / max(total_scans, 1)) * 100, 2),
-                'correction_patterns': correction_patterns
-            }
-        }), 200
-        
+        data = result_cache.get_or_compute('admin:ai-model-stats', _ai_model_stats, tags=('scans', 'feedback'))
+        return jsonify({'success': True, 'data': data}), 200
     except Exception as e:
         logger.error(f"Get AI model stats error: {str(e)}")
         return jsonify({'success': False, 'message': str(e)}), 500
 
+def _ai_model_stats():
+    # Get prediction accuracy stats
+    total_scans = Scan.query.count()
+    feedback_scans = AIModelFeedback.query.distinct(AIModelFeedback.scan_id).count()
+    
+    # Get most common corrections
+    corrections = db.session.query(
+        AIModelFeedback.original_prediction,
+        AIModelFeedback.corrected_prediction,
+        db.func.count(AIModelFeedback.id).label('count')
+    ).filter_by(
+        feedback_type='correction'
+    ).group_by(
+        AIModelFeedback.original_prediction,
+        AIModelFeedback.corrected_prediction
+    ).order_by(
+        db.desc('count')
+    ).limit(10).all()
+    
+    correction_patterns = []
+    for corr in corrections:
+        correction_patterns.append({
+            'original': corr.original_prediction,
+            'corrected': corr.corrected_prediction,
+            'count': corr.count
+        })
+    
+    return {
+        'total_scans': total_scans,
+        'scans_with_feedback': feedback_scans,
+        'feedback_rate': round((feedback_scans / max(total_scans, 1)) * 100, 2),
+        'correction_patterns': correction_patterns
+    }
+
+@app.route('/api/admin/metrics/pool', methods=['GET'])
+@token_required
+def get_pool_metrics(current_user):
+    """Get live database connection pool gauges (Admin only)"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Admin access required'}), 403
+    
+    return jsonify({'success': True, 'data': pool_metrics.snapshot()}), 200
+
+@app.route('/api/admin/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus metrics; admin token, or METRICS_TOKEN for scrapers"""
+    metrics_token = os.environ.get('METRICS_TOKEN')
+    if metrics_token and secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {metrics_token}'):
+        return metrics_registry.response()
+    return get_admin_metrics()
+
+@token_required
+def get_admin_metrics(current_user):
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Admin access required'}), 403
+    
+    return metrics_registry.response()
+
+@app.route('/api/admin/slow-queries', methods=['GET'])
+@token_required
+def get_slow_queries(current_user):
+    """Most recent slow statements with their captured plans (Admin only)"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Admin access required'}), 403
+    
+    return jsonify({'success': True, 'data': list(reversed(slow_query_log.recent))}), 200
+
 # Health check endpoint
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -809,8 +1623,23 @@ def health_check():
 
 # Initialize database
 with app.app_context():
+    pool_metrics.instrument(db.engine)
+    pool_metrics.register_gauges(metrics_registry)
+    for engine in db.engines.values():
+        request_metrics.instrument_engine(engine)
+        slow_query_log.instrument(engine)
+    if SHARED_SQLITE_MODE:
+        apply_sqlite_pragmas(db.engine, SharedConfig.SQLITE_BUSY_TIMEOUT_MS, SharedConfig.SQLITE_MMAP_SIZE)
+        write_queue = SQLiteWriteQueue(
+            db.engine.url,
+            busy_timeout_ms=SharedConfig.SQLITE_BUSY_TIMEOUT_MS,
+            mmap_size=SharedConfig.SQLITE_MMAP_SIZE,
+            max_batch=SharedConfig.SQLITE_WRITE_BATCH_SIZE,
+            batch_window=SharedConfig.SQLITE_WRITE_BATCH_WINDOW
+        )
     try:
         db.create_all()
+        upgrade_schema(db.engine, db.metadata)
         
         # Create default admin user if no users exist
         if not User.query.first():
@@ -820,7 +1649,7 @@ with app.app_context():
             admin_user = User(
                 email=admin_email,
                 name='Administrator',
-                password_hash=generate_password_hash(admin_password),
+                password_hash=password_hasher.hash(admin_password),
                 role='admin'
             )
             db.session.add(admin_user)
@@ -829,6 +1658,15 @@ with app.app_context():
             
     except Exception as e:
         logger.error(f"Database initialization error: {str(e)}")
+    
+    # Started after the write queue so its exit-time flush runs before the queue stops
+    activity_tracker.start()
+    reset_sweeper.start()
+    idempotency_keys.store.start()
+    if replica_router.recent_writes is not None:
+        replica_router.recent_writes.start()
+    purge_runner.start()
+    analytics.start(history=analytics_history)
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5001))
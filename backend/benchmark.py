@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Backend benchmark suite for app_production.py
+
+Seeds a fresh database with N users, M scans and K feedback rows, then measures
+throughput and p50/p99 latency of the main endpoints, either through the Flask
+test client or against a real threaded HTTP server. Results are written as JSON
+and can be compared against a stored baseline with regression thresholds.
+
+Examples:
+    python benchmark.py --users 200 --scans 5000 --feedback 1000 --output bench.json
+    python benchmark.py --mode server --concurrency 8 --baseline bench_baseline.json
+    python benchmark.py --save-baseline bench_baseline.json
+    python benchmark.py --database-url postgresql://... --base-url http://localhost:5000 --concurrency 16
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+SCENARIOS = (
+    'login',
+    'get_user_scans',
+    'create_scan',
+    'get_all_users',
+    'get_backup_data',
+    'submit_ai_feedback',
+    'get_ai_model_stats',
+)
+
+BENCH_PASSWORD = 'benchmark-password'
+PREDICTIONS = ('Normal Sinus Rhythm', 'Atrial Fibrillation', 'Sinus Tachycardia', 'STEMI', 'Left Bundle Branch Block')
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def sample_analysis(prediction):
+    return {
+        'diagnosis': prediction,
+        'summary': 'Benchmark sample',
+        'recommendation': 'None',
+        'confidence': 0.9,
+        'emergencyLevel': 10,
+        'heartRateBPM': 72,
+        'isCritical': False,
+        'ecgParameters': {'hr': '72 bpm', 'rhythm': 'Regular'},
+        'annotations': [],
+        'differentialDiagnosis': [],
+        'finalAudit': {'status': 'Pass', 'rationale': 'Benchmark'}
+    }
+
+
+def seed(app_module, users, scans, feedback, rng):
+    """Bulk-insert the benchmark dataset; returns ids needed by the scenarios"""
+    from werkzeug.security import generate_password_hash
+
+    db = app_module.db
+    User, Scan, AIModelFeedback = app_module.User, app_module.Scan, app_module.AIModelFeedback
+    now = datetime.utcnow()
+
+    with app_module.app.app_context():
+        admin = User.query.filter_by(role='admin').first()
+        password_hash = generate_password_hash(BENCH_PASSWORD)
+        # Unique per run so an existing --database-url can be seeded again
+        run_tag = format(int(time.time()), 'x')
+
+        user_rows = [{
+            'id': str(uuid.uuid4()),
+            'email': f'bench{i}-{run_tag}@example.com',
+            'password_hash': password_hash,
+            'name': f'Bench User {i}',
+            'role': 'user',
+            'created_at': now,
+            'is_active': True
+        } for i in range(users)]
+        db.session.execute(db.insert(User), user_rows)
+
+        user_ids = [row['id'] for row in user_rows]
+        scan_ids = []
+        for start in range(0, scans, 1000):
+            batch = []
+            for i in range(start, min(start + 1000, scans)):
+                prediction = rng.choice(PREDICTIONS)
+                scan_id = str(uuid.uuid4())
+                scan_ids.append(scan_id)
+                batch.append({
+                    'id': scan_id,
+                    'user_id': rng.choice(user_ids),
+                    'patient_name': f'Patient {i}',
+                    'patient_age': rng.randint(18, 90),
+                    'patient_gender': rng.choice(('Male', 'Female')),
+                    'prediction': prediction,
+                    'confidence': round(rng.uniform(0.5, 1.0), 3),
+                    'analysis_details': json.dumps(sample_analysis(prediction)),
+                    'created_at': now - timedelta(minutes=i),
+                    'updated_at': now - timedelta(minutes=i)
+                })
+            db.session.execute(db.insert(Scan), batch)
+
+        feedback_rows = [{
+            'id': str(uuid.uuid4()),
+            'scan_id': rng.choice(scan_ids),
+            'original_prediction': rng.choice(PREDICTIONS),
+            'corrected_prediction': rng.choice(PREDICTIONS),
+            'confidence_change': 0.0,
+            'feedback_type': rng.choice(('correction', 'confirmation')),
+            'user_id': admin.id,
+            'notes': '',
+            'created_at': now
+        } for _ in range(feedback if scan_ids else 0)]
+        if feedback_rows:
+            db.session.execute(db.insert(AIModelFeedback), feedback_rows)
+
+        db.session.commit()
+        return {'admin_id': admin.id, 'admin_email': admin.email, 'user_ids': user_ids,
+                'user_emails': [row['email'] for row in user_rows], 'scan_ids': scan_ids}
+
+
+def issue_token(app_module, user_id):
+    import jwt
+    app = app_module.app
+    return jwt.encode({'user_id': user_id, 'exp': datetime.utcnow() + timedelta(hours=1)},
+                      app.config['SECRET_KEY'], algorithm='HS256')
+
+
+class TestClientTransport:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, token=None, body=None):
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        response = self.client.open(path, method=method, json=body, headers=headers)
+        response.get_data()
+        return response.status_code
+
+
+class HTTPTransport:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, path, token=None, body=None):
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=120) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+
+def build_requests(name, fixtures, tokens, rng):
+    """Return a zero-argument function producing (method, path, token, body) for one call"""
+    user_ids = fixtures['user_ids']
+    admin_token = tokens[fixtures['admin_id']]
+
+    def pick_user():
+        return tokens[rng.choice(user_ids)]
+
+    if name == 'login':
+        return lambda: ('POST', '/api/login', None,
+                        {'email': rng.choice(fixtures['user_emails']), 'password': BENCH_PASSWORD})
+    if name == 'get_user_scans':
+        return lambda: ('GET', '/api/scans', pick_user(), None)
+    if name == 'create_scan':
+        return lambda: ('POST', '/api/scans', pick_user(), {
+            'patient_name': 'Benchmark Patient', 'patient_age': 50, 'patient_gender': 'Male',
+            'prediction': 'Normal Sinus Rhythm', 'confidence': 0.9,
+            'analysis_details': sample_analysis('Normal Sinus Rhythm')
+        })
+    if name == 'get_all_users':
+        return lambda: ('GET', '/api/admin/users', admin_token, None)
+    if name == 'get_backup_data':
+        return lambda: ('GET', '/api/admin/backup', admin_token, None)
+    if name == 'submit_ai_feedback':
+        return lambda: ('POST', f"/api/scans/{rng.choice(fixtures['scan_ids'])}/feedback", admin_token,
+                        {'corrected_prediction': rng.choice(PREDICTIONS), 'feedback_type': 'correction'})
+    if name == 'get_ai_model_stats':
+        return lambda: ('GET', '/api/admin/ai-model-stats', admin_token, None)
+    raise ValueError(f'Unknown scenario: {name}')
+
+
+def run_scenario(transport, make_request, requests_count, concurrency, warmup):
+    for _ in range(warmup):
+        transport.request(*make_request())
+
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one_call(_):
+        nonlocal errors
+        method, path, token, body = make_request()
+        started = time.perf_counter()
+        status = transport.request(method, path, token, body)
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if status >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(one_call, range(requests_count)))
+    else:
+        for i in range(requests_count):
+            one_call(i)
+    wall = time.perf_counter() - started
+
+    return {
+        'requests': requests_count,
+        'errors': errors,
+        'throughput_rps': round(requests_count / wall, 2) if wall else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 3) if latencies else 0.0,
+    }
+
+
+def compare(results, baseline, max_regression):
+    """Return a list of human-readable regressions beyond the threshold"""
+    failures = []
+    for name, current in results['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous:
+            continue
+        for metric in ('p50_ms', 'p99_ms'):
+            if previous[metric] and current[metric] > previous[metric] * (1 + max_regression):
+                failures.append(f"{name}: {metric} {current[metric]} > baseline {previous[metric]} (+{max_regression:.0%})")
+        if previous['throughput_rps'] and current['throughput_rps'] < previous['throughput_rps'] * (1 - max_regression):
+            failures.append(f"{name}: throughput {current['throughput_rps']} < baseline {previous['throughput_rps']} (-{max_regression:.0%})")
+        if current['errors'] > previous.get('errors', 0):
+            failures.append(f"{name}: {current['errors']} errors (baseline {previous.get('errors', 0)})")
+    return failures
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the ECG Scanner backend')
+    parser.add_argument('--users', type=int, default=100, help='users to seed (N)')
+    parser.add_argument('--scans', type=int, default=2000, help='scans to seed (M)')
+    parser.add_argument('--feedback', type=int, default=500, help='feedback rows to seed (K)')
+    parser.add_argument('--requests', type=int, default=200, help='measured requests per scenario')
+    parser.add_argument('--warmup', type=int, default=5, help='unmeasured requests per scenario')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='comma-separated scenarios to run')
+    parser.add_argument('--mode', choices=('client', 'server'), default='client',
+                        help='Flask test client, or a real threaded HTTP server on localhost')
+    parser.add_argument('--base-url', help='benchmark an already running server instead; it must share '
+                        '--database-url and SECRET_KEY with this process')
+    parser.add_argument('--concurrency', type=int, default=1, help='parallel callers (server mode)')
+    parser.add_argument('--database-url', help='database to seed (default: a fresh temporary SQLite file)')
+    parser.add_argument('--seed', type=int, default=42, help='random seed for reproducible data and request mix')
+    parser.add_argument('--output', default='benchmark_results.json', help='where to write results')
+    parser.add_argument('--baseline', help='baseline JSON to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.25,
+                        help='allowed relative regression vs. baseline (0.25 = 25%%)')
+    parser.add_argument('--save-baseline', help='also write the results to this baseline path')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    for name in scenarios:
+        if name not in SCENARIOS:
+            print(f"Unknown scenario '{name}'. Choose from: {', '.join(SCENARIOS)}")
+            return 2
+
+    workdir = tempfile.mkdtemp(prefix='ecg_bench_')
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ['DATABASE_URL'] = database_url
+    os.environ.setdefault('SLOW_QUERY_LOG', os.path.join(workdir, 'slow_queries.log'))
+    # Every benchmark call comes from one address; auth throttling would turn them into 429s
+    os.environ.setdefault('RATE_LIMIT_ENABLED', 'false')
+    os.environ.setdefault('IDEMPOTENCY_STORE', 'memory')
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app_production
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    rng = random.Random(args.seed)
+    print(f"Seeding {args.users} users, {args.scans} scans, {args.feedback} feedback rows into {database_url}")
+    seed_started = time.perf_counter()
+    fixtures = seed(app_production, args.users, args.scans, args.feedback, rng)
+    seed_seconds = time.perf_counter() - seed_started
+
+    tokens = {user_id: issue_token(app_production, user_id) for user_id in fixtures['user_ids']}
+    tokens[fixtures['admin_id']] = issue_token(app_production, fixtures['admin_id'])
+
+    server = None
+    if args.base_url:
+        args.mode = 'server'
+        transport = HTTPTransport(args.base_url)
+    elif args.mode == 'server':
+        from werkzeug.serving import make_server
+        server = make_server('127.0.0.1', 0, app_production.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        transport = HTTPTransport(f'http://127.0.0.1:{server.server_port}')
+    else:
+        transport = TestClientTransport(app_production.app)
+
+    results = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'mode': args.mode,
+            'concurrency': args.concurrency if args.mode == 'server' else 1,
+            'users': args.users,
+            'scans': args.scans,
+            'feedback': args.feedback,
+            'requests': args.requests,
+            'seed': args.seed,
+            'database': database_url.split(':', 1)[0],
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed_seconds': round(seed_seconds, 3)
+        },
+        'results': {}
+    }
+
+    try:
+        for name in scenarios:
+            make_request = build_requests(name, fixtures, tokens, rng)
+            concurrency = args.concurrency if args.mode == 'server' else 1
+            stats = run_scenario(transport, make_request, args.requests, concurrency, args.warmup)
+            results['results'][name] = stats
+            print(f"{name:<20} {stats['throughput_rps']:>9.1f} req/s  p50 {stats['p50_ms']:>9.2f} ms  "
+                  f"p99 {stats['p99_ms']:>9.2f} ms  errors {stats['errors']}")
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        failures = compare(results, baseline, args.max_regression)
+        if failures:
+            print('Regressions against baseline:')
+            for failure in failures:
+                print(f'  - {failure}')
+            return 1
+        print('No regressions against baseline.')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
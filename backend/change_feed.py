@@ -0,0 +1,149 @@
+import logging
+from sqlalchemy import bindparam, event, func, select, update
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeFeed:
+    """Per-user change log for one model, so devices sync only what changed.
+
+    Every insert or update of a row gives it the owner's next version, and
+    every delete leaves a tombstone carrying one. Versions come from a counter
+    on the owner row (`sync_version`), bumped in the same transaction as the
+    change; the UPDATE locks that row until commit, so a user's changes commit
+    in version order and a reader never sees version n+1 without n.
+
+    Bulk deletes that bypass the ORM (history purges) leave no tombstones.
+    They call mark_reset() instead, and devices whose cursor predates the
+    reset are sent a full listing to replace their local copy.
+    """
+
+    def __init__(self, db, owner_model, model, tombstone_model, run_write):
+        self.db = db
+        self.owner_model = owner_model
+        self.model = model
+        self.tombstone_model = tombstone_model
+        self.run_write = run_write
+
+    def install(self):
+        event.listen(Session, 'before_flush', self._before_flush)
+        return self
+
+    def _allocate(self, session, owner_id, count):
+        """Reserve `count` versions for owner_id; returns the first"""
+        owners = self.owner_model.__table__
+        conn = session.connection()
+        conn.execute(update(owners).where(owners.c.id == owner_id)
+                     .values(sync_version=func.coalesce(owners.c.sync_version, 0) + count))
+        last = conn.execute(select(owners.c.sync_version).where(owners.c.id == owner_id)).scalar()
+        return last - count + 1
+
+    def _before_flush(self, session, flush_context, instances):
+        changed = {}
+        for obj in list(session.new) + list(session.dirty):
+            if isinstance(obj, self.model) and (obj in session.new or session.is_modified(obj)):
+                changed.setdefault(obj.user_id, []).append(obj)
+        for obj in session.deleted:
+            if isinstance(obj, self.model):
+                tombstone = self.tombstone_model(user_id=obj.user_id, record_id=obj.id)
+                session.add(tombstone)
+                changed.setdefault(obj.user_id, []).append(tombstone)
+        for owner_id, objs in changed.items():
+            version = self._allocate(session, owner_id, len(objs))
+            for obj in objs:
+                obj.version = version
+                version += 1
+
+    def backfill(self, owner_id):
+        """Version rows written without one (by releases before the change feed)"""
+        model = self.model
+        ids = [row[0] for row in self.db.session.query(model.id)
+               .filter(model.user_id == owner_id, model.version == None)  # noqa: E711
+               .order_by(model.created_at)]
+        if not ids:
+            return 0
+
+        def work(session):
+            first = self._allocate(session, owner_id, len(ids))
+            session.execute(update(model.__table__).where(model.__table__.c.id == bindparam('row_id'))
+                            .values(version=bindparam('row_version')),
+                            [{'row_id': row_id, 'row_version': first + i} for i, row_id in enumerate(ids)])
+
+        self.run_write(work)
+        logger.info(f"Assigned sync versions to {len(ids)} rows for user {owner_id}")
+        return len(ids)
+
+    def mark_reset(self, session, owner_id=None):
+        """Force a full resync for one owner (or all), after rows vanished without tombstones"""
+        owners = self.owner_model.__table__
+        bumped = func.coalesce(owners.c.sync_version, 0) + 1
+        statement = update(owners).values(sync_version=bumped, sync_reset_version=bumped)
+        if owner_id is not None:
+            statement = statement.where(owners.c.id == owner_id)
+        session.execute(statement)
+        # Tombstones older than the reset are never served again
+        tombstones = self.tombstone_model.__table__
+        session.execute(tombstones.delete().where(tombstones.c.version < select(owners.c.sync_reset_version)
+                                                  .where(owners.c.id == tombstones.c.user_id)
+                                                  .scalar_subquery()))
+
+    def changes(self, owner, since, limit, resume=None):
+        """Rows changed and ids deleted after version `since`, oldest first.
+
+        Returns (rows, deleted_ids, cursor, has_more, reset, resume); pass
+        cursor as the next `since`. When reset is set, the device replaces its
+        copy with the rows returned. A full listing longer than `limit` is
+        paged with the resume token instead, since the rows it lists can be
+        older than the reset: its pages keep cursor at `since` and are passed
+        back with resume, and only the final page moves the cursor past the
+        reset. A further reset while paging restarts the listing.
+
+        Call on the primary: the cursor is derived from the owner's counter,
+        which a lagging replica could be behind.
+        """
+        model = self.model
+        tombstone_model = self.tombstone_model
+        current = owner.sync_version or 0
+        if self.backfill(owner.id):
+            current = self.db.session.query(self.owner_model.sync_version).filter_by(id=owner.id).scalar()
+        reset_version = owner.sync_reset_version or 0
+        listing = since < reset_version or since > current
+        after = self._resume_after(resume, reset_version) if listing else None
+        if listing:
+            # Rows only: a fresh listing needs no tombstones
+            entries = [(row.version, row, None) for row in model.query
+                       .filter(model.user_id == owner.id, model.version > (after or 0))
+                       .order_by(model.version).limit(limit + 1)]
+        elif since == current:
+            return [], [], current, False, False, None
+        else:
+            entries = [(row.version, row, None) for row in model.query
+                       .filter(model.user_id == owner.id, model.version > since)
+                       .order_by(model.version).limit(limit + 1)]
+            entries += [(t.version, None, t.record_id) for t in tombstone_model.query
+                        .filter(tombstone_model.user_id == owner.id, tombstone_model.version > since)
+                        .order_by(tombstone_model.version).limit(limit + 1)]
+            entries.sort(key=lambda entry: entry[0])
+
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+        rows = [row for _, row, _ in entries if row is not None]
+        deleted = [record_id for _, row, record_id in entries if row is None]
+        # Only the first page of a listing tells the device to drop its copy
+        reset = listing and after is None
+        if listing and has_more:
+            return rows, deleted, since, True, reset, f'{reset_version}:{entries[-1][0]}'
+        if has_more:
+            return rows, deleted, entries[-1][0], True, reset, None
+        cursor = max([current, 0 if listing else since] + [entry[0] for entry in entries[-1:]])
+        return rows, deleted, cursor, False, reset, None
+
+    @staticmethod
+    def _resume_after(resume, reset_version):
+        """Last version sent by the listing `resume` continues; None to start over"""
+        try:
+            token_reset, after = (int(part) for part in str(resume).split(':'))
+        except ValueError:
+            return None
+        return after if token_reset == reset_version else None
@@ -0,0 +1,66 @@
+import atexit
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ExpirySweeper:
+    """Periodically deletes dead rows of one model in small batches.
+
+    Each batch selects up to batch_size primary keys matching condition() and
+    deletes them in its own short write transaction, pausing between batches
+    so request writers are never locked out for long.
+    """
+
+    def __init__(self, app, db, model, condition, run_write, interval=300.0, batch_size=500, pause=0.05):
+        self.app = app
+        self.db = db
+        self.model = model
+        self.condition = condition
+        self.run_write = run_write
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self._stopped = threading.Event()
+        self._thread = None
+        self.deleted_total = 0
+        self.last_run = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f'sweeper-{self.model.__tablename__}', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def sweep(self):
+        """Delete every matching row, one batch at a time; returns the number deleted"""
+        deleted = 0
+        model = self.model
+        while not self._stopped.is_set():
+            with self.app.app_context():
+                ids = [row[0] for row in self.db.session.query(model.id).filter(self.condition()).limit(self.batch_size)]
+                if ids:
+                    self.run_write(lambda session: session.query(model).filter(model.id.in_(ids))
+                                   .delete(synchronize_session=False))
+            deleted += len(ids)
+            self.deleted_total += len(ids)
+            if len(ids) < self.batch_size:
+                break
+            time.sleep(self.pause)
+        self.last_run = time.time()
+        return deleted
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                deleted = self.sweep()
+                if deleted:
+                    logger.info(f"Swept {deleted} expired rows from {self.model.__tablename__}")
+            except Exception as e:
+                logger.error(f"Sweep of {self.model.__tablename__} failed: {str(e)}")
@@ -0,0 +1,93 @@
+import hashlib
+import logging
+import time
+from functools import wraps
+from flask import g, jsonify, make_response, request
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyKeys:
+    """Makes POST handlers safe to retry with an Idempotency-Key header.
+
+    The first request with a key claims it in the TTL store (add() is atomic,
+    also across workers sharing a SQLite store), runs the handler and stores
+    the response. A retry within `ttl` gets that response back without the
+    handler running again; a duplicate arriving while the first is still in
+    flight waits up to `wait_timeout` for its result. Server errors release
+    the key so the client can retry for real.
+    """
+
+    def __init__(self, store, ttl=86400, lock_ttl=60, wait_timeout=10.0, poll_interval=0.05):
+        self.store = store
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.replayed = 0
+
+    def _scope(self, key):
+        # Keys are per user and endpoint; only a digest is stored
+        scope = f"{g.get('current_user_id')}:{request.method}:{request.path}:{key}"
+        return hashlib.sha256(scope.encode('utf-8')).hexdigest()
+
+    def _wait(self, scope):
+        deadline = time.time() + self.wait_timeout
+        while True:
+            entry = self.store.get(scope)
+            if entry is None or entry['state'] == 'done' or time.time() >= deadline:
+                return entry
+            time.sleep(self.poll_interval)
+
+    def _replay(self, entry, fingerprint):
+        if entry['fingerprint'] != fingerprint:
+            return jsonify({'success': False, 'message': f'{HEADER} was already used with a different request'}), 422
+        self.replayed += 1
+        response = make_response(entry['body'], entry['status'])
+        response.mimetype = entry['mimetype']
+        response.headers['Idempotent-Replayed'] = 'true'
+        return response
+
+    def idempotent(self, f):
+        """Decorator for views below @token_required"""
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            key = request.headers.get(HEADER)
+            if not key:
+                return f(*args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return jsonify({'success': False, 'message': f'{HEADER} is too long'}), 400
+
+            scope = self._scope(key)
+            fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+
+            while not self.store.add(scope, {'state': 'pending', 'fingerprint': fingerprint}, self.lock_ttl):
+                entry = self._wait(scope)
+                if entry is None:
+                    continue  # The first request failed and released the key; claim it
+                if entry['state'] == 'done':
+                    return self._replay(entry, fingerprint)
+                response = jsonify({'success': False, 'message': 'A request with this key is still in progress'})
+                response.headers['Retry-After'] = '1'
+                return response, 409
+
+            try:
+                response = make_response(f(*args, **kwargs))
+            except Exception:
+                self.store.delete(scope)
+                raise
+            if response.status_code >= 500:
+                self.store.delete(scope)
+            else:
+                self.store.set(scope, {
+                    'state': 'done',
+                    'fingerprint': fingerprint,
+                    'status': response.status_code,
+                    'mimetype': response.mimetype,
+                    'body': response.get_data(as_text=True)
+                }, self.ttl)
+            return response
+        return decorated
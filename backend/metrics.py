@@ -0,0 +1,166 @@
+import threading
+import time
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """Thread-safe histograms, counters and callback gauges in Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._callbacks = []
+
+    def histogram(self, name, help_text, buckets):
+        with self._lock:
+            self._histograms.setdefault(name, (help_text, tuple(buckets), {}))
+
+    def counter(self, name, help_text):
+        with self._lock:
+            self._counters.setdefault(name, (help_text, {}))
+
+    def callback(self, name, help_text, fn, kind='gauge'):
+        """fn() returns a number, a {labels_tuple: number} dict, or None to skip"""
+        with self._lock:
+            self._callbacks.append((name, help_text, fn, kind))
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            _, buckets, series = self._histograms[name]
+            state = series.get(key)
+            if state is None:
+                state = series[key] = [[0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def inc(self, name, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters[name][1]
+            series[key] = series.get(key, 0) + value
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, (help_text, buckets, series) in sorted(self._histograms.items()):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for key, (counts, total, count) in sorted(series.items()):
+                    cumulative = 0
+                    for bound, bucket_count in zip(buckets, counts):
+                        cumulative += bucket_count
+                        lines.append(f'{name}_bucket{_format_labels(key + (("le", _format_value(float(bound))),))} {cumulative}')
+                    lines.append(f'{name}_bucket{_format_labels(key + (("le", "+Inf"),))} {count}')
+                    lines.append(f'{name}_sum{_format_labels(key)} {_format_value(total)}')
+                    lines.append(f'{name}_count{_format_labels(key)} {count}')
+
+            for name, (help_text, series) in sorted(self._counters.items()):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} counter')
+                for key, value in sorted(series.items()):
+                    lines.append(f'{name}{_format_labels(key)} {_format_value(value)}')
+
+            callbacks = list(self._callbacks)
+
+        for name, help_text, fn, kind in callbacks:
+            value = fn()
+            if value is None:
+                continue
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            if isinstance(value, dict):
+                for key, item in sorted(value.items()):
+                    lines.append(f'{name}{_format_labels(key)} {_format_value(item)}')
+            else:
+                lines.append(f'{name} {_format_value(value)}')
+
+        return '\n'.join(lines) + '\n'
+
+    def response(self):
+        return Response(self.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+class RequestMetrics:
+    """Per-request latency, SQL count/time and response size, labelled by route"""
+
+    def __init__(self, registry):
+        self.registry = registry
+        registry.histogram('http_request_duration_seconds', 'Request latency by route and status.', LATENCY_BUCKETS)
+        registry.histogram('http_request_db_queries', 'SQL statements executed per request.', QUERY_COUNT_BUCKETS)
+        registry.histogram('http_request_db_seconds', 'Time spent in SQL per request.', LATENCY_BUCKETS)
+        registry.histogram('http_response_size_bytes', 'Response body size.', SIZE_BUCKETS)
+        registry.counter('http_requests_total', 'Requests by route and status.')
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def instrument_engine(self, engine):
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - conn.info['metrics_query_start'].pop()
+            if has_request_context() and 'metrics_start' in g:
+                g.metrics_db_queries += 1
+                g.metrics_db_seconds += elapsed
+
+        @event.listens_for(engine, 'handle_error')
+        def handle_error(exception_context):
+            conn = exception_context.connection
+            if conn is not None and conn.info.get('metrics_query_start'):
+                conn.info['metrics_query_start'].pop()
+
+    def _before_request(self):
+        g.metrics_start = time.perf_counter()
+        g.metrics_db_queries = 0
+        g.metrics_db_seconds = 0.0
+
+    def _after_request(self, response):
+        if 'metrics_start' not in g:
+            return response
+
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        status = str(response.status_code)
+        elapsed = time.perf_counter() - g.metrics_start
+
+        self.registry.observe('http_request_duration_seconds', elapsed, method=request.method, route=route, status=status)
+        self.registry.observe('http_request_db_queries', g.metrics_db_queries, method=request.method, route=route)
+        self.registry.observe('http_request_db_seconds', g.metrics_db_seconds, method=request.method, route=route)
+        self.registry.inc('http_requests_total', method=request.method, route=route, status=status)
+
+        # Streamed bodies have no length up front
+        if not response.is_streamed and response.content_length is not None:
+            self.registry.observe('http_response_size_bytes', response.content_length, method=request.method, route=route)
+        return response
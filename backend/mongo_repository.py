@@ -0,0 +1,267 @@
+import uuid
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING, MongoClient, UpdateOne
+from storage_repository import StorageRepository
+
+# Feedback is stored on its scan and only read through the feedback queries
+SCAN_PROJECTION = {'feedback': False}
+# Listing scans for the history view never needs the full analysis payload
+SCAN_SUMMARY_PROJECTION = {'analysis_details': False, 'feedback': False}
+USER_PUBLIC_PROJECTION = {'password_hash': False}
+
+
+def _record(document):
+    """Mongo document -> repository record ('_id' becomes 'id')"""
+    if document is None:
+        return None
+    record = dict(document)
+    record['id'] = record.pop('_id')
+    return record
+
+
+class MongoRepository(StorageRepository):
+    """StorageRepository backed by MongoDB.
+
+    Scans keep their AnalysisResult as a native sub-document, so reads return
+    it without a JSON decode. AI feedback is embedded in a 'feedback' array on
+    its scan: recording it and applying the correction is then one
+    single-document update, which MongoDB applies atomically without needing
+    a replica set for transactions.
+    """
+
+    def __init__(self, database):
+        self.db = database
+        self.users = database['users']
+        self.scans = database['scans']
+        self.resets = database['password_resets']
+
+    @classmethod
+    def from_config(cls, config, client=None):
+        """Build from MongoConfig (or any object with MONGO_URI / MONGO_DATABASE)"""
+        client = client or MongoClient(config.MONGO_URI, tz_aware=False)
+        repository = cls(client[config.MONGO_DATABASE])
+        repository.ensure_indexes()
+        return repository
+
+    def ensure_indexes(self):
+        self.users.create_index([('email', ASCENDING)], unique=True)
+        self.scans.create_index([('user_id', ASCENDING), ('created_at', DESCENDING)])
+        self.scans.create_index([('feedback.created_at', DESCENDING)])
+        self.scans.create_index([('feedback.user_id', ASCENDING)])
+        self.resets.create_index([
+            ('email', ASCENDING), ('reset_code', ASCENDING), ('used', ASCENDING), ('expires_at', ASCENDING)
+        ])
+        self.resets.create_index([('user_id', ASCENDING)])
+        # Let MongoDB drop reset codes a day after they expire
+        self.resets.create_index([('expires_at', ASCENDING)], expireAfterSeconds=86400)
+
+    # Users
+    def create_user(self, email, name, password_hash, role='user'):
+        document = {
+            '_id': str(uuid.uuid4()),
+            'email': email.lower(),
+            'password_hash': password_hash,
+            'name': name,
+            'role': role,
+            'created_at': datetime.utcnow(),
+            'is_active': True,
+            'last_login': None
+        }
+        self.users.insert_one(document)
+        return _record(document)
+
+    def get_user(self, user_id):
+        return _record(self.users.find_one({'_id': user_id}))
+
+    def get_user_by_email(self, email):
+        return _record(self.users.find_one({'email': email.lower()}))
+
+    def list_users(self, exclude_email=None):
+        query = {'email': {'$ne': exclude_email}} if exclude_email else {}
+        counts = {
+            row['_id']: row['count']
+            for row in self.scans.aggregate([{'$group': {'_id': '$user_id', 'count': {'$sum': 1}}}])
+        }
+        users = []
+        for document in self.users.find(query, USER_PUBLIC_PROJECTION):
+            user = _record(document)
+            user['scan_count'] = counts.get(user['id'], 0)
+            users.append(user)
+        return users
+
+    def update_user(self, user_id, **fields):
+        return self.users.update_one({'_id': user_id}, {'$set': fields}).matched_count > 0
+
+    def bulk_update_users(self, updates):
+        if not updates:
+            return 0
+        result = self.users.bulk_write(
+            [UpdateOne({'_id': user_id}, {'$set': fields}) for user_id, fields in updates.items()],
+            ordered=False
+        )
+        return result.matched_count
+
+    def delete_user(self, user_id):
+        self.scans.delete_many({'user_id': user_id})
+        self.scans.update_many({'feedback.user_id': user_id}, {'$pull': {'feedback': {'user_id': user_id}}})
+        self.resets.delete_many({'user_id': user_id})
+        return self.users.delete_one({'_id': user_id}).deleted_count > 0
+
+    # Scans
+    def _scan_document(self, user_id, fields):
+        now = datetime.utcnow()
+        return {
+            '_id': fields.get('id') or str(uuid.uuid4()),
+            'user_id': user_id,
+            'patient_name': fields.get('patient_name'),
+            'patient_age': fields.get('patient_age'),
+            'patient_gender': fields.get('patient_gender'),
+            'file_name': fields.get('file_name'),
+            'file_url': fields.get('file_url'),
+            'prediction': fields.get('prediction'),
+            'confidence': fields.get('confidence'),
+            'analysis_details': fields.get('analysis_details') or {},
+            'created_at': fields.get('created_at') or now,
+            'updated_at': fields.get('updated_at') or now,
+            'feedback': []
+        }
+
+    def create_scan(self, user_id, **fields):
+        document = self._scan_document(user_id, fields)
+        self.scans.insert_one(document)
+        return _record(document)
+
+    def bulk_create_scans(self, scans):
+        documents = [self._scan_document(scan['user_id'], scan) for scan in scans]
+        if not documents:
+            return 0
+        return len(self.scans.insert_many(documents, ordered=False).inserted_ids)
+
+    def get_scan(self, scan_id):
+        return _record(self.scans.find_one({'_id': scan_id}, SCAN_PROJECTION))
+
+    def list_scans(self, user_id, include_details=True):
+        projection = SCAN_PROJECTION if include_details else SCAN_SUMMARY_PROJECTION
+        cursor = self.scans.find({'user_id': user_id}, projection).sort('created_at', DESCENDING)
+        return [_record(document) for document in cursor]
+
+    def update_scan(self, scan_id, **fields):
+        fields['updated_at'] = datetime.utcnow()
+        return self.scans.update_one({'_id': scan_id}, {'$set': fields}).matched_count > 0
+
+    def delete_scan(self, scan_id, user_id=None):
+        query = {'_id': scan_id}
+        if user_id is not None:
+            query['user_id'] = user_id
+        return self.scans.delete_one(query).deleted_count > 0
+
+    def delete_user_scans(self, user_id=None):
+        return self.scans.delete_many({} if user_id is None else {'user_id': user_id}).deleted_count
+
+    def count_scans(self):
+        return self.scans.estimated_document_count()
+
+    # AI feedback
+    def add_feedback(self, scan_id, user_id, corrected_prediction, feedback_type='correction',
+                     notes='', new_confidence=None, analysis_details=None):
+        while True:
+            scan = self.scans.find_one({'_id': scan_id}, {'prediction': True, 'confidence': True})
+            if scan is None:
+                return None
+
+            original_confidence = scan.get('confidence') or 0.0
+            confidence = original_confidence if new_confidence is None else new_confidence
+            entry = {
+                'id': str(uuid.uuid4()),
+                'original_prediction': scan.get('prediction'),
+                'corrected_prediction': corrected_prediction,
+                'confidence_change': confidence - original_confidence,
+                'feedback_type': feedback_type,
+                'user_id': user_id,
+                'notes': notes,
+                'created_at': datetime.utcnow()
+            }
+
+            scan_update = {'prediction': corrected_prediction, 'confidence': confidence, 'updated_at': datetime.utcnow()}
+            if analysis_details is not None:
+                scan_update['analysis_details'] = analysis_details
+
+            # Only applies if the scan still has the prediction read above; a concurrent
+            # correction makes this retry, so original_prediction is never stale
+            result = self.scans.update_one(
+                {'_id': scan_id, 'prediction': scan.get('prediction'), 'confidence': scan.get('confidence')},
+                {'$set': scan_update, '$push': {'feedback': entry}}
+            )
+            if result.matched_count:
+                return dict(entry, scan_id=scan_id)
+
+    def _feedback(self, *stages):
+        """Aggregate over the feedback entries of all scans, each with its scan_id"""
+        return self.scans.aggregate([
+            {'$match': {'feedback.0': {'$exists': True}}},
+            {'$unwind': '$feedback'},
+            *stages
+        ])
+
+    def feedback_summary(self, recent_limit=50):
+        counts = {
+            row['_id']: row['count']
+            for row in self._feedback({'$group': {'_id': '$feedback.feedback_type', 'count': {'$sum': 1}}})
+        }
+        with_feedback = list(self.scans.aggregate([
+            {'$match': {'feedback.0': {'$exists': True}}},
+            {'$count': 'scans'}
+        ]))
+        recent = self._feedback(
+            {'$sort': {'feedback.created_at': DESCENDING}},
+            {'$limit': recent_limit},
+            {'$project': {'feedback': True}}
+        ) if recent_limit else []
+        return {
+            'total_feedback': sum(counts.values()),
+            'corrections': counts.get('correction', 0),
+            'confirmations': counts.get('confirmation', 0),
+            'scans_with_feedback': with_feedback[0]['scans'] if with_feedback else 0,
+            'recent_feedback': [dict(row['feedback'], scan_id=row['_id']) for row in recent]
+        }
+
+    def correction_patterns(self, limit=10):
+        rows = self._feedback(
+            {'$match': {'feedback.feedback_type': 'correction'}},
+            {'$group': {
+                '_id': {'original': '$feedback.original_prediction', 'corrected': '$feedback.corrected_prediction'},
+                'count': {'$sum': 1}
+            }},
+            {'$sort': {'count': -1}},
+            {'$limit': limit}
+        )
+        return [
+            {'original': row['_id']['original'], 'corrected': row['_id']['corrected'], 'count': row['count']}
+            for row in rows
+        ]
+
+    # Password resets
+    def create_reset(self, user_id, email, reset_code, expires_at):
+        document = {
+            '_id': str(uuid.uuid4()),
+            'user_id': user_id,
+            'email': email.lower(),
+            'reset_code': reset_code,
+            'expires_at': expires_at,
+            'used': False,
+            'created_at': datetime.utcnow()
+        }
+        self.resets.insert_one(document)
+        return _record(document)
+
+    def find_active_reset(self, email, reset_code=None, now=None):
+        query = {'email': email.lower(), 'used': False, 'expires_at': {'$gt': now or datetime.utcnow()}}
+        if reset_code is not None:
+            query['reset_code'] = reset_code
+        return _record(self.resets.find_one(query))
+
+    def mark_resets_used(self, email):
+        return self.resets.update_many({'email': email.lower(), 'used': False}, {'$set': {'used': True}}).modified_count
+
+    def delete_reset(self, reset_id):
+        return self.resets.delete_one({'_id': reset_id}).deleted_count > 0
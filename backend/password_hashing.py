@@ -0,0 +1,75 @@
+import atexit
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HashingUnavailable(Exception):
+    """The hashing pool is saturated or a hash did not finish in time"""
+
+
+class PasswordHasher:
+    """Runs password hashing on a small bounded thread pool.
+
+    scrypt and PBKDF2 release the GIL, so a few workers hash in parallel while
+    request threads only wait. Once max_pending hashes are queued or running,
+    further calls fail fast with HashingUnavailable instead of piling up.
+    """
+
+    def __init__(self, method='scrypt', workers=None, max_pending=None, timeout=10.0):
+        self.method = method
+        self.workers = workers or max(1, (os.cpu_count() or 2) // 2)
+        self.max_pending = max_pending or self.workers * 8
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+        # werkzeug expands defaults ('scrypt' -> 'scrypt:32768:8:1'); compare stored hashes against that form
+        self.parameters = generate_password_hash('', method).split('$', 1)[0]
+        atexit.register(self.shutdown)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            method=config.get('PASSWORD_HASH_METHOD', 'scrypt'),
+            workers=config.get('PASSWORD_HASH_WORKERS'),
+            max_pending=config.get('PASSWORD_HASH_MAX_PENDING'),
+            timeout=config.get('PASSWORD_HASH_TIMEOUT', 10.0),
+        )
+
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingUnavailable('Password hashing queue is full')
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def submit_hash(self, password):
+        return self._submit(generate_password_hash, password, self.method)
+
+    def submit_verify(self, password_hash, password):
+        return self._submit(check_password_hash, password_hash, password)
+
+    def _wait(self, future):
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise HashingUnavailable('Password hashing timed out')
+
+    def hash(self, password):
+        return self._wait(self.submit_hash(password))
+
+    def verify(self, password_hash, password):
+        return self._wait(self.submit_verify(password_hash, password))
+
+    def needs_rehash(self, password_hash):
+        """True when a stored hash was made with different method or work-factor parameters"""
+        return password_hash.split('$', 1)[0] != self.parameters
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
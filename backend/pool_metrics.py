@@ -0,0 +1,77 @@
+import threading
+import time
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+
+class PoolMetrics:
+    """Live connection-pool gauges for an SQLAlchemy engine"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pool = None
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def instrument(self, engine):
+        """Wrap the engine's pool so every checkout records its wait time"""
+        pool = engine.pool
+        connect = pool.connect
+
+        def timed_connect():
+            started = time.perf_counter()
+            try:
+                return connect()
+            except PoolTimeoutError:
+                with self._lock:
+                    self.timeouts += 1
+                raise
+            finally:
+                waited = time.perf_counter() - started
+                with self._lock:
+                    self.checkouts += 1
+                    self.wait_total += waited
+                    self.wait_max = max(self.wait_max, waited)
+
+        pool.connect = timed_connect
+        self._pool = pool
+        return self
+
+    def snapshot(self):
+        """Current gauges plus cumulative checkout wait statistics"""
+        pool = self._pool
+        size = pool.size() if hasattr(pool, 'size') else None
+        overflow = pool.overflow() if hasattr(pool, 'overflow') else None
+
+        with self._lock:
+            checkouts = self.checkouts
+            data = {
+                'pool_class': type(pool).__name__ if pool is not None else None,
+                'size': size,
+                'checked_out': pool.checkedout() if hasattr(pool, 'checkedout') else None,
+                'checked_in': pool.checkedin() if hasattr(pool, 'checkedin') else None,
+                # QueuePool counts overflow from -pool_size; only report real overflow connections
+                'overflow': max(overflow, 0) if overflow is not None else None,
+                'max_overflow': getattr(pool, '_max_overflow', None),
+                'checkouts_total': checkouts,
+                'checkout_timeouts_total': self.timeouts,
+                'wait_seconds_total': round(self.wait_total, 6),
+                'wait_seconds_avg': round(self.wait_total / checkouts, 6) if checkouts else 0.0,
+                'wait_seconds_max': round(self.wait_max, 6),
+            }
+        return data
+
+    def register_gauges(self, registry):
+        """Publish the snapshot through a MetricsRegistry"""
+        metrics = (
+            ('db_pool_size', 'size', 'Configured pool size.', 'gauge'),
+            ('db_pool_checked_out', 'checked_out', 'Connections currently checked out.', 'gauge'),
+            ('db_pool_overflow', 'overflow', 'Overflow connections currently open.', 'gauge'),
+            ('db_pool_checkouts_total', 'checkouts_total', 'Connection checkouts.', 'counter'),
+            ('db_pool_checkout_timeouts_total', 'checkout_timeouts_total', 'Checkouts that timed out waiting.', 'counter'),
+            ('db_pool_wait_seconds_total', 'wait_seconds_total', 'Time spent waiting for a connection.', 'counter'),
+            ('db_pool_wait_seconds_max', 'wait_seconds_max', 'Longest single checkout wait.', 'gauge'),
+        )
+        for name, key, help_text, kind in metrics:
+            registry.callback(name, help_text, lambda key=key: self.snapshot()[key], kind)
@@ -0,0 +1,223 @@
+import atexit
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('pending', 'running')
+
+
+class LeaseLost(Exception):
+    """Another worker has taken over the job"""
+
+
+class PurgeRunner:
+    """Runs persisted bulk-delete jobs on a background thread.
+
+    A job kind is a list of phases (name, model, condition(job)[, dependents])
+    executed in order, e.g. feedback before the scans it references, plus an optional
+    on_complete(session, job) run in the transaction that marks it completed. Each batch deletes up
+    to batch_size rows and records progress on the job row in the same short
+    transaction, so a job interrupted by a restart resumes where it stopped.
+    Jobs are claimed with a lease, so with several workers only one runs a job,
+    and a job whose worker died is picked up again once its lease expires.
+
+    A job never returns to a finished phase, so rows referencing a batch that
+    were added after their own phase ran would block its delete on a foreign
+    key. `dependents` lists (model, column) pairs whose rows referencing the
+    batch's ids (column IN ids) are deleted first in the same transaction.
+
+    total_count is every phase's row count when the job is submitted, raised
+    if a phase finds rows added since, and deleted_count counts rows deleted
+    by the phases themselves, so progress stays within the total. Dependent
+    rows are counted in dependent_count.
+    """
+
+    def __init__(self, app, db, job_model, run_write, batch_size=500, pause=0.05, lease_seconds=60, poll_interval=30):
+        self.app = app
+        self.db = db
+        self.job_model = job_model
+        self.run_write = run_write
+        self.batch_size = batch_size
+        self.pause = pause
+        self.lease = timedelta(seconds=lease_seconds)
+        self.poll_interval = poll_interval
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{id(self):x}'
+        self.plans = {}
+        self.completion_hooks = {}
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def register(self, kind, phases, on_complete=None):
+        self.plans[kind] = phases
+        if on_complete is not None:
+            self.completion_hooks[kind] = on_complete
+
+    def submit(self, kind, created_by, target_id=None):
+        """Persist a new job and queue it; returns the job"""
+        job = self.job_model(kind=kind, target_id=target_id, created_by=created_by, status='pending',
+                             phase=self.plans[kind][0][0], deleted_count=0, dependent_count=0,
+                             created_at=datetime.utcnow())
+        job.total_count = sum(self.db.session.query(model.id).filter(condition(job)).count()
+                              for _, model, condition, *_ in self.plans[kind])
+        self.run_write(lambda session: session.add(job))
+        self._queue.put(job.id)
+        return job
+
+    def resume(self, job_id):
+        """Re-queue a failed job from the phase it stopped in"""
+        job_model = self.job_model
+        updated = self.run_write(lambda session: session.query(job_model)
+                                 .filter(job_model.id == job_id, job_model.status == 'failed')
+                                 .update({'status': 'pending', 'error': None, 'claimed_until': None},
+                                         synchronize_session=False))
+        if updated:
+            self._queue.put(job_id)
+        return bool(updated)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='purge-jobs', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._queue.put(None)
+
+    def _write(self, work):
+        with self.app.app_context():
+            return self.run_write(work)
+
+    def _claimable(self):
+        job_model = self.job_model
+        with self.app.app_context():
+            return [row[0] for row in self.db.session.query(job_model.id)
+                    .filter(job_model.status.in_(ACTIVE_STATUSES),
+                            self.db.or_(job_model.claimed_until == None,  # noqa: E711
+                                        job_model.claimed_until < datetime.utcnow()))
+                    .order_by(job_model.created_at)]
+
+    def _run(self):
+        # Anything left unfinished by a previous process is picked up first
+        pending = self._claimable()
+        while not self._stopped.is_set():
+            if pending:
+                job_id = pending.pop(0)
+            else:
+                try:
+                    job_id = self._queue.get(timeout=self.poll_interval)
+                except queue.Empty:
+                    pending = self._claimable()
+                    continue
+            if job_id is None:
+                break
+            try:
+                self._execute(job_id)
+            except LeaseLost:
+                logger.info(f"Purge job {job_id} was taken over by another worker")
+            except Exception as e:
+                logger.error(f"Purge job {job_id} failed: {str(e)}")
+                self._finish(job_id, 'failed', error=str(e))
+
+    def _claim(self, session, job_id, changes=None):
+        """Extend this worker's lease on the job; returns False if another worker holds it"""
+        job_model = self.job_model
+        now = datetime.utcnow()
+        values = {'claimed_until': now + self.lease, 'updated_at': now}
+        values.update(changes or {})
+        return session.query(job_model).filter(
+            job_model.id == job_id,
+            job_model.status.in_(ACTIVE_STATUSES),
+            self.db.or_(job_model.claimed_until == None, job_model.claimed_until < now,  # noqa: E711
+                        job_model.claimed_by == self.worker_id)
+        ).update(dict(values, claimed_by=self.worker_id), synchronize_session=False) == 1
+
+    def _execute(self, job_id):
+        if not self._write(lambda session: self._claim(session, job_id, {'status': 'running'})):
+            return
+
+        with self.app.app_context():
+            job = self.db.session.get(self.job_model, job_id)
+            self.db.session.expunge(job)
+
+        phases = self.plans[job.kind]
+        names = [phase[0] for phase in phases]
+        start = names.index(job.phase) if job.phase in names else 0
+
+        for name, model, condition, *rest in phases[start:]:
+            dependents = rest[0] if rest else ()
+            while not self._stopped.is_set():
+                with self.app.app_context():
+                    ids = [row[0] for row in self.db.session.query(model.id).filter(condition(job)).limit(self.batch_size)]
+
+                def work(session, ids=ids, name=name, model=model, dependents=dependents):
+                    if not self._claim(session, job_id, {'phase': name}):
+                        raise LeaseLost(job_id)
+                    if ids:
+                        cascaded = sum(session.query(dependent).filter(column.in_(ids)).delete(synchronize_session=False)
+                                       for dependent, column in dependents)
+                        deleted = session.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
+                        job_model = self.job_model
+                        done = job_model.deleted_count + deleted
+                        session.query(job_model).filter_by(id=job_id).update({
+                            'deleted_count': done,
+                            # Rows that matched a phase after the job was submitted raise the total
+                            'total_count': self.db.case((job_model.total_count < done, done),
+                                                        else_=job_model.total_count),
+                            'dependent_count': self.db.func.coalesce(job_model.dependent_count, 0) + cascaded
+                        }, synchronize_session=False)
+
+                self._write(work)
+                if len(ids) < self.batch_size:
+                    break
+                time.sleep(self.pause)
+
+            if self._stopped.is_set():
+                return  # Lease expires and the job resumes from this phase
+
+        self._finish(job_id, 'completed', on_complete=self.completion_hooks.get(job.kind), job=job)
+        logger.info(f"Purge job {job_id} ({job.kind}) completed")
+
+    def _finish(self, job_id, status, error=None, on_complete=None, job=None):
+        now = datetime.utcnow()
+
+        def work(session):
+            if on_complete is not None:
+                on_complete(session, job)
+            session.query(self.job_model).filter_by(id=job_id).update({
+                'status': status, 'error': error, 'claimed_until': None, 'updated_at': now,
+                'finished_at': now if status == 'completed' else None
+            }, synchronize_session=False)
+
+        self._write(work)
+
+    @staticmethod
+    def to_dict(job):
+        progress = None
+        if job.total_count:
+            progress = round(min(job.deleted_count / job.total_count, 1.0), 4)
+        elif job.status == 'completed':
+            progress = 1.0
+        return {
+            'id': job.id,
+            'kind': job.kind,
+            'target_id': job.target_id,
+            'status': job.status,
+            'phase': job.phase,
+            'deleted_count': job.deleted_count,
+            'total_count': job.total_count,
+            'dependent_count': job.dependent_count or 0,
+            'progress': progress,
+            'error': job.error,
+            'created_at': job.created_at.isoformat() if job.created_at else None,
+            'updated_at': job.updated_at.isoformat() if job.updated_at else None,
+            'finished_at': job.finished_at.isoformat() if job.finished_at else None
+        }
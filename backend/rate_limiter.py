@@ -0,0 +1,194 @@
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+from flask import jsonify, request
+
+logger = logging.getLogger(__name__)
+
+
+def parse_rate(value):
+    """'20/60' -> (20, 60.0): at most 20 requests per 60 seconds"""
+    limit, window = str(value).split('/', 1)
+    return int(limit), float(window)
+
+
+def _slide(entry, index):
+    """Roll a (window_index, previous_count, current_count) entry forward to `index`"""
+    if entry is None:
+        return 0, 0
+    entry_index, previous, current = entry[0], entry[1], entry[2]
+    if entry_index == index:
+        return previous, current
+    if entry_index == index - 1:
+        return current, 0
+    return 0, 0
+
+
+class MemoryRateStore:
+    """Per-process counters: one small tuple per active key, swept periodically"""
+
+    def __init__(self, sweep_interval=60.0):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._sweep_interval = sweep_interval
+        self._next_sweep = time.time() + sweep_interval
+
+    def update(self, key, fn, now):
+        with self._lock:
+            new_entry, result = fn(self._entries.get(key))
+            self._entries[key] = new_entry
+            if now >= self._next_sweep:
+                self._entries = {k: v for k, v in self._entries.items() if v[3] > now}
+                self._next_sweep = now + self._sweep_interval
+            return result
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteRateStore:
+    """Counters in a SQLite file so every worker on the host shares the same limits"""
+
+    def __init__(self, path, sweep_interval=60.0, busy_timeout_ms=5000):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._sweep_interval = sweep_interval
+        self._next_sweep = 0.0
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS rate_limit ('
+            'key TEXT PRIMARY KEY, window_index INTEGER, previous INTEGER, current INTEGER, expires_at REAL)'
+        )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=self.busy_timeout_ms / 1000.0)
+            conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+            self._local.conn = conn
+        return conn
+
+    def update(self, key, fn, now):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT window_index, previous, current, expires_at FROM rate_limit WHERE key = ?', (key,)
+            ).fetchone()
+            new_entry, result = fn(row)
+            conn.execute('INSERT OR REPLACE INTO rate_limit VALUES (?, ?, ?, ?, ?)', (key, *new_entry))
+            if now >= self._next_sweep:
+                conn.execute('DELETE FROM rate_limit WHERE expires_at <= ?', (now,))
+                self._next_sweep = now + self._sweep_interval
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return result
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM rate_limit').fetchone()[0]
+
+
+class SlidingWindowLimit:
+    """Sliding-window counter: the previous window's count is weighted by how
+    much of it still overlaps the sliding window, which approximates a true
+    sliding log with two integers per key."""
+
+    def __init__(self, name, limit, window, store):
+        self.name = name
+        self.limit = limit
+        self.window = window
+        self.store = store
+
+    def hit(self, key, now=None):
+        """Count one request for key; returns seconds to wait if it is over the limit, else None"""
+        now = now if now is not None else time.time()
+        index = int(now // self.window)
+        elapsed = (now % self.window) / self.window
+
+        def apply(entry):
+            previous, current = _slide(entry, index)
+            expires_at = (index + 2) * self.window
+            if previous * (1 - elapsed) + current >= self.limit:
+                return (index, previous, current, expires_at), self._retry_after(previous, current, elapsed)
+            return (index, previous, current + 1, expires_at), None
+
+        return self.store.update(f'{self.name}:{key}', apply, now)
+
+    def _retry_after(self, previous, current, elapsed):
+        if current < self.limit and previous:
+            # Wait until enough of the previous window has slid out
+            target = 1 - (self.limit - current) / previous
+            return max(1, math.ceil((target - elapsed) * self.window))
+        # The current window alone is full: wait for it to become the previous one
+        return max(1, math.ceil((1 - elapsed) * self.window))
+
+
+class RateLimiter:
+    """Named rules, each limited per client IP and per account"""
+
+    def __init__(self, store=None, trust_proxy=False, enabled=True):
+        self.store = store if store is not None else MemoryRateStore()
+        self.trust_proxy = trust_proxy
+        self.enabled = enabled
+        self.rules = {}
+        self.rejected = 0
+
+    @classmethod
+    def from_config(cls, config):
+        store_path = config.get('RATE_LIMIT_STORE')
+        return cls(
+            store=SQLiteRateStore(os.path.abspath(store_path)) if store_path else MemoryRateStore(),
+            trust_proxy=config.get('RATE_LIMIT_TRUST_PROXY', False),
+            enabled=config.get('RATE_LIMIT_ENABLED', True),
+        )
+
+    def add_rule(self, name, per_ip=None, per_account=None):
+        self.rules[name] = (
+            SlidingWindowLimit(f'{name}:ip', *parse_rate(per_ip), self.store) if per_ip else None,
+            SlidingWindowLimit(f'{name}:account', *parse_rate(per_account), self.store) if per_account else None,
+        )
+
+    def client_ip(self):
+        if self.trust_proxy and request.access_route:
+            return request.access_route[0]
+        return request.remote_addr or 'unknown'
+
+    def check(self, name, account=None, ip=None):
+        """Count a request against rule `name`; returns seconds to wait, or None if allowed.
+        `ip` defaults to the current Flask request's client"""
+        if not self.enabled:
+            return None
+        ip_limit, account_limit = self.rules[name]
+        if ip_limit is not None:
+            retry_after = ip_limit.hit(ip if ip is not None else self.client_ip())
+            if retry_after is not None:
+                return retry_after
+        if account_limit is not None and account:
+            return account_limit.hit(account.strip().lower())
+        return None
+
+    def limit(self, name, account_field='email'):
+        """Decorator rejecting over-limit requests with 429 before the view runs"""
+        def decorator(f):
+            @wraps(f)
+            def decorated(*args, **kwargs):
+                data = request.get_json(silent=True)
+                account = data.get(account_field) if isinstance(data, dict) else None
+                retry_after = self.check(name, account if isinstance(account, str) else None)
+                if retry_after is not None:
+                    self.rejected += 1
+                    logger.warning(f"Rate limit '{name}' exceeded from {self.client_ip()}")
+                    response = jsonify({'success': False, 'message': 'Too many attempts. Please try again later.'})
+                    response.headers['Retry-After'] = str(retry_after)
+                    return response, 429
+                return f(*args, **kwargs)
+            return decorated
+        return decorator
@@ -0,0 +1,127 @@
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import current_app, g, has_app_context, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+from ttl_store import ttl_store_from_url
+
+logger = logging.getLogger(__name__)
+
+_force_primary = ContextVar('force_primary', default=False)
+
+READ_METHODS = ('GET', 'HEAD')
+
+# Zero when the standby has replayed everything it received, otherwise the age
+# of the last replayed transaction. NULL on a primary.
+POSTGRES_LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+@contextmanager
+def primary_reads():
+    """Keep reads on the primary, e.g. for auth checks that must see the latest state"""
+    token = _force_primary.set(True)
+    try:
+        yield
+    finally:
+        _force_primary.reset(token)
+
+
+class RoutingSession(Session):
+    """Session that sends plain SELECTs to the replica bind when the router allows it"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and getattr(clause, 'is_select', False) and has_app_context():
+            router = current_app.extensions.get('replica_router')
+            if router is not None:
+                engine = router.read_engine()
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReplicaRouter:
+    """Decides per read whether the replica bind may serve it.
+
+    Reads go to the replica for GET requests when the replica's lag is within
+    REPLICA_MAX_STALENESS seconds, except for users who wrote within
+    READ_YOUR_WRITES_WINDOW seconds, who read from the primary. Recent writers
+    are kept in the TTL store named by READ_YOUR_WRITES_STORE: a SQLite file
+    lets every worker on the host see them, while 'memory' only covers writes
+    handled by the same process. Across hosts, route each user to one host.
+    """
+
+    def __init__(self, app=None, db=None):
+        self.db = db
+        self.recent_writes = None
+        self._lag = None
+        self._lag_checked_at = 0.0
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.db = db
+        self.max_staleness = app.config.get('REPLICA_MAX_STALENESS', 5)
+        self.read_your_writes_window = app.config.get('READ_YOUR_WRITES_WINDOW', 10)
+        self.lag_check_interval = app.config.get('REPLICA_LAG_CHECK_INTERVAL', 5)
+        if 'replica' in app.config.get('SQLALCHEMY_BINDS', {}):
+            # Started with the app's other background workers
+            self.recent_writes = ttl_store_from_url(app.config.get('READ_YOUR_WRITES_STORE', 'memory'))
+        app.extensions['replica_router'] = self
+        app.after_request(self._after_request)
+
+    def record_write(self, user_id):
+        if self.recent_writes is not None:
+            self.recent_writes.set(f'wrote:{user_id}', True, self.read_your_writes_window)
+
+    def wrote_recently(self, user_id):
+        return self.recent_writes is not None and self.recent_writes.get(f'wrote:{user_id}') is not None
+
+    def replica_lag(self, engine):
+        """Replica lag in seconds, cached for REPLICA_LAG_CHECK_INTERVAL; None if unreachable"""
+        now = time.monotonic()
+        if now - self._lag_checked_at < self.lag_check_interval:
+            return self._lag
+
+        lag = 0.0
+        if engine.dialect.name == 'postgresql':
+            try:
+                with engine.connect() as conn:
+                    lag = float(conn.execute(POSTGRES_LAG_QUERY).scalar() or 0.0)
+            except Exception as e:
+                logger.warning(f"Replica lag check failed, reading from primary: {str(e)}")
+                lag = None
+
+        self._lag, self._lag_checked_at = lag, now
+        return lag
+
+    def read_engine(self):
+        """The replica engine if this read may use it, otherwise None"""
+        engine = self.db.engines.get('replica')
+        if engine is None or _force_primary.get():
+            return None
+
+        if not has_request_context() or request.method not in READ_METHODS:
+            return None
+        user_id = g.get('current_user_id')
+        if user_id:
+            # Looked up once per request rather than for every SELECT
+            if g.get('replica_user_id') != user_id:
+                g.replica_user_id, g.replica_wrote_recently = user_id, self.wrote_recently(user_id)
+            if g.replica_wrote_recently:
+                return None
+
+        lag = self.replica_lag(engine)
+        if lag is None or lag > self.max_staleness:
+            return None
+        return engine
+
+    def _after_request(self, response):
+        user_id = g.get('current_user_id')
+        if user_id and request.method not in READ_METHODS + ('OPTIONS',) and response.status_code < 400:
+            self.record_write(user_id)
+        return response
@@ -0,0 +1,299 @@
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from html import escape
+
+try:
+    from weasyprint import HTML as WeasyHTML
+except ImportError:  # PDF reports are optional: pip install weasyprint
+    WeasyHTML = None
+
+logger = logging.getLogger(__name__)
+
+# Bump when the templates change so cached reports are re-rendered
+TEMPLATE_VERSION = 1
+FORMATS = {'html': 'text/html', 'pdf': 'application/pdf'}
+
+# Same layout as services/htmlExportService.ts, so server and browser exports match
+REPORT_STYLES = """
+    <style>
+        body { font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, "Helvetica Neue", Arial, sans-serif; line-height: 1.6; color: #212529; background-color: #f8f9fa; margin: 0; padding: 0; }
+        .container { max-width: 800px; margin: 20px auto; background-color: #ffffff; border: 1px solid #dee2e6; border-radius: 8px; padding: 40px; }
+        .page-break { page-break-after: always; }
+        .report-header { text-align: center; border-bottom: 1px solid #e9ecef; padding-bottom: 20px; margin-bottom: 30px; }
+        .report-header h1 { font-size: 28px; font-weight: bold; margin: 0; }
+        .section { margin-bottom: 30px; }
+        .section h2 { font-size: 20px; font-weight: bold; border-bottom: 1px solid #e9ecef; padding-bottom: 8px; margin-bottom: 15px; }
+        .grid { display: grid; grid-template-columns: 180px 1fr; gap: 10px 20px; }
+        .grid .label { font-weight: bold; }
+        .recommendation { font-weight: bold; }
+        .recommendation.critical { color: #dc3545; }
+        .recommendation.normal { color: #198754; }
+        .ecg-image { width: 100%; max-width: 100%; display: block; border: 1px solid #e9ecef; border-radius: 4px; margin-top: 10px; }
+        .archive-title { text-align: center; margin-bottom: 40px; border-bottom: 2px solid #ccc; padding-bottom: 20px; }
+        .notes { background-color: #e9ecef; padding: 15px; border-radius: 4px; border-left: 4px solid #0d6efd; }
+        .findings-list { list-style: none; padding-left: 0; }
+        .finding-item { background-color: #f8f9fa; border: 1px solid #dee2e6; border-radius: 4px; padding: 10px; margin-bottom: 10px; }
+        .finding-item .label { font-weight: bold; color: #0d6efd; }
+    </style>
+"""
+
+PARAMETERS = (
+    ('Heart Rate', 'hr'), ('Rhythm', 'rhythm'), ('Axis', 'axis'), ('PR Interval', 'prInterval'),
+    ('QRS Complex', 'qrsComplex'), ('QT/QTc Interval', 'qtInterval'), ('ST Deviations', 'stDeviations'),
+    ('T-Wave Abnormalities', 'tWaveAbnormalities'), ('Other Findings', 'otherFindings'),
+)
+
+
+class PdfUnavailable(Exception):
+    """PDF output needs the optional weasyprint package"""
+
+
+def _e(value):
+    return '' if value is None else escape(str(value))
+
+
+def report_payload(scan, image_link=None):
+    """Everything a report needs from a Scan row, as plain (picklable) data.
+
+    The image is embedded unless image_link is given: then the report points
+    at that relative path instead ('' for no image), e.g. a file next to it
+    in an archive, and the image data is never loaded.
+    """
+    try:
+        details = json.loads(scan.analysis_details) if scan.analysis_details else {}
+    except ValueError:
+        details = {}
+    details = details if isinstance(details, dict) else {}
+    patient = details.get('patientInfo') or {}
+    image = (getattr(scan, 'image_data', None) or scan.file_url) if image_link is None else image_link or None
+    return {
+        'id': scan.id,
+        'updated_at': (scan.updated_at or scan.created_at).isoformat(),
+        'timestamp': scan.created_at.isoformat() if scan.created_at else None,
+        'patient': {
+            'name': patient.get('name') or scan.patient_name,
+            'id': patient.get('id'),
+            'age': patient.get('age') or scan.patient_age,
+            'gender': patient.get('gender') or scan.patient_gender,
+            'symptoms': patient.get('symptoms'),
+        },
+        'result': dict(details, diagnosis=details.get('diagnosis') or scan.prediction),
+        'image': image,
+        'linked_image': image_link is not None,
+    }
+
+
+def _image_src(payload):
+    # Only inline images, web URLs or a linked relative file, never e.g. javascript: links
+    image = payload.get('image')
+    if not isinstance(image, str):
+        return None
+    if payload.get('linked_image'):
+        return image if ':' not in image and not image.startswith('/') else None
+    return image if image.startswith(('data:image/', 'http://', 'https://')) else None
+
+
+def _report_body(payload):
+    patient, result = payload['patient'], payload['result']
+    parts = ['<div class="report-header"><h1>ECG Analysis Report</h1></div>']
+    when = datetime.fromisoformat(payload['timestamp']).strftime('%Y-%m-%d %H:%M UTC') if payload['timestamp'] else ''
+    parts.append(
+        '<section class="section"><h2>Patient Details</h2><div class="grid">'
+        f'<span class="label">Patient Name:</span><span>{_e(patient["name"])}</span>'
+        f'<span class="label">Patient ID:</span><span>{_e(patient["id"])}</span>'
+        f'<span class="label">Age:</span><span>{_e(patient["age"])}</span>'
+        f'<span class="label">Gender:</span><span>{_e(patient["gender"])}</span>'
+        f'<span class="label">Report Date:</span><span>{_e(when)}</span>'
+        '</div></section>'
+    )
+    if patient.get('symptoms'):
+        parts.append(f'<section class="section"><h2>Clinical Notes / Symptoms</h2><p class="notes">{_e(patient["symptoms"])}</p></section>')
+
+    recommendation_class = 'critical' if result.get('isCritical') else 'normal'
+    parts.append(
+        '<section class="section"><h2>Analysis Summary</h2>'
+        f'<p><strong>Diagnosis:</strong> {_e(result.get("diagnosis"))}</p>'
+        f'<p>{_e(result.get("summary"))}</p>'
+        f'<p class="recommendation {recommendation_class}"><strong>Recommendation:</strong> {_e(result.get("recommendation"))}</p>'
+        '</section>'
+    )
+    annotations = [a for a in result.get('annotations') or [] if isinstance(a, dict)]
+    if annotations:
+        items = ''.join(f'<li class="finding-item"><span class="label">{_e(a.get("label"))}</span><p>{_e(a.get("description"))}</p></li>'
+                        for a in annotations)
+        parts.append(f'<section class="section"><h2>Key Findings</h2><ul class="findings-list">{items}</ul></section>')
+
+    parameters = result.get('ecgParameters')
+    if isinstance(parameters, dict):
+        rows = ''.join(f'<span class="label">{label}:</span><span>{_e(parameters.get(key))}</span>' for label, key in PARAMETERS)
+        parts.append(f'<section class="section"><h2>ECG Parameters</h2><div class="grid">{rows}</div></section>')
+
+    src = _image_src(payload)
+    if src:
+        parts.append(f'<section class="section"><h2>Scanned Image</h2>'
+                     f'<img src="{_e(src)}" alt="ECG for {_e(patient["name"])}" class="ecg-image" /></section>')
+    return ''.join(parts)
+
+
+def _document(title, body):
+    return (f'<!DOCTYPE html><html lang="en"><head><meta charset="UTF-8"><title>{_e(title)}</title>'
+            f'{REPORT_STYLES}</head><body>{body}</body></html>')
+
+
+def render_single_html(payload):
+    return _document(f'ECG Report: {payload["patient"]["name"]}',
+                     f'<div class="container">{_report_body(payload)}</div>')
+
+
+def render_history_html(title, payloads):
+    reports = ''.join(f'<div class="container page-break">{_report_body(payload)}</div>' for payload in payloads)
+    header = (f'<div class="container"><div class="archive-title"><h1>ECG Scan History Report</h1>'
+              f'<p style="font-size: 1.5rem; margin-top: 8px;">User: {_e(title)}</p></div></div>')
+    return _document(f'ECG History Report for {title}', header + reports)
+
+
+def render_report(kind, fmt, args):
+    """Render to bytes; runs in a pool worker, so it only takes plain data"""
+    html = render_single_html(*args) if kind == 'single' else render_history_html(*args)
+    if fmt == 'pdf':
+        if WeasyHTML is None:
+            raise PdfUnavailable('PDF reports need the weasyprint package')
+        return WeasyHTML(string=html).write_pdf()
+    return html.encode('utf-8')
+
+
+class ReportRenderer:
+    """Renders reports in a process pool and caches the files on disk.
+
+    A single-scan report is cached under the scan id and its updated_at, so
+    it is re-rendered only after the scan changes; a multi-scan report under
+    a digest of every included scan's id and updated_at. Concurrent requests
+    for the same report in one worker share one render, and the cache is
+    trimmed to max_cache_bytes, least recently used first.
+
+    The process pool's workers are forked in the constructor, so create the
+    renderer before the app starts any threads: a fork taken while another
+    thread holds a lock (logging, a connection pool) leaves that lock held
+    forever in the child.
+    """
+
+    def __init__(self, cache_dir, workers=None, max_cache_bytes=512 * 1024 * 1024, timeout=120.0):
+        self.cache_dir = cache_dir
+        self.max_cache_bytes = max_cache_bytes
+        self.timeout = timeout
+        os.makedirs(cache_dir, exist_ok=True)
+        if 'fork' in multiprocessing.get_all_start_methods():
+            if threading.active_count() > 1:
+                logger.warning(f"Forking the report pool with {threading.active_count() - 1} other threads running; "
+                               f"create the renderer before starting background workers")
+            self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'))
+            # A fork pool starts all its workers on the first submit
+            self._executor.submit(os.getpid).result()
+        else:
+            # Spawned workers would re-run the app module on import; render on threads instead
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='report')
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.rendered = 0
+        self.cache_hits = 0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            config['REPORT_CACHE_DIR'],
+            workers=config.get('REPORT_WORKERS') or None,
+            max_cache_bytes=int(config.get('REPORT_CACHE_MAX_MB', 512) * 1024 * 1024),
+        )
+
+    @staticmethod
+    def pdf_available():
+        return WeasyHTML is not None
+
+    def _version(self, *parts):
+        return hashlib.sha256('|'.join(str(part) for part in (TEMPLATE_VERSION,) + parts).encode('utf-8')).hexdigest()[:16]
+
+    def single(self, payload, fmt):
+        """Path of the rendered report for one scan payload"""
+        # Each format, and embedded- and linked-image reports, are cached side by side
+        prefix = f"{payload['id']}-{fmt}-{'linked' if payload.get('linked_image') else 'inline'}-"
+        name = f"{prefix}{self._version(payload['updated_at'], payload['image'] if payload.get('linked_image') else '')}.{fmt}"
+        return self._get(name, 'single', fmt, (payload,), stale_prefix=prefix)
+
+    def history(self, title, payloads, fmt):
+        """Path of one report covering several scans"""
+        digest = self._version(title, *(f"{p['id']}@{p['updated_at']}" for p in payloads))
+        return self._get(f'history-{digest}.{fmt}', 'history', fmt, (title, payloads))
+
+    def _get(self, name, kind, fmt, args, stale_prefix=None):
+        if fmt == 'pdf' and not self.pdf_available():
+            raise PdfUnavailable('PDF reports need the weasyprint package')
+        path = os.path.join(self.cache_dir, name)
+        if os.path.exists(path):
+            os.utime(path)  # Recently used: trimmed last
+            self.cache_hits += 1
+            return path
+
+        with self._lock:
+            stored = self._inflight.get(name)
+            leader = stored is None
+            if leader:
+                stored = self._inflight[name] = Future()
+        if not leader:
+            return stored.result(self.timeout)
+
+        try:
+            data = self._executor.submit(render_report, kind, fmt, args).result(self.timeout)
+            self._store(path, data, stale_prefix)
+        except Exception as e:
+            logger.error(f"Rendering report {name} failed: {str(e)}")
+            stored.set_exception(e)
+            raise
+        else:
+            stored.set_result(path)
+            return path
+        finally:
+            with self._lock:
+                self._inflight.pop(name, None)
+
+    def _store(self, path, data, stale_prefix):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.rendered += 1
+        if stale_prefix:
+            # Older versions of this scan's report are never served again
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.startswith(stale_prefix) and entry.path != path:
+                    self._remove(entry.path)
+        self._trim()
+
+    def _trim(self):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_cache_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
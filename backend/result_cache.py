@@ -0,0 +1,131 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """One in-progress computation that concurrent misses wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResultCache:
+    """In-process cache of computed results with TTLs and tag invalidation.
+
+    Each entry remembers the version of every tag it depends on when its
+    computation started; invalidate(tag) bumps the version, so stale entries
+    are skipped on the next read without scanning the cache. Concurrent
+    misses on one key compute it once (single flight) and the cache holds at
+    most max_entries, dropping the least recently used.
+
+    Invalidation is per process: other workers see a change once their
+    entries expire, so the TTL bounds cross-worker staleness.
+    """
+
+    def __init__(self, max_entries=256, default_ttl=30.0, wait_timeout=30.0):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.wait_timeout = wait_timeout
+        self._entries = OrderedDict()
+        self._tag_versions = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.collapsed = 0
+
+    def invalidate(self, *tags):
+        with self._lock:
+            for tag in tags:
+                self._tag_versions[tag] = self._tag_versions.get(tag, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _fresh(self, entry, now):
+        expires_at, versions, _ = entry
+        return expires_at > now and all(self._tag_versions.get(tag, 0) == version for tag, version in versions)
+
+    def get_or_compute(self, key, compute, tags=(), ttl=None):
+        """Cached result for key, calling compute() on a miss. Results are shared: don't mutate them."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._fresh(entry, time.time()):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                versions = tuple((tag, self._tag_versions.get(tag, 0)) for tag in tags)
+                self.misses += 1
+            else:
+                self.collapsed += 1
+
+        if not leader:
+            if not flight.done.wait(self.wait_timeout):
+                raise TimeoutError(f'Timed out waiting for {key}')
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            value = compute()
+        except Exception as e:
+            flight.error = e
+            raise
+        else:
+            flight.value = value
+            with self._lock:
+                self._entries[key] = (time.time() + (ttl if ttl is not None else self.default_ttl), versions, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    def watch(self, tags_by_model):
+        """Invalidate tags when the ORM writes their models.
+
+        Tags are invalidated when a flush (or ORM bulk UPDATE/DELETE) touches
+        a model, so no read caches the old rows under the new version, and
+        again on commit, so a read between flush and commit can't either.
+        """
+        def tags_for(objects):
+            return {tag for obj in objects for model, tag in tags_by_model.items() if isinstance(obj, model)}
+
+        def touched(session, tags):
+            if tags:
+                self.invalidate(*tags)
+                session.info.setdefault('result_cache_tags', set()).update(tags)
+
+        def after_flush(session, flush_context):
+            touched(session, tags_for(list(session.new) + list(session.dirty) + list(session.deleted)))
+
+        def after_bulk(orm_execute_state):
+            if orm_execute_state.is_update or orm_execute_state.is_delete:
+                touched(orm_execute_state.session, {tags_by_model[mapper.class_] for mapper in orm_execute_state.all_mappers
+                                                    if mapper.class_ in tags_by_model})
+
+        def after_commit(session):
+            tags = session.info.pop('result_cache_tags', None)
+            if tags:
+                self.invalidate(*tags)
+
+        event.listen(Session, 'after_flush', after_flush)
+        event.listen(Session, 'do_orm_execute', after_bulk)
+        event.listen(Session, 'after_commit', after_commit)
+        return self
@@ -0,0 +1,117 @@
+import base64
+import binascii
+import logging
+import re
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 256 * 1024
+IMAGE_EXTENSIONS = {'image/png': 'png', 'image/jpeg': 'jpg', 'image/jpg': 'jpg', 'image/gif': 'gif',
+                    'image/webp': 'webp', 'image/bmp': 'bmp', 'image/svg+xml': 'svg'}
+# Already compressed: deflating them again only costs CPU
+STORED_EXTENSIONS = {'png', 'jpg', 'gif', 'webp'}
+_WHITESPACE = re.compile(rb'\s+')
+
+
+class _Pipe:
+    """Write-only file for ZipFile that hands written bytes back to the generator.
+
+    It is not seekable, so ZipFile writes each entry's sizes and CRC in a
+    data descriptor after its data instead of seeking back to the header.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ZipStream:
+    """Builds a ZIP archive as an iterator of bytes, one entry at a time.
+
+    Entry data is passed as an iterable of chunks and each compressed chunk
+    is yielded as soon as it is produced, so memory use does not grow with
+    the size of the archive or of its entries (ZipFile only keeps a small
+    record per entry for the central directory written at the end).
+    """
+
+    def __init__(self):
+        self._pipe = _Pipe()
+        self._zip = zipfile.ZipFile(self._pipe, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True)
+
+    def entry(self, name, chunks, date_time=None, compress=True):
+        info = zipfile.ZipInfo(name, date_time=(date_time.timetuple()[:6] if date_time else (1980, 1, 1, 0, 0, 0)))
+        info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+        info.external_attr = 0o644 << 16
+        # Sizes are unknown up front; ZIP64 headers keep entries over 2 GiB valid
+        with self._zip.open(info, 'w', force_zip64=True) as f:
+            for chunk in chunks:
+                f.write(chunk)
+                data = self._pipe.drain()
+                if data:
+                    yield data
+        yield self._pipe.drain()
+
+    def close(self):
+        self._zip.close()
+        yield self._pipe.drain()
+
+
+def file_chunks(path, size=CHUNK_SIZE):
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def decode_data_url(text_chunks):
+    """(extension, bytes chunks) for an image data URL read as text chunks.
+
+    Returns None when the value is not a base64 data URL (e.g. a web URL).
+    Base64 is decoded incrementally, carrying partial quads between chunks.
+    """
+    text_chunks = iter(text_chunks)
+    first = next(text_chunks, '')
+    header, comma, rest = first.partition(',')
+    if not comma or not header.startswith('data:') or not header.endswith(';base64'):
+        return None
+    mimetype = header[len('data:'):-len(';base64')].lower()
+
+    def chunks():
+        carry = b''
+        for text in _prepend(rest, text_chunks):
+            data = carry + _WHITESPACE.sub(b'', text.encode('ascii', 'ignore'))
+            usable = len(data) - len(data) % 4
+            carry = data[usable:]
+            if usable:
+                yield base64.b64decode(data[:usable])
+        if carry:
+            try:
+                yield base64.b64decode(carry + b'=' * (-len(carry) % 4))
+            except (binascii.Error, ValueError):
+                logger.error("Ignoring truncated base64 at the end of an image")
+
+    return IMAGE_EXTENSIONS.get(mimetype, 'bin'), chunks()
+
+
+def _prepend(first, rest):
+    yield first
+    yield from rest
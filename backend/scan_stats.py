@@ -0,0 +1,142 @@
+import json
+import logging
+from collections import Counter
+from datetime import date, datetime, timedelta
+from sqlalchemy import and_, event, insert, inspect, update
+from sqlalchemy.orm import Session, attributes
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = ('day', 'week', 'month', 'total')
+UNKNOWN_DIAGNOSIS = 'Unknown'
+
+
+def is_critical(analysis_details):
+    """The AnalysisResult isCritical flag from a scan's stored JSON"""
+    try:
+        details = json.loads(analysis_details) if analysis_details else {}
+    except (TypeError, ValueError):
+        return False
+    return bool(details.get('isCritical')) if isinstance(details, dict) else False
+
+
+def period_start(day, granularity):
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+class ScanRollups:
+    """Per-user daily scan counts by (day, diagnosis, critical).
+
+    ORM inserts, updates and deletes of scans adjust the counts in the same
+    flush. The owner row is already locked by the change feed's version bump
+    at that point, so concurrent writers for one user cannot race on a new
+    rollup row. Bulk deletes that bypass the ORM call rebuild() afterwards.
+    Owners whose `scan_stats_ready` is not set (rows from before rollups
+    existed) are rebuilt from their scans on first read.
+    """
+
+    def __init__(self, owner_model, model, rollup_model):
+        self.owner_model = owner_model
+        self.model = model
+        self.rollup_model = rollup_model
+
+    def install(self):
+        event.listen(Session, 'before_flush', self._before_flush)
+        return self
+
+    def _key(self, user_id, created_at, prediction, analysis_details):
+        return (user_id, created_at.date(), (prediction or UNKNOWN_DIAGNOSIS)[:100], is_critical(analysis_details))
+
+    def _previous(self, obj, name):
+        history = attributes.get_history(obj, name)
+        if history.deleted:
+            return history.deleted[0]
+        return history.unchanged[0] if history.unchanged else getattr(obj, name)
+
+    def _before_flush(self, session, flush_context, instances):
+        deltas = Counter()
+        for obj in session.new:
+            if isinstance(obj, self.model):
+                if obj.created_at is None:
+                    # The column default would only be applied at INSERT; the day is needed now
+                    obj.created_at = datetime.utcnow()
+                deltas[self._key(obj.user_id, obj.created_at, obj.prediction, obj.analysis_details)] += 1
+        for obj in session.dirty:
+            if isinstance(obj, self.model) and session.is_modified(obj):
+                old = self._key(obj.user_id, self._previous(obj, 'created_at'),
+                                self._previous(obj, 'prediction'), self._previous(obj, 'analysis_details'))
+                new = self._key(obj.user_id, obj.created_at, obj.prediction, obj.analysis_details)
+                if old != new:
+                    deltas[old] -= 1
+                    deltas[new] += 1
+        for obj in session.deleted:
+            if isinstance(obj, self.model) and inspect(obj).persistent:
+                deltas[self._key(obj.user_id, obj.created_at, obj.prediction, obj.analysis_details)] -= 1
+        if any(deltas.values()):
+            self._apply(session.connection(), deltas)
+
+    def _apply(self, conn, deltas):
+        table = self.rollup_model.__table__
+        for (user_id, day, diagnosis, critical), delta in deltas.items():
+            if not delta:
+                continue
+            match = and_(table.c.user_id == user_id, table.c.day == day,
+                         table.c.diagnosis == diagnosis, table.c.is_critical == critical)
+            if conn.execute(update(table).where(match).values(count=table.c.count + delta)).rowcount:
+                if delta < 0:
+                    conn.execute(table.delete().where(and_(match, table.c.count <= 0)))
+            elif delta > 0:
+                conn.execute(insert(table).values(user_id=user_id, day=day, diagnosis=diagnosis,
+                                                  is_critical=critical, count=delta))
+
+    def rebuild(self, session, owner_id=None):
+        """Recount one owner's rollups (or everyone's) from the scans table"""
+        owners = self.owner_model.__table__
+        table = self.rollup_model.__table__
+        model = self.model
+        # Locks the owner rows first, so scan writes wait until the recount commits
+        mark = update(owners).values(scan_stats_ready=True)
+        session.execute(mark.where(owners.c.id == owner_id) if owner_id is not None else mark)
+        session.execute(table.delete().where(table.c.user_id == owner_id) if owner_id is not None else table.delete())
+
+        query = session.query(model.user_id, model.created_at, model.prediction, model.analysis_details)
+        if owner_id is not None:
+            query = query.filter(model.user_id == owner_id)
+        counts = Counter(self._key(*row) for row in query.yield_per(1000) if row.created_at is not None)
+        if counts:
+            session.execute(insert(table), [
+                {'user_id': user_id, 'day': day, 'diagnosis': diagnosis, 'is_critical': critical, 'count': count}
+                for (user_id, day, diagnosis, critical), count in counts.items()
+            ])
+        logger.info(f"Rebuilt scan rollups for {owner_id or 'all users'}: {len(counts)} rows")
+
+    def stats(self, owner_id, start, end, granularity):
+        """Scan counts for owner_id between start and end (inclusive dates), bucketed by granularity"""
+        rollup = self.rollup_model
+        rows = rollup.query.filter(rollup.user_id == owner_id, rollup.day >= start, rollup.day <= end)
+        buckets = {}
+        totals = {'scans': 0, 'critical': 0, 'by_diagnosis': Counter()}
+        for row in rows:
+            period = start if granularity == 'total' else period_start(row.day, granularity)
+            bucket = buckets.setdefault(period, {'scans': 0, 'critical': 0, 'by_diagnosis': Counter()})
+            for target in (bucket, totals):
+                target['scans'] += row.count
+                target['critical'] += row.count if row.is_critical else 0
+                target['by_diagnosis'][row.diagnosis] += row.count
+
+        series = [dict(bucket, period=period.isoformat(), by_diagnosis=dict(bucket['by_diagnosis']))
+                  for period, bucket in sorted(buckets.items())]
+        return dict(totals, by_diagnosis=dict(totals['by_diagnosis'])), series
+
+
+def parse_range(start, end, default_days=30):
+    """Dates from ISO strings; `to` defaults to today and `from` to default_days before it"""
+    end_day = date.fromisoformat(end) if end else datetime.utcnow().date()
+    start_day = date.fromisoformat(start) if start else end_day - timedelta(days=default_days - 1)
+    if start_day > end_day:
+        raise ValueError('from must not be after to')
+    return start_day, end_day
@@ -0,0 +1,71 @@
+import hashlib
+import json
+from datetime import datetime
+
+# Ack statuses returned per client id
+CREATED = 'created'
+UPDATED = 'updated'
+DUPLICATE = 'duplicate'
+CONFLICT = 'conflict'
+DELETED = 'deleted'
+INVALID = 'invalid'
+
+
+def content_hash(item):
+    """SHA-256 of a history item's canonical JSON, ignoring the client id and version"""
+    content = {key: value for key, value in item.items() if key not in ('scanId', 'version')}
+    canonical = json.dumps(content, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def scan_fields(item):
+    """Map a frontend ScanHistoryItem onto Scan columns; raises ValueError if it is unusable"""
+    patient = item.get('patientInfo')
+    result = item.get('analysisResult')
+    if not isinstance(patient, dict) or not isinstance(result, dict) or not patient.get('name'):
+        raise ValueError('patientInfo.name and analysisResult are required')
+
+    confidence = result.get('confidence')
+    if confidence is not None and (isinstance(confidence, bool) or not isinstance(confidence, (int, float))):
+        raise ValueError('analysisResult.confidence must be a number')
+
+    age = str(patient.get('age') or '').strip()
+    created_at = None
+    if item.get('timestamp'):
+        if not isinstance(item['timestamp'], str):
+            raise ValueError('timestamp must be an ISO 8601 string')
+        created_at = datetime.fromisoformat(item['timestamp'].replace('Z', '+00:00')).replace(tzinfo=None)
+
+    return {
+        'patient_name': str(patient['name'])[:100],
+        'patient_age': int(age) if age.isdigit() else None,
+        'patient_gender': patient.get('gender') or None,
+        'prediction': result.get('diagnosis'),
+        'confidence': confidence,
+        'analysis_details': json.dumps(dict(result, patientInfo=patient)),
+        'image_data': item.get('ecgImageBase64') or None,
+        'created_at': created_at or datetime.utcnow(),
+    }
+
+
+def resolve(base_version, digest, by_client, by_hash):
+    """Decide what an uploaded item does given the server's matching scans.
+
+    by_client is the scan already uploaded under this client id, by_hash a
+    scan with identical content. Returns (status, scan): an existing scan is
+    left alone when the content matches or the client edited a stale copy
+    (conflict: the server copy wins and reaches the device through the change
+    feed); an edit based on the current version is applied.
+    """
+    if by_client is not None:
+        if by_client.content_hash == digest:
+            return DUPLICATE, by_client
+        if base_version is not None and base_version == by_client.version:
+            return UPDATED, by_client
+        return CONFLICT, by_client
+    if by_hash is not None:
+        return DUPLICATE, by_hash
+    if base_version is not None:
+        # The device had a server copy that no longer exists
+        return DELETED, None
+    return CREATED, None
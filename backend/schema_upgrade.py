@@ -0,0 +1,49 @@
+import logging
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateIndex
+
+logger = logging.getLogger(__name__)
+
+
+def upgrade_schema(bind, metadata):
+    """Bring existing tables up to the models without a migration tool.
+
+    db.create_all() only creates missing tables, so databases created by an
+    older release are missing newer nullable columns and indexes. Those are
+    added here; anything else still needs a manual migration. `bind` is an
+    Engine or a Connection (e.g. inside AsyncConnection.run_sync).
+    """
+    if isinstance(bind, Engine):
+        with bind.begin() as conn:
+            return upgrade_schema(conn, metadata)
+
+    conn = bind
+    inspector = inspect(conn)
+    existing_tables = set(inspector.get_table_names())
+    changes = []
+
+    for table in metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in columns:
+                continue
+            if not column.nullable:
+                logger.error(f"Cannot add NOT NULL column {table.name}.{column.name}; migrate manually")
+                continue
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+            changes.append(f'{table.name}.{column.name}')
+
+        indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                conn.execute(CreateIndex(index))
+                changes.append(index.name)
+
+    for change in changes:
+        logger.info(f"Schema upgraded: added {change}")
+    return changes
@@ -1,5 +1,6 @@
 import os
 from datetime import timedelta
+from production_config import engine_options
 
 class SharedConfig:
     """Configuration for shared SQLite database across devices"""
@@ -14,6 +15,13 @@ class SharedConfig:
     
     SQLALCHEMY_DATABASE_URI = f'sqlite:///{db_path}'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    
+    # Concurrent access: WAL pragmas on connect, writes through one writer thread
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 268435456))
+    SQLITE_WRITE_BATCH_SIZE = int(os.environ.get('SQLITE_WRITE_BATCH_SIZE', 64))
+    SQLITE_WRITE_BATCH_WINDOW = float(os.environ.get('SQLITE_WRITE_BATCH_WINDOW', 0))
     
     # JWT
     JWT_EXPIRATION_DELTA = timedelta(days=30)
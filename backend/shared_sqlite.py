@@ -0,0 +1,128 @@
+import atexit
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+logger = logging.getLogger(__name__)
+
+
+def apply_sqlite_pragmas(engine, busy_timeout_ms=5000, mmap_size=268435456):
+    """Set WAL journaling and friends on every new connection of an SQLite engine"""
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout_ms)}')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA mmap_size={int(mmap_size)}')
+        cursor.close()
+
+    return engine
+
+
+class SQLiteWriteQueue:
+    """Single writer thread that group-commits queued units of work.
+
+    Each unit of work is a callable taking an ORM session. Work queued while a
+    commit is in flight is applied in one transaction; every unit runs inside
+    its own SAVEPOINT so one failing write does not take the batch down.
+    """
+
+    def __init__(self, database_uri, busy_timeout_ms=5000, mmap_size=268435456, max_batch=64, batch_window=0.0):
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.batches = 0
+        self.writes = 0
+
+        # pysqlite's implicit transactions break SAVEPOINT and use deferred
+        # BEGIN; take over and start every write transaction IMMEDIATE instead
+        self.engine = create_engine(
+            database_uri,
+            connect_args={'isolation_level': None, 'check_same_thread': False},
+            pool_size=1,
+            max_overflow=0
+        )
+        apply_sqlite_pragmas(self.engine, busy_timeout_ms, mmap_size)
+
+        @event.listens_for(self.engine, 'begin')
+        def begin_immediate(conn):
+            conn.exec_driver_sql('BEGIN IMMEDIATE')
+
+        self._session_factory = sessionmaker(bind=self.engine, expire_on_commit=False)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def submit(self, work):
+        """Queue a unit of work; returns a Future resolved after its batch commits"""
+        future = Future()
+        self._queue.put((work, future))
+        return future
+
+    def run(self, work, timeout=30):
+        """Queue a unit of work and wait for its result"""
+        return self.submit(work).result(timeout)
+
+    def stop(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=10)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+
+            batch = [job]
+            stopping = False
+            while len(batch) < self.max_batch:
+                try:
+                    job = self._queue.get(timeout=self.batch_window) if self.batch_window else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+
+            self._commit_batch(batch)
+            if stopping:
+                return
+
+    def _commit_batch(self, batch):
+        session = self._session_factory()
+        outcomes = []
+        try:
+            for work, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    # The savepoint flushes on exit, so constraint errors surface only then
+                    with session.begin_nested():
+                        result = work(session)
+                    outcomes.append((future, result, None))
+                except Exception as e:
+                    outcomes.append((future, None, e))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Shared SQLite batch commit failed: {str(e)}")
+            for future, _, error in outcomes:
+                future.set_exception(error or e)
+            return
+        finally:
+            session.close()
+
+        self.batches += 1
+        self.writes += len(outcomes)
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
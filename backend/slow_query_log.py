@@ -0,0 +1,154 @@
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from flask import has_request_context, request
+from sqlalchemy import event
+
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+_WHITESPACE = re.compile(r'\s+')
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'IN \((?:\?|%\(\w+\)s|%s|:\w+)(?:, (?:\?|%\(\w+\)s|%s|:\w+))*\)', re.IGNORECASE)
+
+
+def normalize_sql(statement):
+    """Collapse whitespace and literals so identical query shapes group together"""
+    statement = _WHITESPACE.sub(' ', statement).strip()
+    statement = _STRING_LITERAL.sub('?', statement)
+    statement = _NUMBER_LITERAL.sub('?', statement)
+    return _IN_LIST.sub('IN (...)', statement)
+
+
+def _shape(value):
+    if isinstance(value, (str, bytes)):
+        return f'{type(value).__name__}({len(value)})'
+    return type(value).__name__
+
+
+def parameter_shapes(parameters, executemany=False):
+    """Types (and lengths) of bind parameters, never their values"""
+    if executemany:
+        rows = list(parameters or [])
+        return {'rows': len(rows), 'row': parameter_shapes(rows[0]) if rows else None}
+    if isinstance(parameters, dict):
+        return {key: _shape(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [_shape(value) for value in parameters]
+    return None
+
+
+class SlowQueryLog:
+    """Times every statement on an engine and logs the slow ones with their plan.
+
+    Entries go to a JSON-lines log file and a small in-memory ring buffer.
+    EXPLAIN output is captured once per normalized statement and reused.
+    """
+
+    def __init__(self, threshold_ms=200, log_path='slow_queries.log', explain=True, registry=None, recent_size=100):
+        self.threshold = threshold_ms / 1000.0
+        self.explain = explain
+        self.registry = registry
+        self.recent = deque(maxlen=recent_size)
+        self._plans = OrderedDict()
+        self._plans_lock = threading.Lock()
+
+        self.logger = logging.getLogger('slow_queries')
+        self.logger.propagate = False
+        if log_path and not self.logger.handlers:
+            handler = logging.FileHandler(log_path)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self.logger.addHandler(handler)
+        self.logger.setLevel(logging.INFO)
+
+        if registry is not None:
+            registry.counter('db_slow_queries_total', 'Statements slower than the slow-query threshold.')
+
+    def instrument(self, engine):
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('slow_query_start', []).append(time.perf_counter())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - conn.info['slow_query_start'].pop()
+            if elapsed >= self.threshold:
+                self._record(conn, cursor, statement, parameters, executemany, elapsed)
+
+        @event.listens_for(engine, 'handle_error')
+        def handle_error(exception_context):
+            conn = exception_context.connection
+            if conn is not None and conn.info.get('slow_query_start'):
+                conn.info['slow_query_start'].pop()
+
+    def _route(self):
+        if has_request_context():
+            rule = request.url_rule.rule if request.url_rule is not None else request.path
+            return f'{request.method} {rule}'
+        return f'thread:{threading.current_thread().name}'
+
+    def _record(self, conn, cursor, statement, parameters, executemany, elapsed):
+        normalized = normalize_sql(statement)
+        route = self._route()
+        entry = {
+            'timestamp': datetime.utcnow().isoformat(),
+            'duration_ms': round(elapsed * 1000, 2),
+            'route': route,
+            'sql': normalized,
+            'parameters': parameter_shapes(parameters, executemany),
+            'plan': None if executemany or not self.explain else self._plan(conn, cursor, statement, parameters, normalized)
+        }
+        self.recent.append(entry)
+        self.logger.info(json.dumps(entry, default=str))
+        if self.registry is not None:
+            self.registry.inc('db_slow_queries_total', route=route)
+
+    def _plan(self, conn, cursor, statement, parameters, normalized):
+        with self._plans_lock:
+            if normalized in self._plans:
+                self._plans.move_to_end(normalized)
+                return self._plans[normalized]
+
+        if normalized.split(' ', 1)[0].upper() not in EXPLAINABLE:
+            return None
+
+        dialect = conn.dialect.name
+        if dialect == 'sqlite':
+            prefix = 'EXPLAIN QUERY PLAN '
+        elif dialect in ('postgresql', 'mysql'):
+            prefix = 'EXPLAIN '
+        else:
+            return None
+
+        try:
+            # A separate DBAPI cursor keeps the EXPLAIN out of SQLAlchemy's events
+            # and leaves the original cursor's pending rows untouched
+            explain_cursor = cursor.connection.cursor()
+            # On PostgreSQL a failed EXPLAIN would abort the caller's transaction
+            guarded = dialect == 'postgresql'
+            try:
+                if guarded:
+                    explain_cursor.execute('SAVEPOINT slow_query_explain')
+                try:
+                    explain_cursor.execute(prefix + statement, parameters or ())
+                    plan = [' | '.join(str(column) for column in row) for row in explain_cursor.fetchall()]
+                except Exception:
+                    if guarded:
+                        explain_cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+                    raise
+                if guarded:
+                    explain_cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+            finally:
+                explain_cursor.close()
+        except Exception as e:
+            plan = [f'EXPLAIN failed: {str(e)}']
+
+        with self._plans_lock:
+            self._plans[normalized] = plan
+            if len(self._plans) > 256:
+                self._plans.popitem(last=False)
+        return plan
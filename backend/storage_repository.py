@@ -0,0 +1,102 @@
+from abc import ABC, abstractmethod
+
+
+class StorageRepository(ABC):
+    """Storage interface for users, scans, AI feedback and password resets.
+
+    Records are plain dicts keyed like the API payloads ('id', 'email',
+    'analysis_details', ...); timestamps are datetime objects.
+    """
+
+    # Users
+    @abstractmethod
+    def create_user(self, email, name, password_hash, role='user'):
+        """Insert a user and return it"""
+
+    @abstractmethod
+    def get_user(self, user_id):
+        """Return the user with this id, or None"""
+
+    @abstractmethod
+    def get_user_by_email(self, email):
+        """Return the user with this email, or None"""
+
+    @abstractmethod
+    def list_users(self, exclude_email=None):
+        """Return all users, each with a 'scan_count'"""
+
+    @abstractmethod
+    def update_user(self, user_id, **fields):
+        """Update fields on a user; returns True if the user exists"""
+
+    @abstractmethod
+    def bulk_update_users(self, updates):
+        """Apply {user_id: {field: value}} updates in one round-trip"""
+
+    @abstractmethod
+    def delete_user(self, user_id):
+        """Delete a user together with their scans, feedback and resets"""
+
+    # Scans
+    @abstractmethod
+    def create_scan(self, user_id, **fields):
+        """Insert a scan and return it"""
+
+    @abstractmethod
+    def bulk_create_scans(self, scans):
+        """Insert many scans at once; returns the number inserted"""
+
+    @abstractmethod
+    def get_scan(self, scan_id):
+        """Return the scan with this id, or None"""
+
+    @abstractmethod
+    def list_scans(self, user_id, include_details=True):
+        """Return a user's scans, newest first"""
+
+    @abstractmethod
+    def update_scan(self, scan_id, **fields):
+        """Update fields on a scan; returns True if the scan exists"""
+
+    @abstractmethod
+    def delete_scan(self, scan_id, user_id=None):
+        """Delete a scan (optionally only if owned by user_id); returns True if deleted"""
+
+    @abstractmethod
+    def delete_user_scans(self, user_id=None):
+        """Delete a user's scans, or all scans, with their feedback; returns scans deleted"""
+
+    @abstractmethod
+    def count_scans(self):
+        """Total number of scans"""
+
+    # AI feedback
+    @abstractmethod
+    def add_feedback(self, scan_id, user_id, corrected_prediction, feedback_type='correction',
+                     notes='', new_confidence=None, analysis_details=None):
+        """Record feedback and apply the correction to the scan; returns the feedback, or None if the scan is missing"""
+
+    @abstractmethod
+    def feedback_summary(self, recent_limit=50):
+        """Return totals by feedback type and the most recent feedback"""
+
+    @abstractmethod
+    def correction_patterns(self, limit=10):
+        """Most common (original, corrected) prediction pairs"""
+
+    # Password resets
+    @abstractmethod
+    def create_reset(self, user_id, email, reset_code, expires_at):
+        """Store a reset code and return it"""
+
+    @abstractmethod
+    def find_active_reset(self, email, reset_code=None, now=None):
+        """Return an unused, unexpired reset for this email (and code), or None"""
+
+    @abstractmethod
+    def mark_resets_used(self, email):
+        """Mark every outstanding reset for this email used"""
+
+    @abstractmethod
+    def delete_reset(self, reset_id):
+        """Delete one reset record"""
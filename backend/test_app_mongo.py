@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Tests for the MongoDB app, run against an in-memory mongomock database.
+"""
+
+import importlib
+import sys
+import pytest
+import mongo_repository
+
+
+@pytest.fixture
+def client(monkeypatch):
+    mongomock = pytest.importorskip('mongomock')
+    monkeypatch.setattr(mongo_repository, 'MongoClient', mongomock.MongoClient)
+    sys.modules.pop('app_mongo', None)
+    app_mongo = importlib.import_module('app_mongo')
+    yield app_mongo.app.test_client()
+    sys.modules.pop('app_mongo', None)
+
+
+def auth(client, email, password, name=None):
+    if name:
+        response = client.post('/api/signup', json={'name': name, 'email': email, 'password': password})
+    else:
+        response = client.post('/api/login', json={'email': email, 'password': password})
+    assert response.status_code in (200, 201)
+    return {'Authorization': f"Bearer {response.json['token']}"}
+
+
+def test_scan_crud_and_feedback(client):
+    user = auth(client, 'doctor@example.com', 'secret1', name='Dr Who')
+    admin = auth(client, 'admin@ecgscanner.com', 'admin123')
+
+    created = client.post('/api/scans', headers=user, json={
+        'patient_name': 'Jane', 'prediction': 'Normal', 'confidence': 0.8,
+        'analysis_details': {'diagnosis': 'Normal'}
+    })
+    assert created.status_code == 201
+    scan_id = created.json['scan']['id']
+
+    feedback = client.post(f'/api/scans/{scan_id}/feedback', headers=admin,
+                           json={'corrected_prediction': 'Atrial Fibrillation', 'new_confidence': 0.6})
+    assert feedback.json['data']['total_feedback'] == 1
+
+    scans = client.get('/api/scans', headers=user).json['scans']
+    assert [(scan['prediction'], scan['confidence']) for scan in scans] == [('Atrial Fibrillation', 0.6)]
+    stats = client.get('/api/admin/ai-model-stats', headers=admin).json['data']
+    assert (stats['total_scans'], stats['scans_with_feedback']) == (1, 1)
+
+    # Only the owner can delete a scan
+    assert client.delete(f'/api/scans/{scan_id}', headers=admin).status_code == 404
+    assert client.delete(f'/api/scans/{scan_id}', headers=user).status_code == 200
+    assert client.get('/api/scans', headers=user).json['scans'] == []
+
+
+def test_deleted_user_loses_access(client):
+    user = auth(client, 'doctor@example.com', 'secret1', name='Dr Who')
+    admin = auth(client, 'admin@ecgscanner.com', 'admin123')
+
+    users = client.get('/api/admin/users', headers=admin).json['users']
+    assert [u['email'] for u in users] == ['doctor@example.com']
+    assert client.get('/api/admin/users', headers=user).status_code == 403
+
+    assert client.delete(f"/api/admin/users/{users[0]['id']}", headers=admin).status_code == 200
+    assert client.get('/api/scans', headers=user).status_code == 401
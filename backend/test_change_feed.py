@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Tests for the per-user scan change feed.
+"""
+
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from change_feed import ChangeFeed
+
+db = SQLAlchemy()
+
+
+class Owner(db.Model):
+    id = db.Column(db.String(36), primary_key=True)
+    sync_version = db.Column(db.Integer, default=0)
+    sync_reset_version = db.Column(db.Integer, default=0)
+
+
+class Item(db.Model):
+    id = db.Column(db.String(36), primary_key=True)
+    user_id = db.Column(db.String(36), db.ForeignKey('owner.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=db.func.now())
+    version = db.Column(db.Integer)
+
+
+class ItemTombstone(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(36), nullable=False)
+    record_id = db.Column(db.String(36), nullable=False)
+    version = db.Column(db.Integer)
+
+
+def run_write(work):
+    result = work(db.session)
+    db.session.commit()
+    return result
+
+
+# Listens on every Session, so it is installed once for the module
+change_feed = ChangeFeed(db, Owner, Item, ItemTombstone, run_write).install()
+
+
+@pytest.fixture
+def feed(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'feed.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add(Owner(id='owner'))
+        db.session.commit()
+        yield change_feed
+        db.session.remove()
+
+
+def add_items(*ids):
+    db.session.add_all([Item(id=item_id, user_id='owner') for item_id in ids])
+    db.session.commit()
+
+
+def owner():
+    db.session.expire_all()
+    return db.session.get(Owner, 'owner')
+
+
+def test_incremental_changes_include_deletes(feed):
+    add_items('a', 'b')
+    rows, deleted, cursor, has_more, reset, resume = feed.changes(owner(), 0, 10)
+    assert [row.id for row in rows] == ['a', 'b'] and deleted == [] and not has_more and not reset
+
+    db.session.delete(db.session.get(Item, 'a'))
+    db.session.commit()
+    rows, deleted, cursor, has_more, reset, resume = feed.changes(owner(), cursor, 10)
+    assert rows == [] and deleted == ['a'] and cursor == owner().sync_version and resume is None
+
+
+def test_reset_listing_pages_past_rows_older_than_the_reset(feed):
+    add_items('gone-1', 'gone-2', *(f'kept-{i}' for i in range(5)))
+    device_cursor = feed.changes(owner(), 0, 100)[2]
+
+    # A purge removes some rows without tombstones; the survivors keep versions below the reset
+    Item.query.filter(Item.id.like('gone-%')).delete(synchronize_session=False)
+    feed.mark_reset(db.session, 'owner')
+    db.session.commit()
+    add_items('new')
+
+    pages = []
+    since, resume = device_cursor, None
+    while len(pages) < 10:
+        rows, deleted, since, has_more, reset, resume = feed.changes(owner(), since, 2, resume=resume)
+        pages.append(([row.id for row in rows], reset))
+        if not has_more:
+            break
+
+    assert pages == [(['kept-0', 'kept-1'], True), (['kept-2', 'kept-3'], False), (['kept-4', 'new'], False)]
+    assert since == owner().sync_version and resume is None
+    assert feed.changes(owner(), since, 2)[:5] == ([], [], since, False, False)
+
+
+def test_reset_while_paging_restarts_the_listing(feed):
+    add_items(*(f'kept-{i}' for i in range(4)))
+    feed.mark_reset(db.session, 'owner')
+    db.session.commit()
+
+    rows, deleted, since, has_more, reset, resume = feed.changes(owner(), 0, 2)
+    assert reset and has_more and resume
+
+    feed.mark_reset(db.session, 'owner')
+    db.session.commit()
+    rows, deleted, since, has_more, reset, resume = feed.changes(owner(), since, 2, resume=resume)
+    assert [row.id for row in rows] == ['kept-0', 'kept-1'] and reset
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Tests for the MongoDB storage repository.
+
+Runs against an in-memory mongomock database by default. Set MONGO_TEST_URI
+(e.g. mongodb://localhost:27017/) to run against a local mongod instead.
+"""
+
+import os
+import uuid
+from datetime import datetime, timedelta
+import pytest
+from mongo_repository import MongoRepository
+
+
+@pytest.fixture
+def repo():
+    uri = os.environ.get('MONGO_TEST_URI')
+    if uri:
+        from pymongo import MongoClient
+        client = MongoClient(uri, serverSelectionTimeoutMS=2000)
+    else:
+        mongomock = pytest.importorskip('mongomock')
+        client = mongomock.MongoClient()
+
+    class Config:
+        MONGO_URI = uri
+        MONGO_DATABASE = f'ecg_test_{uuid.uuid4().hex[:8]}'
+
+    repository = MongoRepository.from_config(Config, client=client)
+    yield repository
+    client.drop_database(Config.MONGO_DATABASE)
+
+
+@pytest.fixture
+def user(repo):
+    return repo.create_user('Doctor@Example.com', 'Dr Who', 'hash')
+
+
+def analysis_result(diagnosis='Normal Sinus Rhythm'):
+    return {
+        'diagnosis': diagnosis,
+        'confidence': 0.92,
+        'isCritical': False,
+        'ecgParameters': {'hr': '75 bpm', 'rhythm': 'Regular'},
+        'annotations': [{'label': 'P wave', 'boundingBox': {'x_min': 1, 'y_min': 2, 'x_max': 3, 'y_max': 4}}],
+        'differentialDiagnosis': [{'diagnosis': 'Sinus arrhythmia', 'rationale': 'Variable RR'}]
+    }
+
+
+def test_user_lookup_is_case_insensitive(repo, user):
+    assert repo.get_user_by_email('doctor@example.com')['id'] == user['id']
+    assert repo.get_user(user['id'])['name'] == 'Dr Who'
+
+
+def test_scan_analysis_is_stored_as_native_document(repo, user):
+    scan = repo.create_scan(user['id'], patient_name='Jane', analysis_details=analysis_result())
+    stored = repo.scans.find_one({'_id': scan['id']})
+    assert isinstance(stored['analysis_details'], dict)
+    assert stored['analysis_details']['annotations'][0]['boundingBox']['x_max'] == 3
+
+
+def test_list_scans_newest_first_with_optional_projection(repo, user):
+    now = datetime.utcnow()
+    repo.bulk_create_scans([
+        {'user_id': user['id'], 'patient_name': f'P{i}', 'analysis_details': analysis_result(),
+         'created_at': now + timedelta(minutes=i)}
+        for i in range(3)
+    ])
+    scans = repo.list_scans(user['id'])
+    assert [scan['patient_name'] for scan in scans] == ['P2', 'P1', 'P0']
+    assert 'analysis_details' not in repo.list_scans(user['id'], include_details=False)[0]
+
+
+def test_list_users_includes_scan_counts(repo, user):
+    other = repo.create_user('other@example.com', 'Other', 'hash')
+    repo.create_scan(user['id'], patient_name='A')
+    repo.create_scan(user['id'], patient_name='B')
+    counts = {u['email']: u['scan_count'] for u in repo.list_users()}
+    assert counts == {'doctor@example.com': 2, 'other@example.com': 0}
+    assert all('password_hash' not in u for u in repo.list_users())
+    assert [u['id'] for u in repo.list_users(exclude_email='doctor@example.com')] == [other['id']]
+
+
+def test_feedback_updates_scan_and_summaries(repo, user):
+    scan = repo.create_scan(user['id'], patient_name='A', prediction='Normal', confidence=0.8)
+    assert repo.add_feedback('missing', user['id'], 'AF') is None
+
+    repo.add_feedback(scan['id'], user['id'], 'Atrial Fibrillation', new_confidence=0.6)
+    repo.add_feedback(scan['id'], user['id'], 'Atrial Fibrillation', feedback_type='confirmation')
+
+    updated = repo.get_scan(scan['id'])
+    assert updated['prediction'] == 'Atrial Fibrillation'
+    assert updated['confidence'] == 0.6
+    assert 'feedback' not in updated
+
+    summary = repo.feedback_summary()
+    assert (summary['total_feedback'], summary['corrections'], summary['confirmations']) == (2, 1, 1)
+    assert summary['scans_with_feedback'] == 1
+    assert repo.correction_patterns() == [{'original': 'Normal', 'corrected': 'Atrial Fibrillation', 'count': 1}]
+
+
+def test_feedback_retries_when_the_scan_changes_underneath(repo, user, monkeypatch):
+    scan = repo.create_scan(user['id'], patient_name='A', prediction='Normal', confidence=0.8)
+    find_one = repo.scans.find_one
+    reads = []
+
+    def racing_find_one(*args, **kwargs):
+        document = find_one(*args, **kwargs)
+        if not reads:
+            # Another reviewer's correction lands between the read and the update
+            repo.scans.update_one({'_id': scan['id']}, {'$set': {'prediction': 'Sinus Tachycardia'}})
+        reads.append(document)
+        return document
+
+    monkeypatch.setattr(repo.scans, 'find_one', racing_find_one)
+    feedback = repo.add_feedback(scan['id'], user['id'], 'Atrial Fibrillation')
+
+    assert len(reads) == 2
+    assert feedback['original_prediction'] == 'Sinus Tachycardia'
+    assert repo.get_scan(scan['id'])['prediction'] == 'Atrial Fibrillation'
+
+
+def test_bulk_update_users(repo, user):
+    other = repo.create_user('other@example.com', 'Other', 'hash')
+    seen = datetime(2024, 1, 1)
+    assert repo.bulk_update_users({user['id']: {'last_login': seen}, other['id']: {'name': 'Renamed'}}) == 2
+    assert repo.get_user(user['id'])['last_login'] == seen
+    assert repo.get_user(other['id'])['name'] == 'Renamed'
+
+
+def test_delete_user_cascades(repo, user):
+    admin = repo.create_user('admin@example.com', 'Admin', 'hash', role='admin')
+    scan = repo.create_scan(user['id'], patient_name='A', prediction='Normal')
+    repo.add_feedback(scan['id'], admin['id'], 'AF')
+    repo.create_reset(user['id'], user['email'], '123456', datetime.utcnow() + timedelta(minutes=15))
+
+    assert repo.delete_user(user['id'])
+    assert repo.get_user(user['id']) is None
+    assert repo.scans.count_documents({}) == 0
+    assert repo.feedback_summary()['total_feedback'] == 0
+    assert repo.resets.count_documents({}) == 0
+
+
+def test_deleting_a_reviewer_removes_their_feedback_from_other_scans(repo, user):
+    admin = repo.create_user('admin@example.com', 'Admin', 'hash', role='admin')
+    scan = repo.create_scan(user['id'], patient_name='A', prediction='Normal')
+    repo.add_feedback(scan['id'], admin['id'], 'AF')
+    repo.add_feedback(scan['id'], user['id'], 'AF', feedback_type='confirmation')
+
+    assert repo.delete_user(admin['id'])
+    summary = repo.feedback_summary()
+    assert [fb['user_id'] for fb in summary['recent_feedback']] == [user['id']]
+    assert summary['recent_feedback'][0]['scan_id'] == scan['id']
+
+
+def test_password_reset_lifecycle(repo, user):
+    expires = datetime.utcnow() + timedelta(minutes=15)
+    reset = repo.create_reset(user['id'], user['email'], '123456', expires)
+    repo.create_reset(user['id'], user['email'], '654321', datetime.utcnow() - timedelta(minutes=1))
+
+    assert repo.find_active_reset(user['email'], '123456')['id'] == reset['id']
+    assert repo.find_active_reset(user['email'], '654321') is None
+    assert repo.find_active_reset(user['email'], '000000') is None
+
+    repo.mark_resets_used(user['email'])
+    assert repo.find_active_reset(user['email']) is None
+    assert repo.delete_reset(reset['id'])
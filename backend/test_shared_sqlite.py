@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared-SQLite single-writer queue.
+"""
+
+import pytest
+from sqlalchemy import Column, Integer, String
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import declarative_base
+from shared_sqlite import SQLiteWriteQueue
+
+Base = declarative_base()
+
+
+class Item(Base):
+    __tablename__ = 'item'
+    id = Column(Integer, primary_key=True)
+    name = Column(String(50), unique=True, nullable=False)
+
+
+@pytest.fixture
+def write_queue(tmp_path):
+    # A batch window long enough that the units submitted together share one transaction
+    queue = SQLiteWriteQueue(f"sqlite:///{tmp_path / 'shared.db'}", batch_window=0.2)
+    Base.metadata.create_all(queue.engine)
+    yield queue
+    queue.stop()
+    queue.engine.dispose()
+
+
+def add(name):
+    def work(session):
+        session.add(Item(name=name))
+        return name
+    return work
+
+
+def names(write_queue):
+    return write_queue.run(lambda session: sorted(item.name for item in session.query(Item)))
+
+
+def test_units_in_a_batch_commit_together(write_queue):
+    futures = [write_queue.submit(add(f'item-{i}')) for i in range(5)]
+    assert [future.result(5) for future in futures] == [f'item-{i}' for i in range(5)]
+    assert names(write_queue) == [f'item-{i}' for i in range(5)]
+    assert write_queue.batches <= 3
+
+
+def test_unique_violation_mid_batch_fails_only_that_unit(write_queue):
+    write_queue.run(add('taken'))
+
+    # The duplicate only fails when its savepoint flushes, after work() has returned
+    futures = [write_queue.submit(add('first')), write_queue.submit(add('taken')), write_queue.submit(add('last'))]
+
+    assert futures[0].result(5) == 'first'
+    with pytest.raises(IntegrityError):
+        futures[1].result(5)
+    assert futures[2].result(5) == 'last'
+    assert names(write_queue) == ['first', 'last', 'taken']
+
+
+def test_writer_keeps_running_after_a_failed_unit(write_queue):
+    write_queue.run(add('taken'))
+    with pytest.raises(IntegrityError):
+        write_queue.run(add('taken'))
+    with pytest.raises(ValueError):
+        write_queue.run(lambda session: int('not a number'))
+
+    assert write_queue.run(add('after'), timeout=5) == 'after'
+    assert names(write_queue) == ['after', 'taken']
@@ -0,0 +1,237 @@
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class TTLStore(ABC):
+    """Key-value store whose entries expire after a per-key time to live"""
+
+    @abstractmethod
+    def get(self, key):
+        """Return the value for key, or None if absent or expired"""
+
+    @abstractmethod
+    def set(self, key, value, ttl):
+        """Store value for ttl seconds, replacing any existing entry"""
+
+    @abstractmethod
+    def add(self, key, value, ttl):
+        """Store value only if key is absent or expired; True if it was stored"""
+
+    @abstractmethod
+    def pop(self, key):
+        """Remove key and return its value (None if absent); only one caller gets it"""
+
+    def delete(self, key):
+        self.pop(key)
+
+    @abstractmethod
+    def sweep(self):
+        """Drop expired entries; returns how many were removed"""
+
+    def start(self):
+        """Start background expiry, for stores that need it; returns the store"""
+        return self
+
+
+class MemoryTTLStore(TTLStore):
+    """Per-process store bounded to max_size entries.
+
+    Expired entries are dropped when read and by a sweep at most every
+    sweep_interval seconds; when still full, the oldest entries are evicted.
+    """
+
+    def __init__(self, max_size=10000, sweep_interval=60.0):
+        self.max_size = max_size
+        self.sweep_interval = sweep_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_sweep = time.time() + sweep_interval
+
+    def _live(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del self._entries[key]
+            return None
+        return entry
+
+    def _sweep_locked(self, now):
+        expired = [key for key, (expires_at, _) in self._entries.items() if expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+        self._next_sweep = now + self.sweep_interval
+        return len(expired)
+
+    def _store(self, key, value, ttl, now):
+        self._entries[key] = (now + ttl, value)
+        self._entries.move_to_end(key)
+        if now >= self._next_sweep or len(self._entries) > self.max_size:
+            self._sweep_locked(now)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key, time.time())
+            return entry[1] if entry else None
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._store(key, value, ttl, time.time())
+
+    def add(self, key, value, ttl):
+        with self._lock:
+            now = time.time()
+            if self._live(key, now) is not None:
+                return False
+            self._store(key, value, ttl, now)
+            return True
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._live(key, time.time())
+            if entry is None:
+                return None
+            del self._entries[key]
+            return entry[1]
+
+    def sweep(self):
+        with self._lock:
+            return self._sweep_locked(time.time())
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteTTLStore(TTLStore):
+    """Store in a SQLite file shared by every worker process on the host.
+
+    Values are JSON-encoded. pop() and add() run in BEGIN IMMEDIATE
+    transactions so concurrent workers agree on who consumed or created a key.
+    Expired rows are deleted after a write at most every sweep_interval
+    seconds; start() also sweeps on that interval from a background thread,
+    so rows are reclaimed when writes stop too.
+    """
+
+    def __init__(self, path, max_size=100000, sweep_interval=60.0, busy_timeout_ms=5000, table='ttl_store'):
+        self.path = path
+        self.max_size = max_size
+        self.sweep_interval = sweep_interval
+        self.busy_timeout_ms = busy_timeout_ms
+        self.table = table
+        self._local = threading.local()
+        self._next_sweep = time.time() + sweep_interval
+        self._stopped = threading.Event()
+        self._thread = None
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT, expires_at REAL NOT NULL)')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS ix_{table}_expires_at ON {table} (expires_at)')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=self.busy_timeout_ms / 1000.0)
+            conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self, fn):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            result = fn(conn, time.time())
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return result
+
+    def _after_write(self, conn, now):
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + self.sweep_interval
+        conn.execute(f'DELETE FROM {self.table} WHERE expires_at <= ?', (now,))
+        # Still over the bound: drop the entries closest to expiry
+        excess = conn.execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0] - self.max_size
+        if excess > 0:
+            conn.execute(f'DELETE FROM {self.table} WHERE key IN '
+                         f'(SELECT key FROM {self.table} ORDER BY expires_at LIMIT ?)', (excess,))
+
+    def get(self, key):
+        row = self._connection().execute(
+            f'SELECT value FROM {self.table} WHERE key = ? AND expires_at > ?', (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl):
+        def work(conn, now):
+            conn.execute(f'INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?)', (key, json.dumps(value), now + ttl))
+            self._after_write(conn, now)
+        self._transaction(work)
+
+    def add(self, key, value, ttl):
+        def work(conn, now):
+            conn.execute(f'DELETE FROM {self.table} WHERE key = ? AND expires_at <= ?', (key, now))
+            stored = conn.execute(f'INSERT OR IGNORE INTO {self.table} VALUES (?, ?, ?)',
+                                  (key, json.dumps(value), now + ttl)).rowcount == 1
+            self._after_write(conn, now)
+            return stored
+        return self._transaction(work)
+
+    def pop(self, key):
+        def work(conn, now):
+            row = conn.execute(f'SELECT value, expires_at FROM {self.table} WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute(f'DELETE FROM {self.table} WHERE key = ?', (key,))
+            return json.loads(row[0]) if row[1] > now else None
+        return self._transaction(work)
+
+    def sweep(self):
+        def work(conn, now):
+            return conn.execute(f'DELETE FROM {self.table} WHERE expires_at <= ?', (now,)).rowcount
+        return self._transaction(work)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f'ttl-sweeper-{self.table}', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"TTL store sweep failed: {str(e)}")
+
+    def __len__(self):
+        return self._connection().execute(
+            f'SELECT COUNT(*) FROM {self.table} WHERE expires_at > ?', (time.time(),)
+        ).fetchone()[0]
+
+
+def ttl_store_from_url(url, **kwargs):
+    """'memory' for a per-process store, 'sqlite:///path/to/file.db' for one shared by workers"""
+    if url == 'memory':
+        return MemoryTTLStore(**kwargs)
+    if url.startswith('sqlite:///'):
+        path = os.path.abspath(url[len('sqlite:///'):])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return SQLiteTTLStore(path, **kwargs)
+    raise ValueError(f'Unsupported TTL store URL: {url}')
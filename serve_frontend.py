@@ -1,34 +1,186 @@
 #!/usr/bin/env python3
 """
-Simple HTTP server to serve the built frontend files
+HTTP server for the built frontend files in dist/
 Run this to serve the frontend at http://192.168.1.18:3000
+
+Requests are handled on threads and file bodies are sent with sendfile.
+Precompressed .br/.gz files next to an asset are served to clients that
+accept them (run with --precompress to create them after a build).
+Content-hashed Vite bundles in assets/ are cached by browsers for a year;
+index.html is revalidated with its ETag on every load, so a new deploy is
+picked up at once.
 """
 
-import http.server
-import socketserver
+import email.utils
+import gzip
+import mimetypes
 import os
+import re
+import shutil
 import sys
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
+from urllib.parse import unquote, urlsplit
+
+try:
+    import brotli
+except ImportError:  # .br files are only created when brotli is installed
+    brotli = None
 
-# Change to the dist directory where built files are
-dist_path = Path(__file__).parent / "dist"
-os.chdir(dist_path)
+dist_path = (Path(__file__).parent / "dist").resolve()
 
 PORT = 3000
 HOST = "0.0.0.0"
 
-class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
+# Vite names bundles assets/<name>-<hash>.<ext>
+HASHED_ASSET = re.compile(r'^assets/.+-[A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+SHORT_LIVED = 'public, max-age=3600'
+# Encodings in order of preference, with their file suffix
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+COMPRESSIBLE = {'.js', '.mjs', '.css', '.html', '.svg', '.json', '.txt', '.xml', '.map', '.wasm', '.ico'}
+MIN_COMPRESS_SIZE = 1024
+
+
+def accepted_encodings(header):
+    """Content codings the client accepts (q > 0) from an Accept-Encoding header"""
+    accepted = set()
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        q = params.strip()
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class FrontendRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.serve(send_body=True)
+
+    def do_HEAD(self):
+        self.serve(send_body=False)
+
+    def do_OPTIONS(self):
+        self.send_response(HTTPStatus.NO_CONTENT)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
     def end_headers(self):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
         super().end_headers()
 
+    def resolve(self):
+        """(relative path, file) for the request; unknown routes get index.html for the SPA"""
+        relative = unquote(urlsplit(self.path).path).lstrip('/')
+        target = (dist_path / relative).resolve()
+        if dist_path not in target.parents and target != dist_path:
+            return None, None
+        if target.is_dir():
+            target = target / 'index.html'
+        if target.is_file():
+            return target.relative_to(dist_path).as_posix(), target
+        if relative.startswith('assets/') or Path(relative).suffix:
+            return None, None  # A missing file, not a client-side route
+        return 'index.html', dist_path / 'index.html'
+
+    def serve(self, send_body):
+        relative, target = self.resolve()
+        if target is None or not target.is_file():
+            self.send_error(HTTPStatus.NOT_FOUND, 'File not found')
+            return
+
+        # Use a precompressed variant when the client accepts it
+        accepted = accepted_encodings(self.headers.get('Accept-Encoding'))
+        encoding, body_path = None, target
+        for coding, suffix in ENCODINGS:
+            candidate = target.with_name(target.name + suffix)
+            # A variant older than its source is left over from a previous build
+            if coding in accepted and candidate.is_file() and candidate.stat().st_mtime >= target.stat().st_mtime:
+                encoding, body_path = coding, candidate
+                break
+
+        try:
+            f = open(body_path, 'rb')
+        except OSError:
+            self.send_error(HTTPStatus.NOT_FOUND, 'File not found')
+            return
+        with f:
+            stat = os.fstat(f.fileno())
+            is_index = relative == 'index.html'
+            etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{"-" + encoding if encoding else ""}"'
+
+            if is_index and etag in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+                self.send_response(HTTPStatus.NOT_MODIFIED)
+                self.send_header('ETag', etag)
+                self.send_header('Cache-Control', 'no-cache')
+                self.send_header('Vary', 'Accept-Encoding')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            self.send_response(HTTPStatus.OK)
+            self.send_header('Content-Type', mimetypes.guess_type(target.name)[0] or 'application/octet-stream')
+            self.send_header('Content-Length', str(stat.st_size))
+            if encoding:
+                self.send_header('Content-Encoding', encoding)
+            if target.suffix in COMPRESSIBLE:
+                self.send_header('Vary', 'Accept-Encoding')
+            if is_index:
+                self.send_header('Cache-Control', 'no-cache')
+                self.send_header('ETag', etag)
+            else:
+                self.send_header('Cache-Control', IMMUTABLE if HASHED_ASSET.match(relative) else SHORT_LIVED)
+                self.send_header('Last-Modified', email.utils.formatdate(stat.st_mtime, usegmt=True))
+            self.end_headers()
+
+            if send_body:
+                self.wfile.flush()
+                # Zero-copy from the page cache where the OS supports it
+                self.connection.sendfile(f, 0, stat.st_size)
+
+
+def precompress(root):
+    """Write .gz (and .br, with brotli installed) files next to compressible assets"""
+    written = 0
+    for path in root.rglob('*'):
+        if not path.is_file() or path.suffix not in COMPRESSIBLE or path.stat().st_size < MIN_COMPRESS_SIZE:
+            continue
+        for coding, suffix in ENCODINGS:
+            if coding == 'br' and brotli is None:
+                continue
+            out = path.with_name(path.name + suffix)
+            if out.exists() and out.stat().st_mtime >= path.stat().st_mtime:
+                continue
+            tmp = out.with_name(out.name + '.tmp')
+            if coding == 'br':
+                tmp.write_bytes(brotli.compress(path.read_bytes()))
+            else:
+                with open(path, 'rb') as src, gzip.GzipFile(tmp, 'wb', compresslevel=9, mtime=0) as dst:
+                    shutil.copyfileobj(src, dst)
+            os.replace(tmp, out)
+            written += 1
+    return written
+
+
 if __name__ == "__main__":
+    if '--precompress' in sys.argv:
+        print(f"Precompressed {precompress(dist_path)} files in {dist_path}")
+
     print(f"Serving frontend at http://{HOST}:{PORT}")
-    print(f"Frontend files from: {dist_path.absolute()}")
+    print(f"Frontend files from: {dist_path}")
     print("Press Ctrl+C to stop")
-    
-    with socketserver.TCPServer((HOST, PORT), MyHTTPRequestHandler) as httpd:
+
+    with ThreadingHTTPServer((HOST, PORT), FrontendRequestHandler) as httpd:
         print(f"Serving at http://192.168.1.18:{PORT}")
         httpd.serve_forever()
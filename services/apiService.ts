@@ -1,6 +1,6 @@
 // services/apiService.ts
 
-import { User } from '../types';
+import { User, ScanHistoryItem } from '../types';
 
 /**
  * ===================================================================================
@@ -111,14 +111,128 @@ export const getScansAPI = async (): Promise<{ success: boolean, scans: any[] }>
     }
 };
 
-export const createScanAPI = async (scanData: any): Promise<{ success: boolean, scan: any }> => {
+// Incremental sync: pass the last version received as `since`, and page while has_more,
+// passing `resume` back whenever one is returned.
+// When reset is true, replace the local history with the scans returned on this and later pages.
+export interface ScanChanges {
+    success: boolean;
+    scans: any[];
+    deleted: string[];
+    version: number;
+    has_more: boolean;
+    reset: boolean;
+    resume?: string | null;
+}
+
+export const getScanChangesAPI = async (since: number, limit: number = 500, resume?: string | null): Promise<ScanChanges> => {
     try {
         const token = localStorage.getItem('authToken');
-        const response = await fetchAPI<{ success: boolean, scan: any }>('/api/scans', {
+        const query = `since=${since}&limit=${limit}${resume ? `&resume=${encodeURIComponent(resume)}` : ''}`;
+        const response = await fetchAPI<ScanChanges>(`/api/scans/changes?${query}`, {
+            headers: {
+                'Authorization': `Bearer ${token}`
+            }
+        });
+        return response;
+    } catch (error) {
+        console.error('Failed to get scan changes:', error);
+        return { success: false, scans: [], deleted: [], version: since, has_more: false, reset: false };
+    }
+};
+
+// Pre-aggregated history statistics; from/to are ISO dates (default: the last 30 days)
+export interface ScanStatsBucket {
+    scans: number;
+    critical: number;
+    by_diagnosis: { [diagnosis: string]: number };
+}
+
+export interface ScanStats {
+    success: boolean;
+    from?: string;
+    to?: string;
+    granularity?: 'day' | 'week' | 'month' | 'total';
+    totals?: ScanStatsBucket;
+    series?: (ScanStatsBucket & { period: string })[];
+    message?: string;
+}
+
+export const getScanStatsAPI = async (params: { from?: string, to?: string, granularity?: 'day' | 'week' | 'month' | 'total' } = {}): Promise<ScanStats> => {
+    try {
+        const token = localStorage.getItem('authToken');
+        const query = new URLSearchParams(Object.entries(params).filter(([, value]) => value) as [string, string][]);
+        const response = await fetchAPI<ScanStats>(`/api/scans/stats?${query.toString()}`, {
+            headers: {
+                'Authorization': `Bearer ${token}`
+            }
+        });
+        return response;
+    } catch (error) {
+        console.error('Failed to get scan stats:', error);
+        return { success: false, message: 'Failed to get scan stats' };
+    }
+};
+
+// Server-rendered reports (cached on the server until the scan changes). Returns null on failure,
+// e.g. PDF when the server has no PDF renderer.
+const fetchReport = async (endpoint: string): Promise<Blob | null> => {
+    try {
+        const token = localStorage.getItem('authToken');
+        const response = await fetch(`${API_BASE_URL}${endpoint}`, {
+            headers: {
+                'Authorization': `Bearer ${token}`
+            }
+        });
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        return await response.blob();
+    } catch (error) {
+        console.error(`Report download from ${endpoint} failed:`, error);
+        return null;
+    }
+};
+
+export const getScanReportAPI = (scanId: string, format: 'html' | 'pdf' = 'html'): Promise<Blob | null> =>
+    fetchReport(`/api/scans/${encodeURIComponent(scanId)}/report?format=${format}`);
+
+export const getHistoryReportAPI = (format: 'html' | 'pdf' = 'html', scanIds: string[] = []): Promise<Blob | null> =>
+    fetchReport(`/api/scans/report?format=${format}&ids=${scanIds.map(encodeURIComponent).join(',')}`);
+
+// The whole history as a ZIP (per scan: JSON, image and HTML report), streamed by the server
+export const getScanArchiveAPI = (): Promise<Blob | null> => fetchReport('/api/scans/archive');
+
+// Upload local (offline) history in batches. Each scanId maps to [status, server id, version];
+// status is one of created, updated, duplicate, conflict, deleted or invalid.
+export type ScanSyncAck = [string, string | null, number | null];
+
+export const syncUploadScansAPI = async (scans: (ScanHistoryItem & { version?: number })[]): Promise<{ success: boolean, acks: { [scanId: string]: ScanSyncAck }, message?: string }> => {
+    try {
+        const token = localStorage.getItem('authToken');
+        const response = await fetchAPI<{ success: boolean, acks: { [scanId: string]: ScanSyncAck } }>('/api/scans/sync', {
             method: 'POST',
             headers: {
                 'Authorization': `Bearer ${token}`
             },
+            body: JSON.stringify({ scans })
+        });
+        return response;
+    } catch (error) {
+        console.error('Failed to upload scans:', error);
+        return { success: false, acks: {}, message: 'Failed to upload scans' };
+    }
+};
+
+// Pass the same idempotencyKey when retrying a request, so the server creates the scan only once
+export const createScanAPI = async (scanData: any, idempotencyKey?: string): Promise<{ success: boolean, scan: any }> => {
+    try {
+        const token = localStorage.getItem('authToken');
+        const response = await fetchAPI<{ success: boolean, scan: any }>('/api/scans', {
+            method: 'POST',
+            headers: {
+                'Authorization': `Bearer ${token}`,
+                ...(idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : {})
+            },
             body: JSON.stringify(scanData)
         });
         return response;
@@ -177,10 +291,27 @@ export const deleteUserAPI = async (userId: string): Promise<{ success: boolean,
 };
 
 // Admin bulk operations
-export const clearAllHistoryAPI = async (): Promise<{ success: boolean, message: string }> => {
+// Purges run in the background on the server; poll getPurgeJobAPI(job.id) for progress
+export interface PurgeJob {
+    id: string;
+    kind: string;
+    target_id: string | null;
+    status: 'pending' | 'running' | 'completed' | 'failed';
+    phase: string | null;
+    deleted_count: number;
+    total_count: number | null;
+    dependent_count: number;
+    progress: number | null;
+    error: string | null;
+    created_at: string | null;
+    updated_at: string | null;
+    finished_at: string | null;
+}
+
+export const clearAllHistoryAPI = async (): Promise<{ success: boolean, message: string, job?: PurgeJob }> => {
     try {
         const token = localStorage.getItem('authToken');
-        const response = await fetchAPI<{ success: boolean, message: string }>('/api/admin/clear-all-history', {
+        const response = await fetchAPI<{ success: boolean, message: string, job?: PurgeJob }>('/api/admin/clear-all-history', {
             method: 'DELETE',
             headers: {
                 'Authorization': `Bearer ${token}`
@@ -193,10 +324,10 @@ export const clearAllHistoryAPI = async (): Promise<{ success: boolean, message:
     }
 };
 
-export const clearUserHistoryAPI = async (userId: string): Promise<{ success: boolean, message: string }> => {
+export const clearUserHistoryAPI = async (userId: string): Promise<{ success: boolean, message: string, job?: PurgeJob }> => {
     try {
         const token = localStorage.getItem('authToken');
-        const response = await fetchAPI<{ success: boolean, message: string }>(`/api/admin/users/${userId}/history`, {
+        const response = await fetchAPI<{ success: boolean, message: string, job?: PurgeJob }>(`/api/admin/users/${userId}/history`, {
             method: 'DELETE',
             headers: {
                 'Authorization': `Bearer ${token}`
@@ -209,6 +340,21 @@ export const clearUserHistoryAPI = async (userId: string): Promise<{ success: bo
     }
 };
 
+export const getPurgeJobAPI = async (jobId: string): Promise<{ success: boolean, job?: PurgeJob, message?: string }> => {
+    try {
+        const token = localStorage.getItem('authToken');
+        const response = await fetchAPI<{ success: boolean, job: PurgeJob }>(`/api/admin/jobs/${jobId}`, {
+            headers: {
+                'Authorization': `Bearer ${token}`
+            }
+        });
+        return response;
+    } catch (error) {
+        console.error('Failed to get purge job:', error);
+        return { success: false, message: 'Failed to get purge job' };
+    }
+};
+
 // AI Model Learning Endpoints
 export const submitAIFeedbackAPI = async (scanId: string, feedback: {
     corrected_prediction: string;
@@ -216,13 +362,14 @@ export const submitAIFeedbackAPI = async (scanId: string, feedback: {
     feedback_type?: string;
     new_confidence?: number;
     analysis_details?: any;
-}): Promise<{ success: boolean, message: string, data?: any }> => {
+}, idempotencyKey?: string): Promise<{ success: boolean, message: string, data?: any }> => {
     try {
         const token = localStorage.getItem('authToken');
         const response = await fetchAPI<{ success: boolean, message: string, data?: any }>(`/api/scans/${scanId}/feedback`, {
             method: 'POST',
             headers: {
-                'Authorization': `Bearer ${token}`
+                'Authorization': `Bearer ${token}`,
+                ...(idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : {})
             },
             body: JSON.stringify(feedback)
         });
@@ -263,6 +410,40 @@ export const getAIModelStatsAPI = async (): Promise<{ success: boolean, data?: a
     }
 };
 
+// Platform trends for the admin dashboard: every series has `points` values aligned with timestamps
+export type AnalyticsMetric = 'scans' | 'critical_scans' | 'feedback' | 'corrections' | 'logins'
+    | 'critical_rate' | 'correction_rate' | 'active_users';
+
+export interface AnalyticsSeries {
+    success: boolean;
+    from?: string;
+    to?: string;
+    step_seconds?: number;
+    resolutions?: { [metric: string]: 'minute' | 'hour' | 'day' };
+    timestamps?: string[];
+    series?: { [metric: string]: (number | null)[] };
+    message?: string;
+}
+
+export const getAdminAnalyticsAPI = async (metrics: AnalyticsMetric[], params: { from?: string, to?: string, points?: number } = {}): Promise<AnalyticsSeries> => {
+    try {
+        const token = localStorage.getItem('authToken');
+        const query = new URLSearchParams({ metrics: metrics.join(',') });
+        if (params.from) query.set('from', params.from);
+        if (params.to) query.set('to', params.to);
+        if (params.points) query.set('points', String(params.points));
+        const response = await fetchAPI<AnalyticsSeries>(`/api/admin/analytics?${query.toString()}`, {
+            headers: {
+                'Authorization': `Bearer ${token}`
+            }
+        });
+        return response;
+    } catch (error) {
+        console.error('Failed to get analytics:', error);
+        return { success: false, message: 'Failed to get analytics' };
+    }
+};
+
 // Logout function
 export const logoutAPI = (): void => {
     localStorage.removeItem('authToken');